@@ -0,0 +1,54 @@
+""" Microbenchmark for per-flight timestamp parsing and FlightSearch dates
+
+Usage: python benchmarks/bench_dates.py [number]
+"""
+
+import timeit
+import sys
+import os
+
+# Import the checkout this script is in, installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flight_tracker.flight_records import FlightSearch
+from flight_tracker.flight_table import to_timestamp
+from flight_tracker.web_scraper import convert_to_datetime, parse_timestamp
+
+
+TIMESTAMP = '2018-07-12T06:05:00.000-05:00'
+
+
+def legacy_flight_dates(text=TIMESTAMP):
+    """ What parse_flight_data used to do per timestamp: strptime and two strftimes """
+    return convert_to_datetime(text.split('.')[0], return_date=True, return_time=True)
+
+
+def fast_flight_dates(text=TIMESTAMP):
+    """ Fixed layout parse into the epoch seconds stored by FlightTable """
+    return to_timestamp(parse_timestamp(text))
+
+
+def legacy_search_dates(flight_search):
+    """ What every flight_search_dict used to cost in date conversions """
+    return (FlightSearch.convert_to_datetime(flight_search.depart_date, True),
+            FlightSearch.convert_to_datetime(flight_search.return_date, True))
+
+
+def run(number=100000):
+    flight_search = FlightSearch('PHL', 'BNA', '7/12/18', return_date='7/20/18')
+    cases = [
+        ('flight timestamp (legacy strptime/strftime)', lambda: legacy_flight_dates()),
+        ('flight timestamp (parse_timestamp)', lambda: fast_flight_dates()),
+        ('search dates (legacy, per request)', lambda: legacy_search_dates(flight_search)),
+        ('search dates (parsed once)', lambda: (flight_search.depart_date_str, flight_search.return_date_str)),
+    ]
+    results = []
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results.append((name, seconds / number * 1e6))
+        print('{:48s}{:8.3f} us/call'.format(name, seconds / number * 1e6))
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,78 @@
+""" Replays a --record capture through the parse/evaluate pipeline
+
+Usage: python benchmarks/bench_replay.py capture.jsonl [--generate N] [--flights 20]
+
+--generate first records N synthetic searches from the local stand-in into
+capture.jsonl. Every captured flight search is then served by CaptureReplay
+and run through find_cheapest_flights with no network access
+"""
+
+import argparse
+import time
+import json
+import sys
+import os
+
+# Import the checkout this script is in, installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flight_tracker.capture import CaptureRecorder, CaptureReplay
+from flight_tracker.flight_records import FlightSearch
+from flight_tracker.web_scraper import SWApi, fetch_flight_data, find_cheapest_flights
+
+from run_benchmarks import create_searches
+from stand_in import StandInServer
+
+
+def search_from_request(request_text):
+    """ FlightSearch that sends the captured flight_search_dict """
+    request = json.loads(request_text)
+    return FlightSearch(request['originationAirportCode'], request['destinationAirportCode'],
+                        request['departureDate'], depart_time=request['departureTimeOfDay'],
+                        return_date=request['returnDate'] or None,
+                        return_time=request['returnTimeOfDay'] or None,
+                        passengers=request['adultPassengersCount'],
+                        senior_passengers=request['seniorPassengersCount'],
+                        faretype=request['fareType'], passenger_type=request['passengerType'],
+                        promo_code=request['promoCode'] or None)
+
+
+def generate(path, num_searches, flights):
+    """ Records num_searches stand-in responses to path """
+    recorder = CaptureRecorder(path)
+    with StandInServer(flights=flights) as server:
+        sw_api = SWApi(base_url=server.base_url, recorder=recorder)
+        for flight_search in create_searches(num_searches):
+            fetch_flight_data(flight_search, sw_api)
+    recorder.close()
+    print('Recorded {} responses to {}'.format(recorder.num_recorded, path))
+
+
+def run(path):
+    start = time.perf_counter()
+    replay = CaptureReplay(path)
+    index_seconds = time.perf_counter() - start
+    searches = [search_from_request(x['request']) for x in replay if x['endpoint'] == 'flights']
+    sw_api = SWApi(replay=replay)
+    start = time.perf_counter()
+    found = sum(1 for x in searches if find_cheapest_flights(x, sw_api))
+    seconds = time.perf_counter() - start
+    print('Indexed {} captures in {:.3f}s'.format(len(replay), index_seconds))
+    outstr = 'Replayed {} searches in {:.3f}s ({:.1f} searches/s, {} with results)'
+    print(outstr.format(len(searches), seconds, len(searches) / seconds if seconds else 0.0, found))
+    replay.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a capture through the parse/evaluate pipeline')
+    parser.add_argument('capture', help='JSONL file written by --record')
+    parser.add_argument('--generate', type=int, default=0, help='Record this many stand-in searches first')
+    parser.add_argument('--flights', type=int, default=20, help='Flights per leg when generating [%(default)s]')
+    args = parser.parse_args()
+    if args.generate:
+        generate(args.capture, args.generate, args.flights)
+    run(args.capture)
+
+
+if __name__ == '__main__':
+    main()
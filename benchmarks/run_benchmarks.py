@@ -0,0 +1,235 @@
+""" Offline benchmark suite run against a local stand-in for the SW API
+
+Usage: python benchmarks/run_benchmarks.py [--quick] [--flights 20] [--latency 0.01]
+                                           [--error_rate 0] [--throttle_rate 0] [--max_rate 0]
+                                           [--retries 0]
+                                           [--save baseline.json] [--compare baseline.json]
+
+Each case reports throughput, per-call latency percentiles and the peak memory
+traced while running it. --save writes the results as a baseline and --compare
+exits non-zero if any case is slower or uses more memory than the baseline by
+more than --tolerance
+"""
+
+from argparse import Namespace
+import statistics
+import random
+import tracemalloc
+import argparse
+import logging
+import json
+import time
+import sys
+import os
+
+# Import the checkout this script is in, installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flight_tracker.alert_state import AlertState
+from flight_tracker.analytics import HAS_NUMPY, FareSeries, compute_stats, find_drops
+from flight_tracker.flight_records import FlightSearch
+from flight_tracker.flight_tracker import check_all_flights
+from flight_tracker.resilience import RetryPolicy
+from flight_tracker.route_graph import refresh_route_graph
+from flight_tracker.web_scraper import (SWApi, create_session, find_all_destinations, find_cheapest_flights,
+                                        get_minimum_fare, iter_flight_details, parse_flight_data)
+
+from stand_in import StandInServer, airport_codes, create_shopping_payload
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest rank percentile of an already sorted list """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Result(object):
+    """ Measurements of one benchmark case """
+    def __init__(self, name, items, latencies, peak_bytes):
+        self.name = name
+        self.items = items
+        latencies = sorted(latencies)
+        total = sum(latencies)
+        self.throughput = items / total if total else 0.0
+        self.p50 = percentile(latencies, 0.5)
+        self.p90 = percentile(latencies, 0.9)
+        self.p99 = percentile(latencies, 0.99)
+        self.mean = statistics.mean(latencies) if latencies else 0.0
+        self.peak_kb = peak_bytes / 1024.0
+
+    def to_dict(self):
+        return {'throughput': self.throughput, 'p50': self.p50, 'p90': self.p90,
+                'p99': self.p99, 'peak_kb': self.peak_kb}
+
+    def __str__(self):
+        outstr = '{:36s}{:12.1f}/s  p50 {:9.3f}ms  p90 {:9.3f}ms  p99 {:9.3f}ms  peak {:9.1f}KB'
+        return outstr.format(self.name, self.throughput, self.p50 * 1e3, self.p90 * 1e3,
+                             self.p99 * 1e3, self.peak_kb)
+
+
+def measure(name, func, calls, items_per_call=1, setup=None):
+    """
+    Times calls runs of func() then makes one more run under tracemalloc for
+    peak memory (tracing is slow, so it is kept out of the timings). setup()
+    is called untimed before every run
+    """
+    latencies = []
+    for _ in range(calls):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return Result(name, calls * items_per_call, latencies, peak_bytes)
+
+
+def create_searches(num_searches, origin='AAA', roundtrip=True):
+    """ num_searches watchlist rows spread over destinations and dates """
+    codes = airport_codes(max(2, num_searches + 1))
+    searches = []
+    for idx in range(num_searches):
+        depart_day = 1 + idx % 28
+        searches.append(FlightSearch(origin, codes[1 + idx], '2030-07-{:02d}'.format(depart_day),
+                                     return_date='2030-08-{:02d}'.format(depart_day) if roundtrip else None,
+                                     faretype='USD', price_point=100))
+    return searches
+
+
+def create_fare_series(num_series, observations=40, seed=1):
+    """ FareSeries of num_series flights observed up to `observations` times over the last 60 days """
+    rng = random.Random(seed)
+    now = time.time()
+    rows = []
+    for index in range(num_series):
+        count = rng.randint(1, observations)
+        rows.extend((index, now - (count - x) * 1.5 * 86400, rng.randint(10000, 20000)) for x in range(count))
+    return FareSeries.from_rows(list(range(num_series)), rows)
+
+
+def run(config):
+    """ Runs every case against a fresh stand-in; returns list of Results """
+    logging.disable(logging.CRITICAL)
+    results = []
+    flight_search = FlightSearch('AAA', 'AAB', '2030-07-12', return_date='2030-07-20', faretype='USD')
+    payload = create_shopping_payload(flight_search.flight_search_dict, config.flights)
+    fares = [x['fareProducts']['ADULT'] for x in iter_flight_details(payload)]
+
+    # Pure CPU: no server involved
+    results.append(measure('get_minimum_fare', lambda: [get_minimum_fare(x) for x in fares],
+                           config.calls, len(fares)))
+    results.append(measure('parse_flight_data', lambda: parse_flight_data(payload, flight_search),
+                           config.calls, len(fares)))
+    if HAS_NUMPY:
+        series = create_fare_series(config.series)
+        results.append(measure('fare_stats x{}'.format(config.series),
+                               lambda: find_drops(compute_stats(series), z_threshold=2.0),
+                               config.batches, config.series))
+
+    with StandInServer(flights=config.flights, latency=config.latency, error_rate=config.error_rate,
+                       throttle_rate=config.throttle_rate, airports=config.destinations + 1,
+                       max_rate=config.max_rate) as server:
+        retry_policy = RetryPolicy(config.retries, backoff=0.05) if config.retries else None
+        sw_api = SWApi(session=create_session(pool_size=max(10, config.workers)), base_url=server.base_url,
+                       retry_policy=retry_policy)
+
+        results.append(measure('find_cheapest_flights', lambda: find_cheapest_flights(flight_search, sw_api),
+                               config.calls))
+
+        searches = create_searches(config.searches)
+        args = Namespace(workers=config.workers, twilio='None')
+        state = {}
+
+        def reset_alert_state():
+            state['alert_state'] = AlertState()
+
+        results.append(measure('check_all_flights x{}'.format(config.searches),
+                               lambda: check_all_flights(args, searches, state['alert_state'], sw_api),
+                               config.batches, config.searches, setup=reset_alert_state))
+
+        refresh_route_graph(sw_api)
+        finder_searches = [FlightSearch('AAA', None, '2030-07-12', faretype='USD')]
+        results.append(measure('find_all_destinations x{}'.format(config.destinations),
+                               lambda: find_all_destinations(finder_searches, config.workers, sw_api),
+                               config.batches, config.destinations))
+        logging.disable(logging.NOTSET)
+        print('Stand-in served {requests} requests ({errors} errors, {throttled} throttled)'.format(
+            **server.counts))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Returns a list of regression descriptions versus a saved baseline """
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if not base:
+            continue
+        if result.throughput < base['throughput'] * (1 - tolerance):
+            regressions.append('{}: throughput {:.1f}/s vs baseline {:.1f}/s'.format(
+                result.name, result.throughput, base['throughput']))
+        if result.p90 > base['p90'] * (1 + tolerance):
+            regressions.append('{}: p90 {:.3f}ms vs baseline {:.3f}ms'.format(
+                result.name, result.p90 * 1e3, base['p90'] * 1e3))
+        if result.peak_kb > base['peak_kb'] * (1 + tolerance):
+            regressions.append('{}: peak {:.1f}KB vs baseline {:.1f}KB'.format(
+                result.name, result.peak_kb, base['peak_kb']))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Offline Flight Tracker benchmarks')
+    parser.add_argument('--quick', action='store_true', help='Fewer calls and smaller batches')
+    parser.add_argument('--calls', type=int, default=200, help='Calls per single-request case [%(default)s]')
+    parser.add_argument('--batches', type=int, default=5, help='Runs of each batch case [%(default)s]')
+    parser.add_argument('--searches', type=int, default=50, help='Searches per check_all_flights [%(default)s]')
+    parser.add_argument('--destinations', type=int, default=50,
+                        help='Destinations per find_all_destinations [%(default)s]')
+    parser.add_argument('--series', type=int, default=5000,
+                        help='Fare series per fare_stats run (needs numpy) [%(default)s]')
+    parser.add_argument('--flights', type=int, default=20, help='Flights per leg in responses [%(default)s]')
+    parser.add_argument('--latency', type=float, default=0.01, help='Stand-in seconds per response [%(default)s]')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of 500 responses [%(default)s]')
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help='Fraction of 429 responses [%(default)s]')
+    parser.add_argument('--max_rate', type=float, default=0.0,
+                        help='Stand-in requests per second before 429 responses [%(default)s]')
+    parser.add_argument('--retries', type=int, default=0, help='Retries of failed requests [%(default)s]')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent requests [%(default)s]')
+    parser.add_argument('--save', metavar='FILE', help='Save results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='Compare results with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed fractional regression versus baseline [%(default)s]')
+    config = parser.parse_args()
+    if config.quick:
+        config.calls, config.batches = 20, 2
+        config.searches, config.destinations = 10, 10
+    return config
+
+
+def main():
+    config = parse_args()
+    results = run(config)
+    for result in results:
+        print(result)
+    if config.save:
+        with open(config.save, 'w') as baseline_file:
+            json.dump({x.name: x.to_dict() for x in results}, baseline_file, indent=2, sort_keys=True)
+        print('Saved baseline to {}'.format(config.save))
+    if config.compare:
+        with open(config.compare, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), config.tolerance)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        if regressions:
+            sys.exit(1)
+        print('No regressions versus {}'.format(config.compare))
+
+
+if __name__ == '__main__':
+    main()
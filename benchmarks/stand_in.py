@@ -0,0 +1,222 @@
+""" Local HTTP stand-in for the SW shopping and route map endpoints
+
+Serves synthetic (or recorded) payloads so benchmarks never touch southwest.com.
+Also accepts Twilio style .../Messages.json posts (set "base_url" in
+twilio.json to this server) and keeps them in StandInServer.messages
+
+Usage: python benchmarks/stand_in.py [--port 8080] [--flights 20] [--latency 0.05]
+                                     [--error_rate 0] [--throttle_rate 0] [--max_rate 0]
+                                     [--airports 100]
+                                     [--payload recorded_response.json]
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from collections import deque
+from urllib.parse import parse_qs
+import argparse
+import threading
+import random
+import json
+import time
+
+
+FARE_CLASSES = ['WGA', 'ANY', 'BUS']
+
+
+def airport_codes(num_airports):
+    """ Synthetic three letter codes: AAA, AAB, ... """
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return [letters[x // 676 % 26] + letters[x // 26 % 26] + letters[x % 26] for x in range(num_airports)]
+
+
+def create_route_info(num_airports=100, routes_per_airport=None):
+    """ Route map in the airport_routes.json layout; every airport serves routes_per_airport others """
+    codes = airport_codes(num_airports)
+    routes_per_airport = min(routes_per_airport or num_airports - 1, num_airports - 1)
+    route_info = {}
+    for idx, code in enumerate(codes):
+        routes = [codes[(idx + x) % num_airports] for x in range(1, routes_per_airport + 1)]
+        route_info[code] = {'display_name': 'City {}'.format(code), 'federal_unit': 'ST',
+                            'routes_served': routes}
+    return route_info
+
+
+def create_leg(origin, destination, date, num_flights, rng):
+    """ One airProducts entry with num_flights flights (every third one connecting) """
+    details = []
+    for idx in range(num_flights):
+        flight_numbers = [str(100 + idx)] if idx % 3 else [str(100 + idx), str(1000 + idx)]
+        minutes = 5 * 60 + idx * 17 * 60 // max(1, num_flights)
+        depart = '{}T{:02d}:{:02d}:00.000-05:00'.format(date, minutes // 60, minutes % 60)
+        arrive = '{}T{:02d}:{:02d}:00.000-05:00'.format(date, minutes // 60 + 2, minutes % 60)
+        base = rng.randint(40, 400)
+        fares = {}
+        for fare_idx, fare_class in enumerate(FARE_CLASSES):
+            if rng.random() < 0.2:
+                fares[fare_class] = {'fare': None}
+            else:
+                fares[fare_class] = {'fare': {'totalFare': {'value': '{:.2f}'.format(base * (1 + fare_idx)),
+                                                            'currencyCode': 'USD'}}}
+        details.append({'originationAirportCode': origin,
+                        'destinationAirportCode': destination,
+                        'flightNumbers': flight_numbers,
+                        'departureDateTime': depart,
+                        'arrivalDateTime': arrive,
+                        'fareProducts': {'ADULT': fares}})
+    return {'details': details}
+
+
+def create_shopping_payload(search_data, num_flights=20, seed=None):
+    """ Shopping response for a flight_search_dict (deterministic for equal requests) """
+    rng = random.Random(seed if seed is not None else json.dumps(search_data, sort_keys=True))
+    origin = search_data['originationAirportCode']
+    destination = search_data['destinationAirportCode']
+    products = [create_leg(origin, destination, search_data['departureDate'], num_flights, rng)]
+    if search_data.get('returnDate'):
+        products.append(create_leg(destination, origin, search_data['returnDate'], num_flights, rng))
+    return {'data': {'searchResults': {'airProducts': products}}}
+
+
+class StandInServer(object):
+    """
+    Threaded local HTTP server answering shopping POSTs and route map GETs.
+    flights: flights per leg in synthetic shopping responses
+    latency: seconds to wait before every response
+    error_rate/throttle_rate: fraction of requests answered with 500/429
+    max_rate: requests per second above which requests are answered with 429
+    airports: airports in the synthetic route map
+    payload: recorded shopping response (dict) served for every POST instead
+    """
+    def __init__(self, flights=20, latency=0.0, error_rate=0.0, throttle_rate=0.0,
+                 airports=100, payload=None, port=0, seed=0, max_rate=0):
+        self.flights = flights
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rate = max_rate
+        self.route_info = json.dumps(create_route_info(airports)).encode()
+        self.payload = json.dumps(payload).encode() if payload is not None else None
+        self.port = port
+        self.counts = {'requests': 0, 'errors': 0, 'throttled': 0}
+        self.messages = []
+        self._rng = random.Random(seed)
+        self._recent = deque()  # Times of requests answered in the last second
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}/'.format(self._server.server_address[1])
+
+    def _next_status(self):
+        with self._lock:
+            self.counts['requests'] += 1
+            roll = self._rng.random()
+            if roll < self.error_rate:
+                self.counts['errors'] += 1
+                return 500
+            if roll < self.error_rate + self.throttle_rate:
+                self.counts['throttled'] += 1
+                return 429
+            if self.max_rate:
+                now = time.monotonic()
+                while self._recent and self._recent[0] <= now - 1:
+                    self._recent.popleft()
+                if len(self._recent) >= self.max_rate:
+                    self.counts['throttled'] += 1
+                    return 429
+                self._recent.append(now)
+        return 200
+
+    def _create_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, status, body=b''):
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request_text = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status = stand_in._next_status()
+                if status != 200:
+                    return self._respond(status)
+                if self.path.endswith('/Messages.json'):
+                    message = {k: v[0] for k, v in parse_qs(request_text.decode()).items()}
+                    with stand_in._lock:
+                        stand_in.messages.append(message)
+                    return self._respond(201, json.dumps(dict(message, status='queued')).encode())
+                body = stand_in.payload
+                if body is None:
+                    body = json.dumps(create_shopping_payload(json.loads(request_text.decode()),
+                                                              stand_in.flights)).encode()
+                self._respond(200, body)
+
+            def do_GET(self):
+                status = stand_in._next_status()
+                self._respond(status, stand_in.route_info if status == 200 else b'')
+
+        return Handler
+
+    def start(self):
+        """ Serves in a daemon thread; returns base_url """
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self._server = Server(('127.0.0.1', self.port), self._create_handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the SW API')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--flights', type=int, default=20, help='Flights per leg [%(default)s]')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per response [%(default)s]')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of 500s [%(default)s]')
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help='Fraction of 429s [%(default)s]')
+    parser.add_argument('--max_rate', type=float, default=0.0, help='Requests per second before 429s [%(default)s]')
+    parser.add_argument('--airports', type=int, default=100, help='Airports in route map [%(default)s]')
+    parser.add_argument('--payload', help='Recorded shopping response to serve for every search')
+    args = parser.parse_args()
+    payload = None
+    if args.payload:
+        with open(args.payload, 'r') as payload_file:
+            payload = json.load(payload_file)
+    server = StandInServer(args.flights, args.latency, args.error_rate, args.throttle_rate,
+                           args.airports, payload, args.port, max_rate=args.max_rate)
+    print('Serving SW stand-in at {}'.format(server.start()))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
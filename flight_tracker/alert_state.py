@@ -0,0 +1,131 @@
+""" Snapshots of search results and notification dedup that survive restarts """
+
+from datetime import datetime, timedelta
+import threading
+import logging
+import sqlite3
+import json
+import time
+
+from .cache import make_key
+from .flight_table import to_timestamp
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    search_key TEXT PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notifications (
+    search_key TEXT NOT NULL,
+    price_difference TEXT NOT NULL,
+    notified_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (search_key, price_difference)
+);
+CREATE INDEX IF NOT EXISTS notifications_notified ON notifications (notified_at);
+"""
+
+
+def get_search_key(flight_search):
+    """ Identifies a watchlist row: its request plus every local filter """
+    local_filters = [flight_search.price_point, flight_search.nonstop, flight_search.flight_numbers,
+                     flight_search.depart_after, flight_search.depart_before, flight_search.max_price,
+                     flight_search.companion]
+    return make_key(flight_search.request_key + json.dumps(local_filters))
+
+
+def get_expiry(flight_search):
+    """ State for a search is useless once its last flight has departed """
+    last_date = flight_search.return_date_dt or flight_search.depart_date_dt
+    return to_timestamp(last_date + timedelta(days=2))
+
+
+def create_snapshot(trip_record):
+    """ Compact, comparable summary of a TripRecord (or None) """
+    if not trip_record:
+        return None
+    return [[flight.origin, flight.depart_date, flight.depart_time, flight.flight_numbers,
+             flight.price, flight.fare_class] for flight in trip_record]
+
+
+class AlertState(object):
+    """
+    Keeps the last result snapshot for every search so unchanged results
+    can be skipped, and the price differences users were already notified
+    about. Stored in SQLite (path, or in memory if None); entries expire
+    after the search's departure date and at most max_notifications
+    notifications are kept (oldest are dropped first)
+    """
+    def __init__(self, path=None, max_notifications=10000):
+        self.path = path or ':memory:'
+        self.max_notifications = max_notifications
+        self._lock = threading.Lock()
+        self._last_maintained = None
+        # Worker processes may share path, so wait for each other's writes
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        if self.path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self.maintain()
+
+    def snapshot_changed(self, flight_search, trip_record):
+        """ True if trip_record differs from the snapshot last saved for flight_search """
+        snapshot = json.dumps(create_snapshot(trip_record))
+        with self._lock:
+            row = self._conn.execute('SELECT snapshot FROM snapshots WHERE search_key = ?',
+                                     (get_search_key(flight_search),)).fetchone()
+        return not (row and row[0] == snapshot)
+
+    def save_snapshot(self, flight_search, trip_record):
+        """ Saves the snapshot of trip_record; call once its alerts have been sent """
+        snapshot = json.dumps(create_snapshot(trip_record))
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)',
+                               (get_search_key(flight_search), snapshot, get_expiry(flight_search)))
+
+    def was_notified(self, flight_search, price_difference):
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM notifications WHERE search_key = ? '
+                                     'AND price_difference = ?',
+                                     (get_search_key(flight_search), price_difference)).fetchone()
+        return row is not None
+
+    def mark_notified(self, flight_search, price_difference):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO notifications VALUES (?, ?, ?, ?)',
+                               (get_search_key(flight_search), price_difference, time.time(),
+                                get_expiry(flight_search)))
+            self._conn.execute('DELETE FROM notifications WHERE rowid NOT IN (SELECT rowid '
+                               'FROM notifications ORDER BY notified_at DESC LIMIT ?)',
+                               (self.max_notifications,))
+
+    def prune(self):
+        """ Deletes snapshots and notifications for flights that have departed """
+        now = to_timestamp(datetime.now())
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM snapshots WHERE expires_at < ?', (now,))
+            self._conn.execute('DELETE FROM notifications WHERE expires_at < ?', (now,))
+
+    def maintain(self, interval=3600):
+        """
+        Runs prune() if it has not run in the last interval seconds (safe to
+        call every cycle). Returns True if it ran
+        """
+        now = time.time()
+        if self._last_maintained is not None and now - self._last_maintained < interval:
+            return False
+        self._last_maintained = now
+        try:
+            self.prune()
+        except sqlite3.Error as err:  # e.g. another process sharing the file is writing; try again later
+            logger.warning('Unable to prune alert state: {}'.format(err))
+            return False
+        return True
+
+    def close(self):
+        self._conn.close()
+
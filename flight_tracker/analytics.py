@@ -0,0 +1,180 @@
+""" Vectorised fare statistics over FareHistory series (requires numpy)
+
+Series are loaded for many flights at once into NaN padded 2D arrays, one
+row per series with the newest observation in the last column, so every
+statistic is computed for the whole watchlist with a handful of array
+operations instead of a Python loop per observation
+"""
+
+from collections import namedtuple
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+HAS_NUMPY = np is not None
+
+FareStats = namedtuple('FareStats', ['keys', 'latest', 'observations', 'window_min', 'percentiles',
+                                     'ewma', 'std', 'zscore'])
+PriceDrop = namedtuple('PriceDrop', ['key', 'latest', 'window_min', 'typical', 'zscore', 'new_low',
+                                     'below_typical'])
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('Fare analytics require numpy (pip install numpy)')
+
+
+class FareSeries(object):
+    """
+    Price series for keys as (len(keys), width) float arrays of observation
+    times and prices, right aligned and padded with NaN on the left
+    """
+    def __init__(self, keys, times, prices):
+        self.keys = keys
+        self.times = times
+        self.prices = prices
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_rows(cls, keys, rows):
+        """ From (key index, observed_at, price) rows ordered by key index then observed_at """
+        require_numpy()
+        data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        ids = data[:, 0].astype(np.intp)
+        counts = np.bincount(ids, minlength=len(keys))
+        width = int(counts.max()) if len(data) else 0
+        starts = np.cumsum(counts) - counts
+        columns = width - counts[ids] + np.arange(len(ids)) - starts[ids]
+        times = np.full((len(keys), width), np.nan)
+        prices = np.full((len(keys), width), np.nan)
+        times[ids, columns] = data[:, 1]
+        prices[ids, columns] = data[:, 2]
+        return cls(keys, times, prices)
+
+    @classmethod
+    def load(cls, history, keys, since=None):
+        """ Series for flight keys (see FareHistory.batch_series) from history """
+        keys = list(keys)
+        return cls.from_rows(keys, history.batch_series(keys, since) if keys else [])
+
+
+def windowed_percentiles(values, count, percentiles):
+    """
+    Linearly interpolated percentiles of each row of values ignoring NaN,
+    where count is the number of non-NaN values per row. Sorting once beats
+    np.nanpercentile, which falls back to a Python loop per row
+    """
+    ordered = np.sort(values, axis=1)  # NaN sort last
+    positions = np.maximum(count[:, None] - 1, 0) * (np.asarray(percentiles, dtype=np.float64) / 100.0)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(count[:, None] - 1, 0))
+    if not ordered.shape[1]:
+        return np.full(positions.shape, np.nan)
+    low_values = np.take_along_axis(ordered, lower, axis=1)
+    high_values = np.take_along_axis(ordered, upper, axis=1)
+    result = low_values + (high_values - low_values) * (positions - lower)
+    result[count == 0] = np.nan
+    return result
+
+
+def compute_stats(series, window_days=30, alpha=0.3, percentiles=(10, 50), now=None, min_std=0.02):
+    """
+    FareStats comparing each series' latest price with its earlier
+    observations from the last window_days:
+        window_min      lowest earlier price
+        percentiles     (len(series), len(percentiles)) earlier price percentiles
+        ewma            exponentially weighted mean of earlier prices, the newest
+                        weighted most (alpha is the weight of the newest one)
+        std             standard deviation of earlier prices
+        zscore          (latest - ewma) / std, with std floored at min_std * ewma
+                        so a drop after a flat run of prices still scores
+    Statistics of series without earlier observations are NaN
+    """
+    require_numpy()
+    now = now or time.time()
+    latest = series.prices[:, -1] if series.prices.shape[1] else np.full(len(series), np.nan)
+    prior = series.prices[:, :-1]
+    in_window = series.times[:, :-1] >= now - window_days * 86400
+    count = in_window.sum(axis=1)
+    window_min = np.min(prior, axis=1, initial=np.inf, where=in_window)
+    window_min[count == 0] = np.nan
+    weights = (1 - alpha) ** np.arange(prior.shape[1])[::-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ewma = (np.sum(prior * weights, axis=1, where=in_window) /
+                np.sum(np.broadcast_to(weights, prior.shape), axis=1, where=in_window))
+        mean = np.sum(prior, axis=1, where=in_window) / count
+        deviation = prior - mean[:, None]  # Two passes: E[x^2] - E[x]^2 loses precision on flat prices
+        std = np.sqrt(np.sum(deviation * deviation, axis=1, where=in_window) / count)
+        scale = np.maximum(std, min_std * np.abs(ewma))
+        zscore = np.where(scale > 0, (latest - ewma) / scale, np.nan)
+    percentile_values = windowed_percentiles(np.where(in_window, prior, np.nan), count, percentiles)
+    return FareStats(series.keys, latest, count, window_min, percentile_values, ewma, std, zscore)
+
+
+def find_drops(stats, lowest=True, z_threshold=None, min_observations=5):
+    """
+    PriceDrops for series with at least min_observations earlier prices
+    whose latest price is below every earlier one (if lowest) or at least
+    z_threshold standard deviations below the EWMA
+    """
+    require_numpy()
+    enough = stats.observations >= min_observations
+    with np.errstate(invalid='ignore'):
+        new_low = enough & (stats.latest < stats.window_min) if lowest else np.zeros(len(enough), bool)
+        below_typical = (enough & (stats.zscore <= -z_threshold) if z_threshold
+                         else np.zeros(len(enough), bool))
+    return [PriceDrop(stats.keys[x], stats.latest[x], stats.window_min[x], stats.ewma[x], stats.zscore[x],
+                      bool(new_low[x]), bool(below_typical[x]))
+            for x in np.flatnonzero(new_low | below_typical)]
+
+
+def get_flight_key(flight):
+    """ FareHistory flight key of a FlightRecord/FlightRow """
+    return (flight.origin, flight.destination, flight.depart_date_dt.strftime('%Y-%m-%d'),
+            ','.join(map(str, flight.flight_numbers)))
+
+
+def format_price(price, faretype):
+    """ FareHistory price (cents or points) as a string """
+    if faretype == 'USD':
+        return '${:.2f}'.format(price / 100.0)
+    return '{} points'.format(int(price))
+
+
+def drop_alert_string(drop, faretype, window_days):
+    origin, destination, depart_date, flight_numbers = drop.key
+    reasons = []
+    if drop.new_low:
+        reasons.append('the lowest in {:g} days (previous low {})'.format(
+            window_days, format_price(drop.window_min, faretype)))
+    if drop.below_typical:
+        reasons.append('{:.1f} standard deviations below its typical {}'.format(
+            -drop.zscore, format_price(drop.typical, faretype)))
+    out_str = 'Alert: Flight {} from {} to {} on {} is {} per passenger, {}.'
+    return out_str.format(flight_numbers, origin, destination, depart_date,
+                          format_price(drop.latest, faretype), ' and '.join(reasons))
+
+
+def find_trip_drops(history, trip_records, window_days=30, lowest=True, z_threshold=None,
+                    min_observations=5, now=None):
+    """
+    Checks every flight of trip_records (already recorded in history)
+    against its own history in one batch. Returns [(trip index, PriceDrop,
+    alert string)] for flights whose price dropped
+    """
+    owners = {}  # flight key -> indices of trips with that flight
+    for index, trip_record in enumerate(trip_records):
+        for flight in trip_record:
+            owners.setdefault(get_flight_key(flight), []).append(index)
+    now = now or time.time()
+    series = FareSeries.load(history, owners, since=now - window_days * 86400)
+    stats = compute_stats(series, window_days, now=now)
+    return [(index, drop, drop_alert_string(drop, trip_records[index].faretype, window_days))
+            for drop in find_drops(stats, lowest, z_threshold, min_observations)
+            for index in owners[drop.key]]
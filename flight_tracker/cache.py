@@ -0,0 +1,146 @@
+""" TTL + LRU cache for SWApi responses with an optional SQLite disk tier """
+
+from collections import OrderedDict
+import threading
+import hashlib
+import logging
+import sqlite3
+import time
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached response stays fresh, per SWApi endpoint
+DEFAULT_TTLS = {'flights': 300, 'routes': 24 * 60 * 60}
+
+
+def make_key(text):
+    """ Hashes canonicalized request text into a compact cache key """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DiskCache(object):
+    """ SQLite-backed cache tier storing zlib compressed responses """
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'endpoint TEXT NOT NULL, key TEXT NOT NULL, '
+                               'expires_at REAL NOT NULL, value BLOB NOT NULL, '
+                               'PRIMARY KEY (endpoint, key))')
+        self.prune()
+
+    def get(self, endpoint, key):
+        """ Returns (expires_at, value) or None if missing/expired """
+        with self._lock:
+            row = self._conn.execute('SELECT expires_at, value FROM responses '
+                                     'WHERE endpoint = ? AND key = ? AND expires_at > ?',
+                                     (endpoint, key, self.clock())).fetchone()
+        if row:
+            return row[0], zlib.decompress(row[1]).decode('utf-8')
+
+    def set(self, endpoint, key, value, expires_at):
+        blob = sqlite3.Binary(zlib.compress(value.encode('utf-8')))
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                               (endpoint, key, expires_at, blob))
+
+    def prune(self):
+        """ Deletes expired responses """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses WHERE expires_at <= ?', (self.clock(),))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
+
+    def close(self):
+        self._conn.close()
+
+
+class ResponseCache(object):
+    """
+    Size-bounded LRU cache of raw response text keyed by (endpoint, key),
+    where each endpoint has its own TTL (ttls, seconds). If path is given,
+    responses are also written to a DiskCache so they survive restarts.
+    Hit/miss/eviction counters are kept in stats. clock returns the current
+    time in seconds (time.time unless testing)
+    """
+    def __init__(self, max_entries=1024, ttls=None, path=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.clock = clock
+        self.disk = DiskCache(path, clock) if path else None
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        self._entries = OrderedDict()  # (endpoint, key) -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        hits = self.stats['hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return float(hits) / total if total else 0.0
+
+    def get(self, endpoint, key):
+        """ Returns cached value or None """
+        entry_key = (endpoint, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry:
+                if entry[0] > self.clock():
+                    self._entries.move_to_end(entry_key)
+                    self.stats['hits'] += 1
+                    return entry[1]
+                del self._entries[entry_key]
+                self.stats['expirations'] += 1
+        if self.disk:
+            entry = self.disk.get(endpoint, key)
+            if entry:
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                    self._store(entry_key, entry)
+                return entry[1]
+        with self._lock:
+            self.stats['misses'] += 1
+
+    def set(self, endpoint, key, value):
+        ttl = self.ttls.get(endpoint, 0)
+        if ttl <= 0:
+            return
+        expires_at = self.clock() + ttl
+        with self._lock:
+            self._store((endpoint, key), (expires_at, value))
+        if self.disk:
+            self.disk.set(endpoint, key, value, expires_at)
+
+    def _store(self, entry_key, entry):
+        self._entries[entry_key] = entry
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get_or_fetch(self, endpoint, key, fetch):
+        """ Returns cached value for key, otherwise stores and returns fetch() """
+        value = self.get(endpoint, key)
+        if value is None:
+            value = fetch()
+            self.set(endpoint, key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def stats_str(self):
+        logstr = 'Cache: {hits} hits, {disk_hits} disk hits, {misses} misses, {evictions} evictions, {expirations} expired'
+        return logstr.format(**self.stats) + ' ({:.0%} hit rate)'.format(self.hit_rate)
@@ -0,0 +1,116 @@
+""" Record SWApi traffic to a JSONL capture file and replay it without the network """
+
+from collections import OrderedDict
+import threading
+import logging
+import mmap
+import json
+import time
+import os
+
+from .json_backend import loads as json_loads
+
+
+logger = logging.getLogger(__name__)
+
+# Every line starts with these fields so replay can index a capture without decoding responses
+LINE_PREFIX = '{"endpoint":"'
+KEY_FIELD = '","key":"'
+
+
+class ReplayMissError(Exception):
+    """ Raised when a replayed request was never captured """
+
+
+class CaptureRecorder(object):
+    """
+    Appends one JSON line per successful SWApi response to path:
+    {"endpoint", "key", "time", "request", "response"} where key is the
+    same canonical request key used by ResponseCache
+    """
+    def __init__(self, path):
+        self.path = path
+        self.num_recorded = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, endpoint, key, request, response):
+        line = OrderedDict([('endpoint', endpoint), ('key', key), ('time', time.time()),
+                            ('request', request), ('response', response)])
+        text = json.dumps(line, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(text)
+            self._file.flush()
+            self.num_recorded += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CaptureReplay(object):
+    """
+    Serves responses from a CaptureRecorder file by (endpoint, key). The file
+    is memory-mapped and indexed once by scanning only the start of each
+    line; a response is decoded when it is requested. If a request was
+    captured more than once, the latest response wins
+    """
+    def __init__(self, path):
+        self.path = path
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b''
+        self._index = self._build_index()
+        logger.info('Indexed {} captured responses from {}'.format(len(self._index), path))
+
+    def _build_index(self):
+        """ (endpoint, key) -> (start, end) byte offsets of the line """
+        index = {}
+        prefix, key_field = LINE_PREFIX.encode(), KEY_FIELD.encode()
+        data = self._map
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', start)
+            end = len(data) if end == -1 else end
+            if data[start:start + len(prefix)] == prefix:
+                endpoint_end = data.find(key_field, start, end)
+                key_start = endpoint_end + len(key_field)
+                key_end = data.find(b'"', key_start, end)
+                if endpoint_end != -1 and key_end != -1:
+                    endpoint = data[start + len(prefix):endpoint_end].decode()
+                    index[(endpoint, data[key_start:key_end].decode())] = (start, end)
+            start = end + 1
+        return index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, endpoint_key):
+        return endpoint_key in self._index
+
+    def _read(self, offsets):
+        start, end = offsets
+        return json_loads(self._map[start:end])
+
+    def get(self, endpoint, key):
+        """ Captured response text for (endpoint, key); raises ReplayMissError if missing """
+        offsets = self._index.get((endpoint, key))
+        with self._lock:
+            self.stats['hits' if offsets else 'misses'] += 1
+        if offsets is None:
+            raise ReplayMissError('No captured {} response for key {}'.format(endpoint, key))
+        return self._read(offsets)['response']
+
+    def __iter__(self):
+        """ Yields every indexed capture line (dict) in file order """
+        for offsets in sorted(self._index.values()):
+            yield self._read(offsets)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
@@ -0,0 +1,101 @@
+""" flight_tracker_ctl: thin client for a running flight_tracker --daemon
+
+Only imports the standard library (and the HH:MM argument type shared with
+flight_tracker) so commands return quickly
+"""
+
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+import argparse
+import json
+import sys
+
+from .parse_cl_arguments import time_of_day
+
+
+def call(port, method, path, data=None, timeout=300):
+    """ Sends a JSON request to the control API and returns the decoded response """
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    request = Request('http://127.0.0.1:{}{}'.format(port, path), data=body, method=method,
+                      headers={'Content-Type': 'application/json'})
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except HTTPError as err:
+        sys.exit('Error: {}'.format(json.loads(err.read().decode('utf-8')).get('error', err)))
+    except URLError as err:
+        sys.exit('Unable to reach flight_tracker daemon on port {} ({})'.format(port, err.reason))
+
+
+def add_search_arguments(parser):
+    """ Subset of the Track a Flight arguments (same flags as flight_tracker) """
+    parser.add_argument('-o', '--origin', required=True, help='Origin airport code')
+    parser.add_argument('-d', '--destination', required=True, help='Destination airport code')
+    parser.add_argument('-l', '--depart_date', required=True, help='Departure date (mm/dd/yy)')
+    parser.add_argument('-r', '--return_date', help='Return date (mm/dd/yy)')
+    parser.add_argument('-ft', '--faretype', default='POINTS', help='USD or POINTS [%(default)s]')
+    parser.add_argument('-p', '--price_point', type=int, default=0, help='Notify below this price')
+    parser.add_argument('-x', '--passengers', type=int, default=1, help='Number of passengers')
+    parser.add_argument('-ns', '--nonstop', action='store_true', help='Nonstop flights only')
+    parser.add_argument('-c', '--companion', action='store_true', help='Companion pass')
+    parser.add_argument('-da', '--depart_after', type=time_of_day, help='Earliest outbound departure time (HH:MM)')
+    parser.add_argument('-db', '--depart_before', type=time_of_day, help='Latest outbound departure time (HH:MM)')
+    parser.add_argument('-mp', '--max_price', type=float, help='Ignore trips above this total price')
+
+
+def format_trip(trip):
+    if not trip:
+        return 'no flights'
+    flights = ', '.join('{} {}->{} {}-{} #{}'.format(x[2], x[0], x[1], x[3], x[4], ','.join(map(str, x[5])))
+                        for x in trip['flights'])
+    return '{} ({})'.format(trip['price_str'], flights)
+
+
+def run_command(args):
+    port = args.control_port
+    if args.command == 'list':
+        for row in call(port, 'GET', '/searches'):
+            search = row['search']
+            dates = search['depart_date'] + (' - ' + search['return_date'] if search['return_date'] else '')
+            print('{}  {} -> {} {} [{} {}]: {}'.format(row['id'], search['origin'], search['destination'], dates,
+                                                      search['faretype'], search['price_point'],
+                                                      format_trip(row['cheapest'])))
+    elif args.command == 'status':
+        print(json.dumps(call(port, 'GET', '/status'), indent=1, sort_keys=True))
+    elif args.command == 'remove':
+        call(port, 'DELETE', '/searches/{}'.format(args.id))
+        print('Removed {}'.format(args.id))
+    else:
+        search = {k: v for k, v in vars(args).items()
+                  if k not in ('command', 'control_port', 'top') and v is not None}
+        if args.command == 'add':
+            print('Added {}'.format(call(port, 'POST', '/searches', search)['id']))
+        else:
+            search['top'] = args.top
+            for trip in call(port, 'POST', '/query', search):
+                print(format_trip(trip))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='flight_tracker_ctl',
+                                     description='Manage the watchlist of a running flight_tracker --daemon')
+    parser.add_argument('-cp', '--control_port', type=int, default=8765,
+                        help='Port of the daemon control API [%(default)s]')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('list', help='List tracked searches and their cheapest flights')
+    commands.add_parser('status', help='Show daemon, schedule and cache stats')
+    add_search_arguments(commands.add_parser('add', help='Track a flight'))
+    query = commands.add_parser('query', help='Search now without tracking')
+    add_search_arguments(query)
+    query.add_argument('-tk', '--top', type=int, default=0, help='Show the k cheapest trips instead of one')
+    remove = commands.add_parser('remove', help='Stop tracking a search')
+    remove.add_argument('id', help='Search id from list')
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        sys.exit()
+    run_command(args)
+
+
+if __name__ == '__main__':
+    main()
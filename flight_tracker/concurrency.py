@@ -0,0 +1,170 @@
+""" Helpers for running flight searches concurrently under a rate limit """
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import logging
+import time
+
+from .metrics import REQUEST_RATE
+
+
+logger = logging.getLogger(__name__)
+
+TaskResult = namedtuple('TaskResult', ['index', 'item', 'result', 'error'])
+
+
+class TokenBucket(object):
+    """ Token bucket allowing `rate` acquisitions per second with bursts of up to `capacity` """
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def acquire(self):
+        """ Block until a token is available """
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class RateLimiter(object):
+    """
+    Per-host rate limiter: each host gets its own TokenBucket allowing
+    `rate` requests per second, and at most `max_in_flight` requests
+    may be outstanding at any time (across all hosts). If min_rate is set,
+    a host's rate is halved (down to min_rate) whenever it throttles us and
+    climbs back towards `rate` by a twentieth of it per successful request
+    """
+    def __init__(self, rate=0.5, max_in_flight=4, burst=1, min_rate=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.min_rate = min_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def _get_bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def acquire(self, host):
+        """ Wait for an in-flight slot and a token for host """
+        self._in_flight.acquire()
+        try:
+            self._get_bucket(host).acquire()
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+    def release(self):
+        self._in_flight.release()
+
+    @property
+    def adaptive(self):
+        return bool(self.min_rate) and self.rate > 0
+
+    def throttled(self, host):
+        """ Multiplicative decrease of host's rate after a 429 """
+        if not self.adaptive:
+            return
+        bucket = self._get_bucket(host)
+        rate = max(self.min_rate, bucket.rate / 2)
+        if rate < bucket.rate:
+            bucket.set_rate(rate)
+            REQUEST_RATE.set(rate, host=host)
+            logger.info('Throttled by {}, lowering rate to {:.3g} requests/second'.format(host, rate))
+
+    def succeeded(self, host):
+        """ Additive increase of host's rate after a successful request """
+        if not self.adaptive:
+            return
+        bucket = self._get_bucket(host)
+        if bucket.rate < self.rate:
+            rate = min(self.rate, bucket.rate + self.rate / 20.0)
+            bucket.set_rate(rate)
+            REQUEST_RATE.set(rate, host=host)
+
+    def limit(self, host):
+        """ Context manager wrapping a single request to host """
+        return _RateLimitContext(self, host)
+
+
+class _RateLimitContext(object):
+    def __init__(self, rate_limiter, host):
+        self.rate_limiter = rate_limiter
+        self.host = host
+
+    def __enter__(self):
+        self.rate_limiter.acquire(self.host)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.rate_limiter.release()
+
+
+def run_concurrently(func, items, max_workers=4, deadline=None):
+    """
+    Calls func(item) for every item using a pool of max_workers threads.
+    Yields TaskResult tuples in completion order; exceptions raised by func
+    are captured in TaskResult.error rather than propagated. Items are read
+    lazily and at most 2 * max_workers are submitted at a time, so memory
+    does not grow with len(items). Stops at deadline (a time.time() value)
+    without waiting for running calls. Closing the generator early cancels
+    items that have not started
+    """
+    items = enumerate(items)
+    max_workers = max(1, int(max_workers))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {}  # Future -> (index, item)
+    finished = False
+    try:
+        while True:
+            while len(pending) < 2 * max_workers and (deadline is None or time.time() < deadline):
+                entry = next(items, None)
+                if entry is None:
+                    break
+                pending[executor.submit(func, entry[1])] = entry
+            if not pending:
+                break
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            done = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)[0]
+            if not done:  # Deadline passed
+                break
+            for future in done:
+                idx, item = pending.pop(future)
+                try:
+                    yield TaskResult(idx, item, future.result(), None)
+                except Exception as err:
+                    yield TaskResult(idx, item, None, err)
+        finished = True
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=finished)
+
+
+def map_concurrently(func, items, max_workers=4):
+    """ Same as run_concurrently but returns TaskResults in input order """
+    return sorted(run_concurrently(func, items, max_workers), key=lambda x: x.index)
@@ -0,0 +1,191 @@
+""" Long-lived tracker process with a localhost HTTP control API """
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+import logging
+import json
+import time
+
+from .alert_state import get_search_key
+from .concurrency import TaskResult
+from .flight_records import FlightSearch, parse_time_of_day
+
+
+logger = logging.getLogger(__name__)
+
+
+def describe_trip(trip_record):
+    """ JSON friendly summary of a TripRecord (or None) """
+    if not trip_record:
+        return None
+    return {'price': trip_record.price, 'price_str': trip_record.price_str,
+            'flights': [[flight.origin, flight.destination, flight.depart_date, flight.depart_time,
+                         flight.arrival_time, flight.flight_numbers, flight.fare_class]
+                        for flight in trip_record]}
+
+
+class TrackerDaemon(object):
+    """
+    Keeps the watchlist, SWApi session, caches, route graph and alert state
+    warm between checks. Searches are scheduled with scheduler
+    (SearchScheduler) so adding one only schedules that search and wakes
+    the loop; nothing else is re-run. check(searches) is the function that
+    checks a batch of due searches and returns TaskResults
+    """
+    def __init__(self, scheduler, check, sw_api):
+        self.scheduler = scheduler
+        self.check = check
+        self.sw_api = sw_api
+        self.searches = {}  # search id -> FlightSearch
+        self.last_results = {}  # search id -> TripRecord
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        for _, flight_search in scheduler.iter_scheduled():
+            self.searches[get_search_key(flight_search)] = flight_search
+
+    def add(self, flight_search):
+        """ Schedules flight_search to be checked now; returns its id """
+        search_id = get_search_key(flight_search)
+        with self._lock:
+            if search_id not in self.searches:
+                self.searches[search_id] = flight_search
+                self.scheduler.add(flight_search)
+        self._wake.set()
+        return search_id
+
+    def remove(self, search_id):
+        with self._lock:
+            flight_search = self.searches.pop(search_id, None)
+            self.last_results.pop(search_id, None)
+            if flight_search is not None:
+                self.scheduler.remove(flight_search)
+        return flight_search is not None
+
+    def list(self):
+        with self._lock:
+            next_checks = {get_search_key(x): t for t, x in self.scheduler.iter_scheduled()}
+            return [{'id': search_id, 'search': flight_search.to_dict(),
+                     'next_check': next_checks.get(search_id),
+                     'cheapest': describe_trip(self.last_results.get(search_id))}
+                    for search_id, flight_search in self.searches.items()]
+
+    def status(self):
+        with self._lock:
+            status = {'searches': len(self.searches), 'uptime': time.time() - self.started_at,
+                      'requests_per_hour': self.scheduler.requests_per_hour,
+                      'seconds_until_due': self.scheduler.seconds_until_due()}
+        if self.sw_api.cache is not None:
+            status['cache'] = dict(self.sw_api.cache.stats, hit_rate=self.sw_api.cache.hit_rate)
+        return status
+
+    def run(self):
+        """ Checks searches as they come due until stop() """
+        while not self._stopped.is_set():
+            with self._lock:
+                due = self.scheduler.pop_due()
+            if due:
+                try:
+                    results = self.check(due)
+                except Exception as err:  # Keep running; the searches are rescheduled as failed checks
+                    logger.exception('Error checking flights')
+                    results = [TaskResult(idx, x, None, err) for idx, x in enumerate(due)]
+                with self._lock:
+                    self.scheduler.record_results(results)
+                    for task in results:
+                        search_id = get_search_key(task.item)
+                        if search_id in self.searches and not task.error:
+                            self.last_results[search_id] = task.result
+            with self._lock:
+                wait_time = self.scheduler.seconds_until_due()
+            self._wake.wait(wait_time)
+            self._wake.clear()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+
+class ControlServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def create_control_handler(daemon, query):
+    """
+    Request handler for the control API. query(FlightSearch, top) runs an
+    ad-hoc search with the daemon's warm session and returns TripRecords
+        GET /status                 daemon, scheduler and cache stats
+        GET /searches               watchlist with next check time and last result
+        POST /searches              add a search (JSON FlightSearch.to_dict fields)
+        DELETE /searches/<id>       remove a search
+        POST /query                 run a search now (JSON fields plus optional "top")
+    """
+    class ControlHandler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            logger.debug('Control API: ' + fmt % args)
+
+        def _respond(self, status, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_search(self):
+            length = int(self.headers.get('Content-Length', 0))
+            fields = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            top = fields.pop('top', None)
+            for column in ('depart_after', 'depart_before'):
+                if fields.get(column):
+                    try:
+                        fields[column] = parse_time_of_day(fields[column])
+                    except ValueError:
+                        raise ValueError('{} must be HH:MM (24 hour)'.format(column))
+            flight_search = FlightSearch.from_dict(fields)
+            if not (flight_search.origin and flight_search.destination and flight_search.depart_date):
+                raise ValueError('origin, destination and depart_date are required')
+            if not flight_search.depart_date_dt or (flight_search.return_date and not flight_search.return_date_dt):
+                raise ValueError('Date format does not match expected format mm/dd/yy')
+            return flight_search, top
+
+        def do_GET(self):
+            if self.path == '/status':
+                return self._respond(200, daemon.status())
+            if self.path == '/searches':
+                return self._respond(200, daemon.list())
+            self._respond(404, {'error': 'Unknown path {}'.format(self.path)})
+
+        def do_POST(self):
+            try:
+                flight_search, top = self._read_search()
+            except (ValueError, TypeError) as err:
+                return self._respond(400, {'error': str(err)})
+            if self.path == '/searches':
+                return self._respond(201, {'id': daemon.add(flight_search)})
+            if self.path == '/query':
+                try:
+                    trip_records = query(flight_search, top)
+                except Exception as err:
+                    return self._respond(502, {'error': str(err)})
+                return self._respond(200, [describe_trip(x) for x in trip_records])
+            self._respond(404, {'error': 'Unknown path {}'.format(self.path)})
+
+        def do_DELETE(self):
+            if self.path.startswith('/searches/'):
+                if daemon.remove(self.path[len('/searches/'):]):
+                    return self._respond(200, {'removed': True})
+                return self._respond(404, {'error': 'No such search'})
+            self._respond(404, {'error': 'Unknown path {}'.format(self.path)})
+
+    return ControlHandler
+
+
+def serve_control_api(daemon, query, port, host='127.0.0.1'):
+    """ Serves the control API from a daemon thread; returns the server """
+    server = ControlServer((host, port), create_control_handler(daemon, query))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info('Control API listening on http://{}:{}/'.format(host, server.server_address[1]))
+    return server
@@ -0,0 +1,98 @@
+""" Flexible-date sweeps that build a calendar of minimum fares """
+
+from collections import OrderedDict
+from datetime import timedelta
+import logging
+
+from .search_planner import find_cheapest_flights_coalesced
+from .utils import create_table
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_date_window(center, flex=0, date_range=None):
+    """ Dates from date_range (start, end datetimes) or center +/- flex days """
+    if date_range:
+        start, end = date_range
+    else:
+        start, end = center - timedelta(days=flex), center + timedelta(days=flex)
+    return [start + timedelta(days=x) for x in range((end - start).days + 1)]
+
+
+def get_sweep_dates(flight_search, flex=0, date_range=None, flex_return=False):
+    """
+    Returns list of (depart_date, return_date) datetimes to search. One way
+    searches have return_date None. Round trips keep the original trip
+    length unless flex_return, in which case every return date within flex
+    days of the original (and not before departure) is paired with every
+    depart date
+    """
+    depart_dates = get_date_window(flight_search.depart_date_dt, flex, date_range)
+    if not flight_search.return_date:
+        return [(x, None) for x in depart_dates]
+    if not flex_return:
+        stay = flight_search.return_date_dt - flight_search.depart_date_dt
+        return [(x, x + stay) for x in depart_dates]
+    return_dates = get_date_window(flight_search.return_date_dt, flex)
+    return [(x, y) for x in depart_dates for y in return_dates if y >= x]
+
+
+def sweep_fares(flight_search, sweep_dates, sw_api, max_workers=4):
+    """
+    Finds the cheapest trip for every (depart_date, return_date) in
+    sweep_dates concurrently, sharing sw_api's session and cache.
+    Returns OrderedDict of (depart_date, return_date) -> TripRecord or None
+    """
+    searches = []
+    for depart_date, return_date in sweep_dates:
+        searches.append(flight_search.copy(
+            depart_date=depart_date.strftime('%Y-%m-%d'),
+            return_date=return_date.strftime('%Y-%m-%d') if return_date else None))
+    calendar = OrderedDict()
+    for dates, task in zip(sweep_dates, find_cheapest_flights_coalesced(searches, sw_api, max_workers)):
+        if task.error:
+            logger.warning('Unable to search {}: {}'.format(task.item, task.error))
+        calendar[dates] = task.result
+    return calendar
+
+
+def create_calendar_table(calendar):
+    """
+    Formats sweep_fares results as a grid of minimum fares: one row per
+    depart date and one column per return date (or trip length)
+    """
+    def fmt_date(date):
+        return date.strftime('%a %m/%d')
+
+    def fmt_price(trip_record):
+        return trip_record.price_str if trip_record else '-'
+
+    depart_dates = list(OrderedDict.fromkeys(x[0] for x in calendar))
+    return_dates = list(OrderedDict.fromkeys(x[1] for x in calendar))
+    if len(depart_dates) == len(calendar):  # One way or fixed trip length: a single column
+        header = ['Depart', 'Return', 'Price'] if return_dates[0] else ['Depart', 'Price']
+        data = [[fmt_date(x)] + ([fmt_date(y)] if y else []) + [fmt_price(calendar[(x, y)])]
+                for x, y in calendar]
+        return create_table(header, data)
+    header = ['Depart \\ Return'] + [fmt_date(x) for x in return_dates]
+    data = [[fmt_date(x)] + [fmt_price(calendar.get((x, y))) for y in return_dates]
+            for x in depart_dates]
+    return create_table(header, data)
+
+
+def find_cheapest_dates(flight_search, sw_api, flex=0, date_range=None, flex_return=False,
+                        max_workers=4):
+    """ Sweeps flexible dates for flight_search and logs a calendar of minimum fares """
+    sweep_dates = get_sweep_dates(flight_search, flex, date_range, flex_return)
+    logger.info('Searching {} date combinations'.format(len(sweep_dates)))
+    calendar = sweep_fares(flight_search, sweep_dates, sw_api, max_workers)
+    trip_records = [x for x in calendar.values() if x]
+    if trip_records:
+        cheapest = min(trip_records, key=lambda x: x.price)
+        table = create_calendar_table(calendar)
+        logstr = 'Printing fare calendar (cheapest is {} on {}):\n\n{}\n'
+        logger.info(logstr.format(cheapest.price_str, cheapest.flights[0].depart_date, table))
+    else:
+        logger.info('No flights found')
+    return calendar
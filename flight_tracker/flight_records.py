@@ -2,19 +2,51 @@
 
 from datetime import datetime
 from collections import OrderedDict
+from functools import lru_cache
 import logging
+import copy
+import json
 import sys
 
 
 logger = logging.getLogger(__name__)
 
 
+ACCEPTED_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%y', '%m/%d/%Y', '%m/%d/%y %A')
+# FlightSearch constructor arguments (see FlightSearch.to_dict)
+SEARCH_FIELDS = ('origin', 'destination', 'depart_date', 'depart_time', 'return_date', 'return_time',
+                 'passengers', 'senior_passengers', 'faretype', 'passenger_type', 'promo_code',
+                 'price_point', 'flight_numbers', 'logall', 'nonstop', 'companion',
+                 'depart_after', 'depart_before', 'max_price')
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text):
+    """ datetime from text in any accepted format (None if it matches none); watchlists repeat dates a lot """
+    for fmt in ACCEPTED_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except (ValueError, TypeError):
+            pass
+
+
+def parse_time_of_day(text):
+    """ 'H:MM' (24 hour) to 'HH:MM'; raises ValueError if text is not a valid time """
+    return datetime.strptime(str(text).strip(), '%H:%M').strftime('%H:%M')
+
+
+def get_paying_passengers(flight_search):
+    """ Passengers a fare is multiplied by for the trip price (a companion flies free) """
+    return 1 if flight_search.companion else flight_search.num_passengers
+
+
 class FlightSearch(object):
     def __init__(self, origin, destination, depart_date, depart_time='ALL_DAY',
                  return_date=None, return_time=None, passengers=1,
                  senior_passengers=0, faretype='POINTS', passenger_type='ADULT',
                  promo_code=None, price_point=0, flight_numbers=None, logall=False,
-                 nonstop=False, companion=False):
+                 nonstop=False, companion=False, depart_after=None, depart_before=None,
+                 max_price=None):
         self.origin = origin
         self.destination = destination
         self.depart_date = depart_date
@@ -31,6 +63,33 @@ class FlightSearch(object):
         self.flight_numbers = flight_numbers
         self.logall = logall
         self.nonstop = nonstop
+        self.depart_after = depart_after
+        self.depart_before = depart_before
+        self.max_price = max_price
+
+    def copy(self, **changes):
+        """ Returns a shallow copy of this search with attributes in changes replaced """
+        flight_search = copy.copy(self)
+        for k, v in changes.items():
+            setattr(flight_search, k, v)
+        return flight_search
+
+    def to_dict(self):
+        """ Constructor arguments that recreate this search (see from_dict) """
+        return {'origin': self.origin, 'destination': self.destination,
+                'depart_date': self.depart_date, 'depart_time': self.depart_time,
+                'return_date': self.return_date, 'return_time': self.return_time,
+                'passengers': 1 if self.companion else self.num_passengers,
+                'senior_passengers': self.senior_passengers, 'faretype': self.faretype,
+                'passenger_type': self.passenger_type, 'promo_code': self.promo_code,
+                'price_point': self.price_point, 'flight_numbers': self.flight_numbers,
+                'logall': self.logall, 'nonstop': self.nonstop, 'companion': self.companion,
+                'depart_after': self.depart_after, 'depart_before': self.depart_before,
+                'max_price': self.max_price}
+
+    @classmethod
+    def from_dict(cls, search_dict):
+        return cls(**search_dict)
 
     @property
     def return_destination(self):
@@ -44,38 +103,55 @@ class FlightSearch(object):
     def triptype(self):
         return 'roundtrip' if self.return_date else 'oneway'
 
+    @property
+    def depart_date(self):
+        return self._depart_date
+
+    @depart_date.setter
+    def depart_date(self, value):
+        # Dates are parsed once here rather than on every property access
+        self._depart_date = value
+        self._depart_date_dt = self.convert_to_datetime(value)
+        self._depart_date_str = self._depart_date_dt.strftime('%Y-%m-%d') if self._depart_date_dt else None
+
+    @property
+    def return_date(self):
+        return self._return_date
+
+    @return_date.setter
+    def return_date(self, value):
+        self._return_date = value
+        self._return_date_dt = self.convert_to_datetime(value)
+        self._return_date_str = self._return_date_dt.strftime('%Y-%m-%d') if self._return_date_dt else None
+
     @staticmethod
     def convert_to_datetime(text, fmt_date=False):
-        accepted_formats = ['%Y-%m-%d', '%m/%d/%y', '%m/%d/%Y', '%m/%d/%y %A']
-        for fmt in accepted_formats:
-            try:
-                date = datetime.strptime(text, fmt)
-                if fmt_date:
-                    return date.strftime('%Y-%m-%d')
-                else:
-                    return date
-            except (ValueError, TypeError):
-                pass
+        try:
+            date = parse_date(text)
+        except TypeError:  # Unhashable
+            return None
+        if date is not None and fmt_date:
+            return date.strftime('%Y-%m-%d')
+        return date
 
     @property
     def depart_date_str(self):
-        date = self.convert_to_datetime(self.depart_date, True)
-        if type(date) == str:
-            return date
+        if self._depart_date_str:
+            return self._depart_date_str
         else:
             sys.exit('Date format does not match expected format mm/dd/yy')
 
     @property
     def return_date_str(self):
-        return self.convert_to_datetime(self.return_date, True)
+        return self._return_date_str
 
     @property
     def return_date_dt(self):
-        return self.convert_to_datetime(self.return_date)
+        return self._return_date_dt
 
     @property
     def depart_date_dt(self):
-        return self.convert_to_datetime(self.depart_date)
+        return self._depart_date_dt
 
     @property
     def flight_search_dict(self):
@@ -94,6 +170,11 @@ class FlightSearch(object):
         sw_dict = OrderedDict(zip(sw_keys, sw_values))
         return sw_dict
 
+    @property
+    def request_key(self):
+        """ Canonical form of flight_search_dict; searches with equal keys send identical requests """
+        return json.dumps(self.flight_search_dict, sort_keys=True, separators=(',', ':'))
+
     def __str__(self):
         outstr = ('Flight on {} from {} to {} (triptype={}, faretype={}, '
                   'price_point={})')
@@ -104,6 +185,10 @@ class FlightSearch(object):
         class_name = self.__class__.__name__
         output = []
         for k, v in self.__dict__.items():
+            if k in ('_depart_date', '_return_date'):
+                k = k[1:]
+            elif k.startswith('_'):  # Parsed forms of the dates
+                continue
             if type(v) is str:
                 fmt = '{}="{}"'.format(k, v)
             elif k == 'search_instance':
@@ -124,7 +209,7 @@ class FlightRecord(FlightSearch):
         self.arrival_time = arrival_time
         self.flight_numbers = flight_numbers
         self.search_instance = search_instance
-        self.price = price if self.search_instance.companion else price * self.search_instance.num_passengers
+        self.price = price * get_paying_passengers(self.search_instance)
         self.fare_class = fare_class
 
     @property
@@ -232,32 +317,17 @@ def create_flight_search_from_args(args):
             else:
                 args.flight_numbers = [args.flight_numbers]
         args.flight_numbers = [list(map(int, x.split(','))) for x in args.flight_numbers]
-    flight_args = args.__dict__.copy()
-    remove_args = ['twilio', 'frequency', 'multiple', 'func', 'flight_finder']
-    for e_arg in remove_args:
-        del flight_args[e_arg]
+    flight_args = {k: v for k, v in vars(args).items() if k in SEARCH_FIELDS}
     return FlightSearch(**flight_args)
 
 
 def create_flight_searches_from_file(args):
-    """ Creates list of FlightSearch objects from file """
-    flight_file = open(args.multiple, 'r')
-    data = [x.strip().split('\t') for x in flight_file.readlines()]
-    header = data[0]
-    flight_searches = []
-
-    for entry in data[1:]:
-        if len(header) != len(entry):
-            sys.exit('All fields in file must be filled in (use true/false when applicable)')
-        for argname, argval in zip(header, entry):
-            if 'false' in argval.lower():
-                args.__setattr__(argname, None)
-            else:
-                args.__setattr__(argname, argval)
-
-        flight_searches.append(create_flight_search_from_args(args))
-    logger.info('Collected {} flights to track from file'.format(len(flight_searches)))
-    return flight_searches
+    """
+    Creates list of FlightSearch objects from a TSV/CSV/JSONL file (see
+    watchlist.Watchlist); malformed rows are logged and skipped
+    """
+    from .watchlist import create_watchlist
+    return create_watchlist(args).searches
 
 
 def create_flight_searches(args):
@@ -0,0 +1,221 @@
+""" Compact columnar storage for parsed flights """
+
+from datetime import datetime, timedelta
+from array import array
+import threading
+
+from .flight_records import get_paying_passengers
+
+
+EPOCH = datetime(1970, 1, 1)
+
+_interned = []
+_intern_ids = {}
+_intern_lock = threading.Lock()
+
+
+def intern_code(text):
+    """ Returns a small integer id for text (airport codes, fare classes) """
+    try:
+        return _intern_ids[text]
+    except KeyError:
+        with _intern_lock:
+            if text not in _intern_ids:
+                _intern_ids[text] = len(_interned)
+                _interned.append(text)
+            return _intern_ids[text]
+
+
+def lookup_code(code_id):
+    return _interned[code_id]
+
+
+def to_timestamp(date_datetime):
+    """ Converts a naive (airport local) datetime to integer seconds since EPOCH """
+    delta = date_datetime - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def from_timestamp(timestamp):
+    return EPOCH + timedelta(seconds=timestamp)
+
+
+class FlightTable(object):
+    """
+    Column-oriented table of flights from one FlightSearch. Times are
+    stored as seconds since EPOCH (airport local time), prices as integer
+    cents (USD) or points, airport codes and fare classes as interned ids
+    and flight numbers packed into a single array with per-row offsets.
+    Indexing or iterating returns FlightRow views
+    """
+    __slots__ = ('search_instance', 'price_scale', 'origins', 'destinations',
+                 'depart_times', 'arrival_times', 'prices', 'fare_classes',
+                 'flight_numbers', 'flight_number_offsets')
+
+    def __init__(self, search_instance):
+        self.search_instance = search_instance
+        self.price_scale = 100 if search_instance.faretype == 'USD' else 1
+        self.origins = array('H')
+        self.destinations = array('H')
+        self.depart_times = array('q')
+        self.arrival_times = array('q')
+        self.prices = array('i')
+        self.fare_classes = array('H')
+        self.flight_numbers = array('I')
+        self.flight_number_offsets = array('I', [0])
+
+    @classmethod
+    def from_rows(cls, rows, search_instance):
+        """ Builds table from (origin, destination, depart_datetime, arrival_datetime,
+        flight_numbers, price, fare_class) tuples """
+        table = cls(search_instance)
+        for row in rows:
+            table.append(*row)
+        return table
+
+    def append(self, origin, destination, depart_datetime, arrival_datetime,
+               flight_numbers, price, fare_class):
+        self.origins.append(intern_code(origin))
+        self.destinations.append(intern_code(destination))
+        self.depart_times.append(to_timestamp(depart_datetime))
+        self.arrival_times.append(to_timestamp(arrival_datetime))
+        self.prices.append(int(round(price * self.price_scale)))
+        self.fare_classes.append(intern_code(fare_class))
+        self.flight_numbers.extend(flight_numbers)
+        self.flight_number_offsets.append(len(self.flight_numbers))
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('FlightTable index out of range')
+        return FlightRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield FlightRow(self, index)
+
+    def __repr__(self):
+        return 'FlightTable({})'.format(list(self))
+
+    def iter_columns(self):
+        """ Yields raw (origin, destination, depart_time, arrival_time, flight_numbers,
+        price, fare_class) tuples with flight numbers comma separated """
+        for index in range(len(self)):
+            yield (lookup_code(self.origins[index]), lookup_code(self.destinations[index]),
+                   self.depart_times[index], self.arrival_times[index],
+                   ','.join(map(str, self.get_flight_numbers(index))),
+                   self.prices[index], lookup_code(self.fare_classes[index]))
+
+    def get_flight_numbers(self, index):
+        start, end = self.flight_number_offsets[index], self.flight_number_offsets[index + 1]
+        return self.flight_numbers[start:end].tolist()
+
+    def num_stops(self, index):
+        return self.flight_number_offsets[index + 1] - self.flight_number_offsets[index] - 1
+
+    def get_price(self, index):
+        """ Price of row index for every paying passenger, like FlightRecord.price """
+        return float(self.prices[index]) / self.price_scale * get_paying_passengers(self.search_instance)
+
+
+class FlightRow(object):
+    """
+    Lazy view of one FlightTable row with the same attributes as FlightRecord.
+    origin and destination may be overridden (e.g. with long names)
+    """
+    __slots__ = ('table', 'index', '_origin', '_destination')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+        self._origin = None
+        self._destination = None
+
+    @property
+    def origin(self):
+        return self._origin or lookup_code(self.table.origins[self.index])
+
+    @origin.setter
+    def origin(self, value):
+        self._origin = value
+
+    @property
+    def destination(self):
+        return self._destination or lookup_code(self.table.destinations[self.index])
+
+    @destination.setter
+    def destination(self, value):
+        self._destination = value
+
+    @property
+    def search_instance(self):
+        return self.table.search_instance
+
+    @property
+    def depart_date_dt(self):
+        return from_timestamp(self.table.depart_times[self.index])
+
+    @property
+    def arrival_date_dt(self):
+        return from_timestamp(self.table.arrival_times[self.index])
+
+    @property
+    def depart_date(self):
+        return self.depart_date_dt.strftime('%m/%d/%y')
+
+    @property
+    def depart_time(self):
+        return self.depart_date_dt.strftime('%I:%M %p')
+
+    @property
+    def arrival_time(self):
+        return self.arrival_date_dt.strftime('%I:%M %p')
+
+    @property
+    def flight_numbers(self):
+        return self.table.get_flight_numbers(self.index)
+
+    @property
+    def price(self):
+        return self.table.get_price(self.index)
+
+    @property
+    def fare_class(self):
+        return lookup_code(self.table.fare_classes[self.index])
+
+    @property
+    def triptype(self):
+        return self.search_instance.triptype
+
+    @property
+    def faretype(self):
+        return self.search_instance.faretype
+
+    @property
+    def price_point(self):
+        return self.search_instance.price_point
+
+    @property
+    def price_str(self):
+        if self.faretype == 'USD':
+            return '$' + '{0:.2f}'.format(self.price)
+        else:
+            return str(int(self.price)) + ' points'
+
+    @property
+    def output_list(self):
+        return [self.origin, self.destination, self.depart_date, self.depart_time,
+                self.arrival_time, str(self.flight_numbers), self.price_str,
+                self.fare_class]
+
+    def __repr__(self):
+        output = ['{}="{}"'.format(k, getattr(self, k)) for k in
+                  ('origin', 'destination', 'depart_date', 'depart_time', 'arrival_time')]
+        output.append('flight_numbers={}'.format(self.flight_numbers))
+        output.append('price={}'.format(self.price))
+        output.append('fare_class="{}"'.format(self.fare_class))
+        return 'FlightRow({})'.format(', '.join(output))
@@ -1,21 +1,44 @@
-from collections import defaultdict
+from functools import partial
+import multiprocessing
+import threading
+import argparse
 import logging
 import time
 import sys
+import os
 
 from .parse_cl_arguments import parse_cl_arguments
-from .flight_records import create_flight_searches
+from .flight_records import FlightSearch, create_flight_searches
+from .alert_state import AlertState, get_search_key
+from .cache import ResponseCache
+from .capture import CaptureRecorder, CaptureReplay
+from .concurrency import RateLimiter, TaskResult
+from .daemon import TrackerDaemon, serve_control_api
+from .fare_calendar import find_cheapest_dates
+from .history import FareHistory
+from .json_backend import HAS_STREAMING
+from .metrics import CACHE_HIT_RATE, CYCLE_SECONDS, NOTIFY_SECONDS, serve_metrics, start_metrics_dump
+from .metrics import enable as enable_metrics
+from .notifier import create_dispatcher
+from .pairing import PairingConstraints, find_top_trips
+from .resilience import CircuitBreaker, RetryPolicy
+from .route_graph import get_route_graph, refresh_route_graph
+from .scheduler import SearchScheduler
+from .search_planner import find_cheapest_flights_coalesced
 from .utils import notify
+from .watchlist import create_watchlist
+from .web_scraper import SWApi, create_session, set_default_sw_api
 from .web_scraper import find_cheapest_flights
-from .web_scraper import find_all_destinations
+from .web_scraper import find_all_destinations, log_trip_table
+from .work_queue import SharedRateLimiter, WorkQueue, get_worker_id
 
 
 logger = logging.getLogger()
 
 
-def scrape_for_flights(flight_search):
+def scrape_for_flights(flight_search, sw_api=None):
     """ Scrape flights and return cheapest flights as TripRecord object """
-    return find_cheapest_flights(flight_search)
+    return find_cheapest_flights(flight_search, sw_api)
 
 
 def get_price_difference(cheapest_flights):
@@ -31,22 +54,426 @@ def get_price_difference(cheapest_flights):
         logger.info('No flight options found matching itinerary')
 
 
-def check_all_flights(args, flight_searches, price_notifications):
-    """ Checks all flights in flight_searches and notifies if price has dropped """
-    for idx, flight_search in enumerate(flight_searches):
-        if idx > 0:
-            wait_time = 3
-            logger.info('Waiting {} seconds before checking next flight'.format(wait_time))
-            time.sleep(wait_time)  # Wait a few seconds between queries
-        cheapest_flights = scrape_for_flights(flight_search)
+def create_rate_limiter(args):
+    """
+    Creates RateLimiter from --rate_limit, --min_rate and --workers args.
+    With --queue the rate is shared by every process using the queue
+    """
+    if args.queue:
+        return SharedRateLimiter(args.queue, rate=args.rate_limit, max_in_flight=args.workers,
+                                 min_rate=args.min_rate)
+    return RateLimiter(rate=args.rate_limit, max_in_flight=args.workers, min_rate=args.min_rate)
+
+
+def create_cache(args):
+    """ Creates ResponseCache from --cache_ttl, --cache_size and --cache_file args """
+    if args.cache_ttl <= 0:
+        return None
+    return ResponseCache(max_entries=args.cache_size,
+                         ttls={'flights': args.cache_ttl},
+                         path=args.cache_file)
+
+
+def create_sw_api(args):
+    """
+    Creates the SWApi shared by every search in this process: one pooled
+    session sized for --workers, the rate limiter, the response cache, the
+    --record/--replay capture file, retries and the circuit breaker
+    """
+    return SWApi(rate_limiter=create_rate_limiter(args),
+                 cache=create_cache(args),
+                 session=create_session(pool_size=max(10, args.workers)),
+                 timeout=(args.connect_timeout, args.read_timeout),
+                 stream=args.stream,
+                 recorder=CaptureRecorder(args.record) if args.record else None,
+                 replay=CaptureReplay(args.replay) if args.replay else None,
+                 retry_policy=RetryPolicy(args.retries, args.backoff) if args.retries else None,
+                 circuit_breaker=(CircuitBreaker(args.circuit_threshold, args.circuit_reset)
+                                  if args.circuit_threshold else None))
+
+
+def create_history(args):
+    """ Creates FareHistory from --history (None if not set) """
+    if not args.history:
+        return None
+    history = FareHistory(args.history)
+    history.maintain(args.history_days)
+    if args.vacuum_history:
+        history.vacuum()
+    return history
+
+
+def get_state_file(args):
+    """
+    --state_file, or with --queue a file next to the queue so every worker
+    process shares one AlertState and each alert is sent once
+    """
+    if args.state_file or not (args.queue and (args.worker or args.coordinator)):
+        return args.state_file
+    return '{}.alerts'.format(args.queue)
+
+
+def create_alert_state(args):
+    """ Creates AlertState from --state_file (kept in memory if not set) """
+    return AlertState(get_state_file(args), max_notifications=args.max_notifications)
+
+
+def send_alert(args, out_str, dispatcher=None, on_sent=None):
+    """
+    Logs out_str and sends it through dispatcher, or inline if it is None.
+    on_sent() is called once it has been sent (never if sending fails)
+    """
+    logger.info(out_str.replace('\n', ' '))
+    if dispatcher is not None:
+        dispatcher.notify(out_str, on_sent=on_sent)
+        return
+    with NOTIFY_SECONDS.time():
+        notify(args, out_str)
+    if on_sent is not None:
+        on_sent()
+
+
+def record_alert(alert_state, flight_search, price_difference, trip_record=None):
+    """ Remembers an alert that was sent so it is not sent again (and saves the snapshot it was about) """
+    alert_state.mark_notified(flight_search, price_difference)
+    if trip_record is not None:
+        alert_state.save_snapshot(flight_search, trip_record)
+
+
+def alert_price_drops(args, results, alert_state, history, dispatcher=None):
+    """
+    Alerts when a search's cheapest flights are the lowest in --drop_window
+    days (--drop_lowest) or --drop_sigma standard deviations below their
+    typical price, judged against each flight's own fare history. Every
+    flight in results is evaluated in one batch
+    """
+    from .analytics import find_trip_drops
+    tasks = [x for x in results if not x.error and x.result]
+    drops = find_trip_drops(history, [x.result for x in tasks], args.drop_window, args.drop_lowest,
+                            args.drop_sigma, args.drop_min_observations)
+    for index, drop, out_str in drops:
+        flight_search = tasks[index].item
+        alert_key = 'drop {} {:.0f}'.format(','.join(drop.key), drop.latest)  # Once per flight and price
+        if alert_state.was_notified(flight_search, alert_key):
+            continue
+        send_alert(args, out_str, dispatcher, partial(record_alert, alert_state, flight_search, alert_key))
+
+
+def check_drop_args(args):
+    """ Exits if --drop_lowest/--drop_sigma are set without --history or numpy """
+    if not (args.drop_lowest or args.drop_sigma):
+        return
+    if not args.history:
+        sys.exit('--drop_lowest and --drop_sigma need fare history (--history)')
+    from .analytics import HAS_NUMPY  # numpy is only imported when drop alerts are enabled
+    if not HAS_NUMPY:
+        sys.exit('--drop_lowest and --drop_sigma require numpy (pip install numpy)')
+
+
+def check_stream_args(args):
+    """ Warns when --stream is set but every response has to be read whole anyway """
+    if not args.stream:
+        return
+    reasons = []
+    if not HAS_STREAMING:
+        reasons.append('ijson is not installed')
+    if args.cache_ttl > 0:
+        reasons.append('responses are cached (use --cache_ttl 0)')
+    if args.record or args.replay:
+        reasons.append('responses are captured by --record/--replay')
+    if args.history:
+        reasons.append('--history records every fare')
+    if args.logall:
+        reasons.append('--logall logs every flight')
+    if reasons:
+        logger.warning('--stream has no effect: {}'.format(', '.join(reasons)))
+
+
+def check_all_flights(args, flight_searches, alert_state, sw_api=None, history=None, dispatcher=None):
+    """
+    Checks all flights in flight_searches and notifies if price has dropped.
+    Searches sharing the same upstream query are fetched once per cycle and
+    requests are made concurrently (--workers), paced by rate_limiter
+    (--rate_limit); results are evaluated in watchlist order and returned
+    as TaskResults. Alerts go to dispatcher (NotificationDispatcher) as one
+    digest per cycle, or are sent inline if it is None. With --history,
+    --drop_lowest/--drop_sigma also alert on drops relative to fare history.
+    """
+    sw_api = sw_api or create_sw_api(args)
+    start_time = time.time()
+    results = find_cheapest_flights_coalesced(flight_searches, sw_api, max_workers=args.workers,
+                                              history=history)
+    cycle_time = time.time() - start_time
+    CYCLE_SECONDS.observe(cycle_time)
+    logstr = 'Checked {} flights in {:.1f} seconds'
+    logger.info(logstr.format(len(results), cycle_time))
+    if sw_api.cache is not None:
+        CACHE_HIT_RATE.set(sw_api.cache.hit_rate)
+        logger.info(sw_api.cache.stats_str())
+    if history is not None:
+        history.flush()
+        history.maintain(args.history_days)  # Once a day
+    alert_state.maintain()  # Once an hour
+    for task in results:
+        flight_search = task.item
+        if task.error:
+            logstr = 'Error checking {}: {}'
+            logger.error(logstr.format(flight_search, task.error))
+            continue
+        cheapest_flights = task.result
+        if not alert_state.snapshot_changed(flight_search, cheapest_flights):
+            logger.info('No change since last check for {}'.format(flight_search))
+            continue
         price_difference = get_price_difference(cheapest_flights)
-        if price_difference and price_difference not in price_notifications[flight_search]:
-            out_str = cheapest_flights.output_string
-            logger.info(out_str.replace('\n', ' '))
-            notify(args, out_str)
-            price_notifications[flight_search].add(price_difference)
+        if price_difference and not alert_state.was_notified(flight_search, price_difference):
+            # The snapshot is saved with the notification once the alert is sent, so an
+            # alert that fails to send is sent again next check
+            on_sent = partial(record_alert, alert_state, flight_search, price_difference, cheapest_flights)
+            try:
+                send_alert(args, cheapest_flights.output_string, dispatcher, on_sent)
+            except Exception:
+                logger.exception('Unable to send alert for {}'.format(flight_search))
+            continue
         elif price_difference:
             logger.info('User already notified about this price change (ignoring)')
+        alert_state.save_snapshot(flight_search, cheapest_flights)
+    if history is not None and (args.drop_lowest or args.drop_sigma):
+        alert_price_drops(args, results, alert_state, history, dispatcher)
+    if dispatcher is not None:
+        dispatcher.flush()
+    return results
+
+
+def setup_metrics(args):
+    """ Enables metrics if --metrics_port or --metrics_file is set """
+    if not (args.metrics_port or args.metrics_file):
+        return
+    enable_metrics()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.metrics_file:
+        start_metrics_dump(args.metrics_file, args.metrics_interval)
+
+
+def load_route_graph(args, sw_api):
+    """ Loads the route graph from --routes_file, or from SW if --refresh_routes """
+    if args.refresh_routes:
+        return refresh_route_graph(sw_api, args.routes_file)
+    if args.routes_file and os.path.exists(args.routes_file):
+        return get_route_graph(args.routes_file)
+    return get_route_graph()
+
+
+def run_fare_calendar(args, flight_searches, sw_api):
+    """ Logs a fare calendar for each search using --flex, --date_range and --flex_return """
+    date_range = None
+    if args.date_range:
+        date_range = [FlightSearch.convert_to_datetime(x) for x in args.date_range]
+        if None in date_range:
+            sys.exit('Date format does not match expected format mm/dd/yy')
+    for flight_search in flight_searches:
+        find_cheapest_dates(flight_search, sw_api, flex=args.flex, date_range=date_range,
+                            flex_return=args.flex_return, max_workers=args.workers)
+
+
+def run_top_trips(args, flight_searches, sw_api):
+    """ Logs the --top cheapest trips for each search, widening dates by --flex days """
+    constraints = PairingConstraints(min_nights=args.min_nights, max_nights=args.max_nights,
+                                     depart_after=args.depart_after, depart_before=args.depart_before,
+                                     return_after=args.return_after, return_before=args.return_before,
+                                     max_stops=args.max_stops)
+    for flight_search in flight_searches:
+        trip_records = find_top_trips(flight_search, args.top, constraints, sw_api,
+                                      flex=args.flex, max_workers=args.workers)
+        log_trip_table(trip_records)
+
+
+def wait_for_edits(args, watchlist, seconds):
+    """
+    Sleeps for seconds (forever if None), polling --multiple every
+    --reload_interval seconds. Returns a WatchlistDiff as soon as the file
+    is edited, or None once seconds have passed
+    """
+    end_time = None if seconds is None else time.time() + seconds
+    while True:
+        remaining = None if end_time is None else end_time - time.time()
+        if remaining is not None and remaining <= 0:
+            return None
+        if watchlist is None or not args.reload_interval:
+            time.sleep(remaining if remaining is not None else 3600)
+            continue
+        time.sleep(args.reload_interval if remaining is None else min(remaining, args.reload_interval))
+        diff = watchlist.poll()
+        if diff is not None and (diff.added or diff.removed):
+            return diff
+
+
+def apply_watchlist_diff(diff, add, remove):
+    """ Calls remove(flight_search) for removed rows then add(flight_search) for added rows """
+    for flight_search in diff.removed:
+        remove(flight_search)
+    for flight_search in diff.added:
+        add(flight_search)
+
+
+def create_scheduler(args, flight_searches):
+    """ Creates SearchScheduler from --frequency and --budget args """
+    return SearchScheduler(flight_searches, base_interval=60 * (args.frequency or 180),
+                           budget_per_hour=args.budget)
+
+
+def run_adaptive_schedule(args, flight_searches, alert_state, sw_api=None, history=None, dispatcher=None,
+                          watchlist=None):
+    """
+    Checks each search when the scheduler says it is due (runs forever).
+    Rows added to watchlist are scheduled immediately
+    """
+    scheduler = create_scheduler(args, flight_searches)
+    while True:
+        due = scheduler.pop_due()
+        if due:
+            try:
+                results = check_all_flights(args, due, alert_state, sw_api, history, dispatcher)
+            except Exception as err:  # Keep running; the searches are rescheduled as failed checks
+                logger.exception('Error checking flights')
+                results = [TaskResult(idx, x, None, err) for idx, x in enumerate(due)]
+            scheduler.record_results(results)
+        wait_time = scheduler.seconds_until_due()
+        if wait_time is not None:
+            logger.info('Waiting {:.0f} seconds before the next search is due'.format(wait_time))
+        diff = wait_for_edits(args, watchlist, wait_time)
+        if diff is not None:
+            apply_watchlist_diff(diff, scheduler.add, scheduler.remove)
+
+
+def run_daemon(args, flight_searches, sw_api, watchlist=None):
+    """
+    Checks flight_searches on the adaptive schedule while serving the
+    control API on --control_port, keeping the session, caches and alert
+    state warm between checks (runs until interrupted). Edits to watchlist
+    are applied as they are saved
+    """
+    alert_state = create_alert_state(args)
+    history = create_history(args)
+    dispatcher = create_dispatcher(args.twilio)
+
+    def check(due):
+        return check_all_flights(args, due, alert_state, sw_api, history, dispatcher)
+
+    def query(flight_search, top=None):
+        if top:
+            return find_top_trips(flight_search, int(top), PairingConstraints(), sw_api,
+                                  max_workers=args.workers)
+        return [x for x in [find_cheapest_flights(flight_search, sw_api)] if x]
+
+    daemon = TrackerDaemon(create_scheduler(args, flight_searches), check, sw_api)
+    server = serve_control_api(daemon, query, args.control_port)
+    if watchlist is not None and args.reload_interval:
+        def watch():
+            while True:
+                try:
+                    apply_watchlist_diff(wait_for_edits(args, watchlist, None), daemon.add,
+                                         lambda x: daemon.remove(get_search_key(x)))
+                except Exception:  # Keep watching; the next save is picked up again
+                    logger.exception('Error reloading {}'.format(watchlist.path))
+
+        threading.Thread(target=watch, name='watchlist-reload', daemon=True).start()
+    try:
+        daemon.run()
+    finally:
+        server.shutdown()
+        if dispatcher is not None:
+            dispatcher.close(timeout=60)
+
+
+def get_next_check(args, now=None):
+    """ Next check time for a search checked now (None if --frequency 0 makes it one-shot) """
+    if args.frequency == 0:
+        return None
+    return (now or time.time()) + 60 * (args.frequency or 180)
+
+
+def run_worker(args, work_queue, alert_state, sw_api=None, history=None, dispatcher=None,
+               worker_id=None, poll_interval=30):
+    """
+    Leases due searches from work_queue (--workers at a time), checks them
+    and reschedules them. With --frequency 0 every search is checked once
+    and the worker exits when nothing is left to lease
+    """
+    worker_id = worker_id or get_worker_id()
+    logger.info('Worker {} polling {}'.format(worker_id, work_queue.path))
+    while True:
+        leased = work_queue.lease(worker_id, args.workers, args.lease)
+        if not leased:
+            wait_time = work_queue.seconds_until_due()
+            if wait_time is None and args.frequency == 0:
+                logger.info('Nothing left to check. Worker {} exiting'.format(worker_id))
+                return
+            time.sleep(min(max(wait_time or poll_interval, 0.1), poll_interval))
+            continue
+        searches = [x[1] for x in leased]
+        try:
+            results = check_all_flights(args, searches, alert_state, sw_api, history, dispatcher)
+        except Exception as err:  # Keep running; the leases are released as failed checks
+            logger.exception('Error checking flights')
+            results = [TaskResult(idx, x, None, err) for idx, x in enumerate(searches)]
+        next_check = get_next_check(args)
+        for (search_id, flight_search), task in zip(leased, results):
+            work_queue.complete(worker_id, search_id, next_check, task.result, task.error)
+
+
+def run_worker_process(args):
+    """ Entry point of a --worker process (also used for --processes) """
+    sw_api = create_sw_api(args)
+    set_default_sw_api(sw_api)
+    work_queue = WorkQueue(args.queue)
+    dispatcher = create_dispatcher(args.twilio)
+    try:
+        run_worker(args, work_queue, create_alert_state(args), sw_api, create_history(args), dispatcher)
+    finally:
+        if dispatcher is not None:
+            dispatcher.close(timeout=60)
+        work_queue.close()
+
+
+def get_worker_args(args):
+    """ Copy of args that can be pickled for worker processes (without the parser's help callback) """
+    return argparse.Namespace(**{k: v for k, v in vars(args).items() if k != 'func'})
+
+
+def run_coordinator(args, flight_searches, stats_interval=60, watchlist=None):
+    """
+    Loads the watchlist into --queue and starts --processes local workers.
+    Workers on other hosts may use the same queue with --worker. Logs queue
+    stats (and applies edits to watchlist) until the queue and local
+    workers are done
+    """
+    work_queue = WorkQueue(args.queue)
+    num_removed = work_queue.sync(flight_searches)
+    logstr = 'Queued {} searches in {} ({} removed from a previous watchlist)'
+    logger.info(logstr.format(len(flight_searches), args.queue, num_removed))
+    processes = [multiprocessing.Process(target=run_worker_process, args=(get_worker_args(args),),
+                                         daemon=True)
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    while True:
+        stats = work_queue.stats()
+        logstr = 'Work queue: {searches} searches, {due} due, {leased} leased, {checks} checks done'
+        logger.info(logstr.format(**stats))
+        if not stats['searches'] or (processes and not any(x.is_alive() for x in processes)):
+            if stats['searches']:
+                logger.warning('Workers exited with {} searches left in the queue'.format(stats['searches']))
+            break
+        if not processes and args.frequency == 0:
+            break
+        time.sleep(stats_interval)
+        diff = watchlist.poll() if watchlist is not None and args.reload_interval else None
+        if diff is not None:
+            apply_watchlist_diff(diff, work_queue.add, work_queue.remove)
+    for process in processes:
+        process.join()
+    work_queue.close()
 
 
 def main():
@@ -67,20 +494,79 @@ def main():
         args.func(args)
         sys.exit()
 
-    flight_searches = create_flight_searches(args)
+    setup_metrics(args)
+    check_drop_args(args)
+    check_stream_args(args)
+    if (args.worker or args.coordinator) and not args.queue:
+        sys.exit('--worker and --coordinator need a work queue (--queue)')
+    if args.worker:  # Searches come from the queue, not the command line
+        run_worker_process(args)
+        sys.exit()
+
+    watchlist = create_watchlist(args)
+    if watchlist is not None:
+        flight_searches = watchlist.searches
+    elif args.daemon and not (args.origin or args.destination or args.depart_date):
+        # The daemon may start with an empty watchlist and be filled by flight_tracker_ctl
+        flight_searches = []
+    else:
+        flight_searches = create_flight_searches(args)
+    sw_api = create_sw_api(args)
+    set_default_sw_api(sw_api)
     if args.flight_finder:
-        find_all_destinations(flight_searches)
+        load_route_graph(args, sw_api)
+        find_all_destinations(flight_searches, args.workers, sw_api, top=args.top or None,
+                              time_budget=args.time_budget, max_requests=args.max_requests)
+        if sw_api.cache is not None:
+            logger.info(sw_api.cache.stats_str())
+        sys.exit()
+
+    if args.top:
+        run_top_trips(args, flight_searches, sw_api)
+        sys.exit()
+
+    if args.flex or args.date_range:
+        run_fare_calendar(args, flight_searches, sw_api)
+        sys.exit()
+
+    if args.coordinator:
+        run_coordinator(args, flight_searches, watchlist=watchlist)
+        sys.exit()
+
+    if args.daemon:
+        run_daemon(args, flight_searches, sw_api, watchlist)
         sys.exit()
 
-    price_notifications = defaultdict(set)
+    alert_state = create_alert_state(args)
+    history = create_history(args)
+    dispatcher = create_dispatcher(args.twilio)
+    if args.adaptive:
+        run_adaptive_schedule(args, flight_searches, alert_state, sw_api, history, dispatcher, watchlist)
     while True:
-        check_all_flights(args, flight_searches, price_notifications)
+        try:
+            check_all_flights(args, flight_searches, alert_state, sw_api, history, dispatcher)
+        except Exception:
+            if args.frequency == 0:
+                raise
+            logger.exception('Error checking flights (trying again next cycle)')
         if args.frequency == 0:
             logmsg = 'Frequency set to 0. Exiting'
             logger.info(logmsg)
+            if dispatcher is not None:
+                dispatcher.close(timeout=60)
             sys.exit()
         logger.info('Waiting {} minutes before checking again'.format(args.frequency))
-        time.sleep(60 * args.frequency)
+        next_cycle = time.time() + 60 * args.frequency
+        diff = wait_for_edits(args, watchlist, next_cycle - time.time())
+        while diff is not None:
+            # New rows are checked right away; the rest wait for the next cycle
+            flight_searches = watchlist.searches
+            if diff.added:
+                try:
+                    check_all_flights(args, diff.added, alert_state, sw_api, history, dispatcher)
+                except Exception:
+                    logger.exception('Error checking added flights (trying again next cycle)')
+            diff = wait_for_edits(args, watchlist, next_cycle - time.time())
 
 
 if __name__ == '__main__':
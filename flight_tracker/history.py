@@ -0,0 +1,158 @@
+""" Persistent fare history stored in SQLite """
+
+from datetime import datetime
+import threading
+import logging
+import sqlite3
+import time
+
+from .cache import make_key
+from .flight_table import from_timestamp
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fares (
+    search_key TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    depart_date TEXT NOT NULL,
+    depart_time INTEGER NOT NULL,
+    flight_numbers TEXT NOT NULL,
+    fare_class TEXT NOT NULL,
+    faretype TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    observed_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fares_flight
+    ON fares (origin, destination, depart_date, flight_numbers, observed_at);
+CREATE INDEX IF NOT EXISTS fares_search ON fares (search_key, observed_at);
+CREATE INDEX IF NOT EXISTS fares_observed ON fares (observed_at);
+"""
+
+
+class FareHistory(object):
+    """
+    Append-only store of every fare observed by the tracker. record() only
+    buffers observations in memory (safe to call from worker threads);
+    flush() writes the buffer in a single transaction, once per cycle.
+    Prices are stored per passenger in cents (USD) or points
+    """
+    def __init__(self, path):
+        self.path = path
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_maintained = None
+        # Worker processes may share path, so wait for each other's writes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def record(self, flight_search, flight_table, observed_at=None):
+        """ Buffers every row of flight_table (FlightTable) observed for flight_search """
+        observed_at = int(observed_at or time.time())
+        search_key = make_key(flight_search.request_key)
+        faretype = flight_search.faretype
+        rows = [(search_key, origin, destination, from_timestamp(depart_time).strftime('%Y-%m-%d'),
+                 depart_time, flight_numbers, fare_class, faretype, price, observed_at)
+                for origin, destination, depart_time, arrival_time, flight_numbers, price, fare_class
+                in flight_table.iter_columns()]
+        with self._lock:
+            self._pending.extend(rows)
+
+    def flush(self):
+        """ Writes buffered observations in one transaction; returns number written """
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if rows:
+                with self._conn:
+                    self._conn.executemany('INSERT INTO fares VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        if rows:
+            logger.info('Saved {} fares to history'.format(len(rows)))
+        return len(rows)
+
+    def batch_series(self, keys, since=None):
+        """
+        Lowest price per observation of many flights in one query. keys are
+        (origin, destination, depart_date, flight_numbers) tuples with flight
+        numbers comma separated. Returns [(key index, observed_at, price)]
+        ordered by key index then observed_at
+        """
+        sql = ('SELECT k.id, f.observed_at, MIN(f.price) FROM series_keys k JOIN fares f '
+               'ON f.origin = k.origin AND f.destination = k.destination AND f.depart_date = k.depart_date '
+               'AND f.flight_numbers = k.flight_numbers WHERE f.observed_at >= ? '
+               'GROUP BY k.id, f.observed_at ORDER BY k.id, f.observed_at')
+        with self._lock:
+            with self._conn:
+                self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS series_keys (id INTEGER PRIMARY KEY, '
+                                   'origin TEXT, destination TEXT, depart_date TEXT, flight_numbers TEXT)')
+                self._conn.execute('DELETE FROM series_keys')
+                self._conn.executemany('INSERT INTO series_keys VALUES (?, ?, ?, ?, ?)',
+                                       [(index,) + tuple(key) for index, key in enumerate(keys)])
+            return self._conn.execute(sql, (since or 0,)).fetchall()
+
+    def prune(self, retention_days=None):
+        """
+        Deletes fares for flights that have already departed and, if
+        retention_days is given, observations older than that
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self._lock, self._conn:
+            deleted = self._conn.execute('DELETE FROM fares WHERE depart_date < ?', (today,)).rowcount
+            if retention_days:
+                cutoff = int(time.time() - retention_days * 86400)
+                deleted += self._conn.execute('DELETE FROM fares WHERE observed_at < ?', (cutoff,)).rowcount
+        return deleted
+
+    def compact(self, older_than_days=7):
+        """
+        Collapses observations older than older_than_days to the lowest price
+        per flight per day. The freed pages are reused by later writes; run
+        vacuum() to return them to the file system
+        """
+        cutoff = int(time.time() - older_than_days * 86400)
+        with self._lock:
+            with self._conn:
+                self._conn.execute('CREATE TEMP TABLE compacted AS SELECT search_key, origin, destination, '
+                                   'depart_date, depart_time, flight_numbers, fare_class, faretype, '
+                                   'MIN(price) AS price, MIN(observed_at) AS observed_at FROM fares '
+                                   'WHERE observed_at < ? GROUP BY search_key, origin, destination, '
+                                   'depart_date, flight_numbers, faretype, observed_at / 86400', (cutoff,))
+                self._conn.execute('DELETE FROM fares WHERE observed_at < ?', (cutoff,))
+                self._conn.execute('INSERT INTO fares SELECT * FROM compacted')
+                self._conn.execute('DROP TABLE compacted')
+
+    def vacuum(self):
+        """
+        Rebuilds the file to reclaim space freed by prune() and compact().
+        Locks out every other process sharing the file while it runs, so it
+        is only done on request (--vacuum_history), never by maintain()
+        """
+        with self._lock:
+            self._conn.execute('VACUUM')
+
+    def maintain(self, retention_days=None, compact_days=7, interval=86400):
+        """
+        Runs prune() and compact() if they have not run in the last interval
+        seconds (safe to call every cycle). Returns True if they ran
+        """
+        now = time.time()
+        if self._last_maintained is not None and now - self._last_maintained < interval:
+            return False
+        self._last_maintained = now
+        try:
+            deleted = self.prune(retention_days)
+            self.compact(compact_days)
+        except sqlite3.Error as err:  # e.g. another process sharing the file is writing; try again tomorrow
+            logger.warning('Unable to maintain fare history: {}'.format(err))
+            return False
+        logger.info('Pruned {} fares from history and compacted fares older than {} days'.format(
+            deleted, compact_days))
+        return True
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
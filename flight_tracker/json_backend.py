@@ -0,0 +1,42 @@
+""" Pluggable JSON decoding: uses the fastest installed backend """
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+HAS_STREAMING = ijson is not None
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    loads = orjson.loads
+elif ujson is not None:
+    BACKEND = 'ujson'
+    loads = ujson.loads
+else:
+    BACKEND = 'json'
+    loads = json.loads
+
+
+def iter_items(fileobj, prefix):
+    """
+    Incrementally decodes fileobj (anything with read()) and yields each
+    object found at prefix (ijson syntax, e.g. 'data.items.item') without
+    building the full document. Requires ijson
+    """
+    if ijson is None:
+        raise ImportError('Streaming JSON parsing requires ijson (pip install ijson)')
+    return ijson.items(fileobj, prefix, use_float=True)
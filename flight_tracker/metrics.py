@@ -0,0 +1,258 @@
+""" Counters and histograms for the request/parse/notify pipeline
+
+Metrics are no-ops until enable() is called. They can be served in the
+Prometheus text format from a localhost HTTP endpoint and/or dumped to a
+JSON file periodically
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import logging
+import bisect
+import json
+import time
+import os
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class MetricsRegistry(object):
+    """ Collection of metrics; enabled is checked before any metric is updated """
+    def __init__(self):
+        self.enabled = False
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def to_prometheus(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.description))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            lines.extend(metric.prometheus_lines())
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        return {x.name: x.to_dict() for x in self.metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in pairs) + '}'
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, description, label_names=(), registry=REGISTRY):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.registry = registry
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _label_values(self, labels):
+        return tuple(str(labels.get(x, '')) for x in self.label_names)
+
+    def to_dict(self):
+        with self._lock:
+            items = list(self._values.items())
+        return {','.join(k) or '': self._value_dict(v) for k, v in items}
+
+    def _value_dict(self, value):
+        return value
+
+
+class Counter(_Metric):
+    """ Monotonically increasing count (per label values) """
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, format_labels(self.label_names, k), v) for k, v in items]
+
+
+class Gauge(Counter):
+    """ Value that is set rather than accumulated """
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._label_values(labels)] = value
+
+
+class _HistogramValue(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, num_buckets):
+        self.counts = [0] * num_buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """ Distribution of observed values over fixed upper bound buckets (per label values) """
+    type = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        _Metric.__init__(self, name, description, label_names, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._label_values(labels)
+        with self._lock:
+            hist = self._values.get(key)
+            if hist is None:
+                hist = self._values[key] = _HistogramValue(len(self.buckets) + 1)
+            hist.counts[bisect.bisect_left(self.buckets, value)] += 1
+            hist.sum += value
+            hist.count += 1
+
+    def time(self, **labels):
+        """ Context manager observing the seconds spent inside it """
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def _value_dict(self, hist):
+        return {'count': hist.count, 'sum': hist.sum,
+                'buckets': dict(zip([str(x) for x in self.buckets] + ['+Inf'], hist.counts))}
+
+    def prometheus_lines(self):
+        lines = []
+        with self._lock:
+            items = sorted((k, list(v.counts), v.sum, v.count) for k, v in self._values.items())
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names, key, [('le', bound)])
+                lines.append('{}_bucket{} {}'.format(self.name, labels, cumulative))
+            labels = format_labels(self.label_names, key)
+            lines.append('{}_sum{} {}'.format(self.name, labels, total))
+            lines.append('{}_count{} {}'.format(self.name, labels, count))
+        return lines
+
+
+class _Timer(object):
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+# Pipeline metrics
+HTTP_REQUESTS = Counter('flight_tracker_http_requests_total', 'Requests to the airline site',
+                        ['endpoint', 'status'])
+HTTP_SECONDS = Histogram('flight_tracker_http_request_seconds', 'Latency of requests to the airline site',
+                         ['endpoint'])
+HTTP_RETRIES = Counter('flight_tracker_http_retries_total', 'Requests retried after a failure',
+                       ['endpoint', 'reason'])
+CIRCUIT_OPEN = Gauge('flight_tracker_circuit_open', '1 while requests are paused by the circuit breaker')
+REQUEST_RATE = Gauge('flight_tracker_request_rate', 'Current (adaptive) requests per second allowed per host',
+                     ['host'])
+HTTP_BYTES = Counter('flight_tracker_http_received_bytes_total', 'Response bytes received', ['endpoint'])
+JSON_DECODE_SECONDS = Histogram('flight_tracker_json_decode_seconds', 'Time decoding flight search responses')
+PARSE_SECONDS = Histogram('flight_tracker_parse_seconds', 'Time parsing flight search responses')
+PARSED_ROWS = Counter('flight_tracker_parsed_rows_total', 'Flights parsed from responses (after filters)')
+EVALUATE_SECONDS = Histogram('flight_tracker_evaluate_seconds',
+                             'Time filtering and picking the cheapest flights for one search')
+NOTIFY_SECONDS = Histogram('flight_tracker_notification_seconds', 'Time sending one notification')
+NOTIFICATIONS = Counter('flight_tracker_notifications_total', 'Notification send attempts', ['status'])
+NOTIFY_QUEUE_DEPTH = Gauge('flight_tracker_notification_queue_depth', 'Notifications waiting to be sent')
+CYCLE_SECONDS = Histogram('flight_tracker_cycle_seconds', 'Duration of one check of the watchlist',
+                          buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+CACHE_HIT_RATE = Gauge('flight_tracker_cache_hit_rate', 'Response cache hit rate since start')
+
+
+def enable(registry=REGISTRY):
+    registry.enabled = True
+
+
+def serve_metrics(port, host='127.0.0.1', registry=REGISTRY):
+    """ Serves registry in the Prometheus text format at http://host:port/metrics from a daemon thread """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = HTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info('Serving metrics at http://{}:{}/metrics'.format(host, server.server_address[1]))
+    return server
+
+
+def dump_metrics(path, registry=REGISTRY):
+    """ Atomically writes registry as JSON to path """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as metrics_file:
+        json.dump(dict(registry.to_dict(), timestamp=time.time()), metrics_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def start_metrics_dump(path, interval=60, registry=REGISTRY):
+    """ Calls dump_metrics every interval seconds from a daemon thread """
+    def dump_forever():
+        while True:
+            time.sleep(interval)
+            try:
+                dump_metrics(path, registry)
+            except (IOError, OSError) as err:
+                logger.warning('Unable to write metrics to {}: {}'.format(path, err))
+
+    thread = threading.Thread(target=dump_forever, daemon=True)
+    thread.start()
+    return thread
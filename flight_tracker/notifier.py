@@ -0,0 +1,214 @@
+""" Background dispatcher that batches price alerts into one message per recipient """
+
+from collections import OrderedDict, namedtuple
+import threading
+import logging
+import random
+import queue
+import json
+import time
+
+from .metrics import NOTIFICATIONS, NOTIFY_QUEUE_DEPTH, NOTIFY_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+TWILIO_API = 'https://api.twilio.com'
+PLACEHOLDER_ACCOUNT = 'twilio_account'
+
+Notification = namedtuple('Notification', ['to', 'body', 'num_alerts', 'callbacks'])
+
+
+def load_twilio_config(path):
+    """
+    Reads a twilio.json style file once. Returns None if notifications are
+    disabled (path 'None'/'False') or the file still has placeholder values.
+    'to' may be a list or a comma separated string of numbers and an optional
+    'base_url' sends to a Twilio compatible endpoint instead of api.twilio.com
+    """
+    if path in (None, 'None', 'False'):
+        return None
+    with open(path, 'r') as config_file:
+        config = json.load(config_file)
+    if str(config.get('account')) == PLACEHOLDER_ACCOUNT:
+        logger.info('Please update twilio.json file for notifications.')
+        return None
+    recipients = config['to']
+    if not isinstance(recipients, list):
+        recipients = [x.strip() for x in str(recipients).split(',') if x.strip()]
+    config['to'] = [str(x) for x in recipients]
+    return config
+
+
+class TwilioSender(object):
+    """ Sends SMS through one reused twilio.rest.Client """
+    def __init__(self, config):
+        from twilio.rest import Client
+        logging.getLogger('twilio.http_client').setLevel(logging.WARNING)
+        self.from_ = str(config['from'])
+        self.client = Client(str(config['account']), str(config['auth_token']))
+
+    def send(self, to, body):
+        self.client.api.account.messages.create(to=to, from_=self.from_, body=body)
+
+
+class HttpSender(object):
+    """
+    Sends SMS by posting to the Twilio REST API (or a compatible stand-in at
+    base_url) over one pooled requests Session
+    """
+    def __init__(self, config, base_url=TWILIO_API, session=None, timeout=(5, 30)):
+        self.from_ = str(config['from'])
+        self.url = '{}/2010-04-01/Accounts/{}/Messages.json'.format(base_url.rstrip('/'), config['account'])
+        if session is None:
+            import requests
+            session = requests.Session()
+        self.session = session
+        self.session.auth = (str(config['account']), str(config['auth_token']))
+        self.timeout = timeout
+
+    def send(self, to, body):
+        response = self.session.post(self.url, data={'To': to, 'From': self.from_, 'Body': body},
+                                     timeout=self.timeout)
+        if response.status_code >= 300:
+            err = 'Notification failed with status code {}'
+            raise Exception(err.format(response.status_code))
+
+
+def call_once(func):
+    """ Wraps func so only the first of several calls (from any thread) runs it """
+    lock = threading.Lock()
+    called = []
+
+    def wrapper():
+        with lock:
+            if called:
+                return
+            called.append(True)
+        func()
+    return wrapper
+
+
+def create_sender(config):
+    if config.get('base_url'):
+        return HttpSender(config, config['base_url'])
+    return TwilioSender(config)
+
+
+class NotificationDispatcher(object):
+    """
+    Price alerts added with notify() are buffered until flush(), which queues
+    one digest per recipient for a background thread to send, so checking
+    flights never waits on the SMS provider. Failed sends are retried up to
+    max_retries times with jittered exponential backoff starting at backoff
+    seconds. An alert's on_sent callback runs (on the sender thread) once a
+    digest containing it has been sent to any recipient
+    """
+    def __init__(self, sender, recipients, max_retries=3, backoff=1.0, max_backoff=60.0):
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0}
+        self._stats_lock = threading.Lock()  # Updated by the caller and the sender thread
+        self.last_latency = None
+        self._pending = OrderedDict((x, []) for x in self.recipients)
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        """ Digests waiting to be sent """
+        return self._queue.qsize()
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def notify(self, price_alert, recipients=None, on_sent=None):
+        """
+        Buffers price_alert for every recipient (all configured recipients by
+        default). on_sent() is called once it has been sent
+        """
+        if on_sent is not None:
+            on_sent = call_once(on_sent)
+        with self._pending_lock:
+            for recipient in recipients or self.recipients:
+                self._pending.setdefault(recipient, []).append((price_alert, on_sent))
+
+    def flush(self):
+        """ Queues one digest per recipient of everything buffered since the last flush """
+        with self._pending_lock:
+            pending, self._pending = self._pending, OrderedDict((x, []) for x in self.recipients)
+        for recipient, alerts in pending.items():
+            if not alerts:
+                continue
+            header = '{} price alerts:\n\n'.format(len(alerts)) if len(alerts) > 1 else ''
+            body = header + '\n\n'.join(x[0] for x in alerts)
+            self._queue.put(Notification(recipient, body, len(alerts), [x[1] for x in alerts if x[1]]))
+            self._count('queued')
+        NOTIFY_QUEUE_DEPTH.set(self.queue_depth)
+
+    def _get_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _send(self, notification):
+        for attempt in range(self.max_retries + 1):
+            start_time = time.perf_counter()
+            try:
+                self.sender.send(notification.to, notification.body)
+            except Exception as err:
+                if attempt == self.max_retries:
+                    self._count('failed')
+                    NOTIFICATIONS.inc(status='failed')
+                    logger.error('Unable to notify {}: {}'.format(notification.to, err))
+                    return
+                delay = self._get_delay(attempt)
+                self._count('retries')
+                NOTIFICATIONS.inc(status='retry')
+                logstr = 'Notifying {} failed ({}), retrying in {:.1f} seconds'
+                logger.warning(logstr.format(notification.to, err, delay))
+                time.sleep(delay)
+                continue
+            self.last_latency = time.perf_counter() - start_time
+            NOTIFY_SECONDS.observe(self.last_latency)
+            NOTIFICATIONS.inc(status='sent')
+            self._count('sent')
+            logger.info('User notified ({} alerts).'.format(notification.num_alerts))
+            for on_sent in notification.callbacks:
+                try:
+                    on_sent()
+                except Exception:  # A failed callback never stops the sender
+                    logger.exception('Error recording sent notification')
+            return
+
+    def _run(self):
+        while True:
+            notification = self._queue.get()
+            try:
+                if notification is None:
+                    return
+                self._send(notification)
+            finally:
+                NOTIFY_QUEUE_DEPTH.set(self.queue_depth)
+                self._queue.task_done()
+
+    def close(self, timeout=None):
+        """ Flushes, waits up to timeout seconds for queued digests to be sent and stops the thread """
+        self.flush()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning('{} notifications were not sent'.format(self.queue_depth))
+
+
+def create_dispatcher(twilio_path, **kwargs):
+    """ NotificationDispatcher for a twilio.json style file (None if notifications are disabled) """
+    config = load_twilio_config(twilio_path)
+    if config is None:
+        return None
+    return NotificationDispatcher(create_sender(config), config['to'], **kwargs)
@@ -0,0 +1,156 @@
+""" Top-K selection of outbound/return flight pairs for round trips """
+
+from itertools import chain
+import logging
+import heapq
+
+from .concurrency import map_concurrently
+from .fare_calendar import get_date_window
+from .flight_records import TripRecord, get_paying_passengers
+from .flight_table import FlightTable, intern_code
+from .web_scraper import (FlightFilter, fetch_flight_data, get_default_sw_api, iter_flight_details,
+                          iter_flight_rows, parse_flight_data)
+
+
+logger = logging.getLogger(__name__)
+
+
+def time_to_seconds(text):
+    """ 'HH:MM' (24 hour) to seconds after midnight """
+    if not text:
+        return None
+    hour, minute = text.split(':')
+    return int(hour) * 3600 + int(minute) * 60
+
+
+class PairingConstraints(object):
+    """
+    Constraints on round trip pairs
+    min_nights/max_nights: nights between outbound and return departure dates
+    depart_after/depart_before: 'HH:MM' window for the outbound departure
+    return_after/return_before: 'HH:MM' window for the return departure
+    max_stops: maximum connections on each leg
+    """
+    def __init__(self, min_nights=None, max_nights=None, depart_after=None, depart_before=None,
+                 return_after=None, return_before=None, max_stops=None):
+        self.min_nights = min_nights
+        self.max_nights = max_nights
+        self.depart_window = (time_to_seconds(depart_after), time_to_seconds(depart_before))
+        self.return_window = (time_to_seconds(return_after), time_to_seconds(return_before))
+        self.max_stops = max_stops
+
+    def leg_indices(self, table, origin, window):
+        """ Rows of table departing from origin inside window that satisfy max_stops """
+        origin_id = intern_code(origin)
+        after, before = window
+        indices = []
+        for index, row_origin in enumerate(table.origins):
+            if row_origin != origin_id:
+                continue
+            if self.max_stops is not None and table.num_stops(index) > self.max_stops:
+                continue
+            time_of_day = table.depart_times[index] % 86400
+            if after is not None and time_of_day < after:
+                continue
+            if before is not None and time_of_day > before:
+                continue
+            indices.append(index)
+        return indices
+
+    def stay_ok(self, outbound_time, return_time):
+        nights = return_time // 86400 - outbound_time // 86400
+        if self.min_nights is not None and nights < self.min_nights:
+            return False
+        if self.max_nights is not None and nights > self.max_nights:
+            return False
+        return return_time > outbound_time
+
+
+def top_k_pairs(outbound, inbound, k, pair_ok):
+    """
+    outbound, inbound: lists of (price, item) sorted by price
+    Returns up to k (total price, outbound item, inbound item) with the
+    lowest total price among pairs where pair_ok(outbound item, inbound item).
+    Explores the sorted price grid from the cheapest corner with a heap, so
+    only pairs cheaper than the k-th result (plus rejected ones) are visited
+    rather than the full cross product
+    """
+    results = []
+    if not outbound or not inbound or k <= 0:
+        return results
+    heap = [(outbound[0][0] + inbound[0][0], 0, 0)]
+    seen = {(0, 0)}
+    while heap and len(results) < k:
+        total, i, j = heapq.heappop(heap)
+        if pair_ok(outbound[i][1], inbound[j][1]):
+            results.append((total, outbound[i][1], inbound[j][1]))
+        for next_i, next_j in ((i + 1, j), (i, j + 1)):
+            if next_i < len(outbound) and next_j < len(inbound) and (next_i, next_j) not in seen:
+                seen.add((next_i, next_j))
+                heapq.heappush(heap, (outbound[next_i][0] + inbound[next_j][0], next_i, next_j))
+    return results
+
+
+def get_leg_searches(flight_search, flex=0):
+    """
+    One way searches covering every outbound and return date within flex days
+    of flight_search's dates. n depart dates and m return dates cost n + m
+    requests instead of the n * m round trip searches of a fare calendar
+    """
+    searches = [flight_search.copy(depart_date=x.strftime('%Y-%m-%d'), return_date=None)
+                for x in get_date_window(flight_search.depart_date_dt, flex)]
+    if flight_search.return_date:
+        searches += [flight_search.copy(origin=flight_search.destination, destination=flight_search.origin,
+                                        depart_date=x.strftime('%Y-%m-%d'), return_date=None,
+                                        depart_time=flight_search.return_time_str)
+                     for x in get_date_window(flight_search.return_date_dt, flex)]
+    return searches
+
+
+def fetch_flight_table(flight_search, sw_api, flight_filter=None, flex=0, max_workers=4):
+    """ FlightTable of both legs of flight_search, searching one way legs concurrently if flex """
+    if not flex:
+        return parse_flight_data(fetch_flight_data(flight_search, sw_api), flight_search, flight_filter)
+    tasks = map_concurrently(lambda x: fetch_flight_data(x, sw_api), get_leg_searches(flight_search, flex),
+                             max_workers)
+    for task in tasks:
+        if task.error:
+            logger.warning('Unable to search {}: {}'.format(task.item, task.error))
+    return FlightTable.from_rows(chain.from_iterable(
+        iter_flight_rows(iter_flight_details(x.result), flight_filter) for x in tasks if not x.error),
+        flight_search)
+
+
+def find_top_trips(flight_search, k=5, constraints=None, sw_api=None, data=None, flex=0, max_workers=4):
+    """
+    Returns up to k TripRecords for flight_search ranked by price. Round trips
+    pair outbound and return flights subject to constraints (PairingConstraints);
+    one way searches return the k cheapest flights matching the outbound
+    constraints. flex widens both dates by up to flex days either side so
+    stay length constraints have something to choose from
+    """
+    constraints = constraints or PairingConstraints()
+    # Time windows differ per leg so only the leg independent filters are pushed down
+    flight_filter = FlightFilter(nonstop=flight_search.nonstop or constraints.max_stops == 0,
+                                 max_price=flight_search.max_price,
+                                 passengers=get_paying_passengers(flight_search))
+    if data is None:
+        table = fetch_flight_table(flight_search, sw_api or get_default_sw_api(), flight_filter,
+                                   flex, max_workers)
+    else:
+        table = parse_flight_data(data, flight_search, flight_filter)
+    prices = table.prices
+    outbound = sorted((prices[x], x) for x in
+                      constraints.leg_indices(table, flight_search.origin, constraints.depart_window))
+    if flight_search.triptype != 'roundtrip':
+        return [TripRecord([table[x]]) for price, x in outbound[:k]]
+    inbound = sorted((prices[x], x) for x in
+                     constraints.leg_indices(table, flight_search.destination, constraints.return_window))
+    depart_times = table.depart_times
+    pairs = top_k_pairs(outbound, inbound, k,
+                        lambda i, j: constraints.stay_ok(depart_times[i], depart_times[j]))
+    logstr = 'Found {} of the top {} pairs from {} outbound and {} return flights'
+    logger.info(logstr.format(len(pairs), k, len(outbound), len(inbound)))
+    trip_records = [TripRecord([table[i], table[j]]) for total, i, j in pairs]
+    # Pairs are cheapest first, so only the tail can be over max_price
+    return [x for x in trip_records if flight_search.max_price is None or x.price <= flight_search.max_price]
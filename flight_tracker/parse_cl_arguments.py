@@ -1,7 +1,9 @@
 """ Command line parser """
-import pkg_resources
 import argparse
 
+from .flight_records import parse_time_of_day
+from .utils import resource_filename
+
 
 script_name = 'flight_tracker'
 description = """
@@ -15,9 +17,19 @@ Track multiple flights:
 {0} -m multiple_flights.txt\n
 Find a destination:
 flight_tracker -o origin -l depart_date -ff [supports Track a Flight args]\n
+Run as a daemon (manage the watchlist with flight_tracker_ctl):
+{0} --daemon [-m multiple_flights.txt] [options]\n
 """
 description = description.format(script_name)
-twilio_file = pkg_resources.resource_filename(__name__, 'twilio.json')
+twilio_file = resource_filename('twilio.json')
+
+
+def time_of_day(text):
+    """ argparse type for HH:MM (24 hour) times """
+    try:
+        return parse_time_of_day(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a 24 hour HH:MM time, got {!r}'.format(text))
 
 
 def parse_cl_arguments():
@@ -33,10 +45,138 @@ def parse_cl_arguments():
                         type=float,
                         default=180,
                         help='Frequency (in minutes) for checking flights [%(default)s]')
+    parser.add_argument('-ad',
+                        '--adaptive',
+                        action='store_true',
+                        help=('Schedule each flight by days to departure, price volatility and\n'
+                              'distance from price point (--frequency is the typical interval)'))
+    parser.add_argument('-b',
+                        '--budget',
+                        metavar='',
+                        type=float,
+                        default=None,
+                        help='Maximum requests per hour when using --adaptive')
     parser.add_argument('-la',
                         '--logall',
                         action='store_true',
                         help='Write/print all available flights')
+    parser.add_argument('-w',
+                        '--workers',
+                        metavar='',
+                        type=int,
+                        default=4,
+                        help='Maximum number of concurrent requests [%(default)s]')
+    parser.add_argument('-rl',
+                        '--rate_limit',
+                        metavar='',
+                        type=float,
+                        default=0.5,
+                        help='Maximum requests per second to each host (0 disables) [%(default)s]')
+    parser.add_argument('-mnr',
+                        '--min_rate',
+                        metavar='',
+                        type=float,
+                        default=0.05,
+                        help='Lowest --rate_limit to back off to when throttled (0 keeps it fixed) [%(default)s]')
+    parser.add_argument('-re',
+                        '--retries',
+                        metavar='',
+                        type=int,
+                        default=3,
+                        help='Retries of throttled, 5xx and failed connections [%(default)s]')
+    parser.add_argument('-bo',
+                        '--backoff',
+                        metavar='',
+                        type=float,
+                        default=1.0,
+                        help='Seconds before the first retry, doubled after each (with jitter) [%(default)s]')
+    parser.add_argument('-cb',
+                        '--circuit_threshold',
+                        metavar='',
+                        type=int,
+                        default=5,
+                        help='Failures in a row that pause all requests (0 disables) [%(default)s]')
+    parser.add_argument('-cr',
+                        '--circuit_reset',
+                        metavar='',
+                        type=float,
+                        default=30,
+                        help='Seconds requests are paused before trying again [%(default)s]')
+    parser.add_argument('-ct',
+                        '--cache_ttl',
+                        metavar='',
+                        type=float,
+                        default=300,
+                        help='Seconds to reuse flight search responses (0 disables) [%(default)s]')
+    parser.add_argument('-cs',
+                        '--cache_size',
+                        metavar='',
+                        type=int,
+                        default=1024,
+                        help='Maximum number of responses cached in memory [%(default)s]')
+    parser.add_argument('-cf',
+                        '--cache_file',
+                        metavar='',
+                        default=None,
+                        help='SQLite file used to persist cached responses between runs')
+    parser.add_argument('-tc',
+                        '--connect_timeout',
+                        metavar='',
+                        type=float,
+                        default=5,
+                        help='Seconds to wait when connecting to the airline site [%(default)s]')
+    parser.add_argument('-tr',
+                        '--read_timeout',
+                        metavar='',
+                        type=float,
+                        default=30,
+                        help='Seconds to wait for a response from the airline site [%(default)s]')
+    parser.add_argument('-st',
+                        '--stream',
+                        action='store_true',
+                        help='Parse flight search responses as they arrive (requires ijson and --cache_ttl 0)')
+    parser.add_argument('-mt',
+                        '--metrics_port',
+                        metavar='',
+                        type=int,
+                        default=None,
+                        help='Serve Prometheus metrics on this localhost port')
+    parser.add_argument('-mf',
+                        '--metrics_file',
+                        metavar='',
+                        default=None,
+                        help='JSON file to periodically write metrics to')
+    parser.add_argument('-mi',
+                        '--metrics_interval',
+                        metavar='',
+                        type=float,
+                        default=60,
+                        help='Seconds between writes of --metrics_file [%(default)s]')
+    parser.add_argument('-rc',
+                        '--record',
+                        metavar='',
+                        default=None,
+                        help='JSONL file to append every request and raw response to')
+    parser.add_argument('-rp',
+                        '--replay',
+                        metavar='',
+                        default=None,
+                        help='Answer requests from a --record capture file instead of the airline site')
+    parser.add_argument('-hf',
+                        '--history',
+                        metavar='',
+                        default=None,
+                        help='SQLite file to save every observed fare to')
+    parser.add_argument('-hd',
+                        '--history_days',
+                        metavar='',
+                        type=float,
+                        default=365,
+                        help='Days of fare history to keep (0 keeps everything) [%(default)s]')
+    parser.add_argument('-hv',
+                        '--vacuum_history',
+                        action='store_true',
+                        help='Reclaim space freed in --history at startup (locks the file while it runs)')
     # Flight Tracker
     track_flight = parser.add_argument_group('Track a Flight')
     track_flight.add_argument('-o',
@@ -97,6 +237,21 @@ def parse_cl_arguments():
                               action='store_const',
                               const='True',
                               help='Companion booking (set passengers = 2, report price for 1)')
+    track_flight.add_argument('-da',
+                              '--depart_after',
+                              metavar='',
+                              type=time_of_day,
+                              help='Only track outbound flights departing at or after this time (HH:MM, 24 hour)')
+    track_flight.add_argument('-db',
+                              '--depart_before',
+                              metavar='',
+                              type=time_of_day,
+                              help='Only track outbound flights departing at or before this time (HH:MM, 24 hour)')
+    track_flight.add_argument('-mp',
+                              '--max_price',
+                              type=float,
+                              metavar='',
+                              help='Ignore trips priced above this amount (total for all passengers and\nflights, like --price_point)')
     track_flight.add_argument('-n',
                               '--flight_numbers',
                               metavar='',
@@ -104,12 +259,132 @@ def parse_cl_arguments():
                               nargs='+',
                               help=('Flight number (separate by spaces if separate flights,\n'
                                     'or commas if connecting flights)'))
+    # Flexible dates
+    flex_dates = parser.add_argument_group('Flexible Dates')
+    flex_dates.add_argument('-fx',
+                            '--flex',
+                            metavar='',
+                            type=int,
+                            default=0,
+                            help='Print a fare calendar for depart dates up to this many days either side')
+    flex_dates.add_argument('-dr',
+                            '--date_range',
+                            metavar='',
+                            nargs=2,
+                            help='Print a fare calendar for depart dates from start to end (mm/dd/yy)')
+    flex_dates.add_argument('-fr',
+                            '--flex_return',
+                            action='store_true',
+                            help='Also vary the return date by --flex days instead of keeping the trip length')
+    # Top trips
+    top_trips = parser.add_argument_group('Top Trips')
+    top_trips.add_argument('-tk',
+                           '--top',
+                           metavar='',
+                           type=int,
+                           default=0,
+                           help='Print this many of the cheapest trips (outbound/return pairs for round trips)')
+    top_trips.add_argument('-mnn',
+                           '--min_nights',
+                           metavar='',
+                           type=int,
+                           help='Minimum nights between outbound and return flights')
+    top_trips.add_argument('-mxn',
+                           '--max_nights',
+                           metavar='',
+                           type=int,
+                           help='Maximum nights between outbound and return flights')
+    top_trips.add_argument('-ra',
+                           '--return_after',
+                           metavar='',
+                           type=time_of_day,
+                           help='Only pair return flights departing at or after this time (HH:MM, 24 hour)')
+    top_trips.add_argument('-rb',
+                           '--return_before',
+                           metavar='',
+                           type=time_of_day,
+                           help='Only pair return flights departing at or before this time (HH:MM, 24 hour)')
+    top_trips.add_argument('-ms',
+                           '--max_stops',
+                           metavar='',
+                           type=int,
+                           help='Maximum connections on each flight')
+    # Distributed workers
+    workers = parser.add_argument_group('Distributed Workers')
+    workers.add_argument('-qf',
+                         '--queue',
+                         metavar='',
+                         default=None,
+                         help='SQLite work queue shared by the coordinator and workers')
+    workers.add_argument('-co',
+                         '--coordinator',
+                         action='store_true',
+                         help='Load the watchlist into --queue and start --processes workers')
+    workers.add_argument('-wk',
+                         '--worker',
+                         action='store_true',
+                         help='Check searches from --queue until it is empty')
+    workers.add_argument('-np',
+                         '--processes',
+                         metavar='',
+                         type=int,
+                         default=0,
+                         help='Worker processes started by --coordinator [%(default)s]')
+    workers.add_argument('-ls',
+                         '--lease',
+                         metavar='',
+                         type=float,
+                         default=300,
+                         help='Seconds a worker may hold searches before they are handed out again [%(default)s]')
+    # Daemon
+    daemon = parser.add_argument_group('Daemon')
+    daemon.add_argument('-dm',
+                        '--daemon',
+                        action='store_true',
+                        help='Keep running and accept watchlist changes from flight_tracker_ctl')
+    daemon.add_argument('-cp',
+                        '--control_port',
+                        metavar='',
+                        type=int,
+                        default=8765,
+                        help='Localhost port of the --daemon control API [%(default)s]')
     # Track multiple flights
     track_m_flights = parser.add_argument_group('Track Multiple Flights')
     track_m_flights.add_argument('-m',
                                  '--multiple',
                                  metavar='',
-                                 help='File containing multiple flights to track (header must contain argument names)')
+                                 help=('File containing multiple flights to track: tab separated or .csv (header must\n'
+                                       'contain argument names) or .jsonl (one object of arguments per line)'))
+    track_m_flights.add_argument('-ri',
+                                 '--reload_interval',
+                                 metavar='',
+                                 type=float,
+                                 default=30,
+                                 help='Seconds between checks of --multiple for edits (0 disables) [%(default)s]')
+    # Price drop alerts
+    drops = parser.add_argument_group('Price Drop Alerts (need --history and numpy)')
+    drops.add_argument('-dl',
+                       '--drop_lowest',
+                       action='store_true',
+                       help='Alert when a flight is the cheapest it has been in --drop_window days')
+    drops.add_argument('-ds',
+                       '--drop_sigma',
+                       metavar='',
+                       type=float,
+                       default=None,
+                       help='Alert when a flight is this many standard deviations below its typical price')
+    drops.add_argument('-dw',
+                       '--drop_window',
+                       metavar='',
+                       type=float,
+                       default=30,
+                       help='Days of fare history to compare against [%(default)s]')
+    drops.add_argument('-dn',
+                       '--drop_min_observations',
+                       metavar='',
+                       type=int,
+                       default=5,
+                       help='Earlier observations a flight needs before drop alerts [%(default)s]')
     # Notifications
     notifications = parser.add_argument_group('Notification Settings')
     notifications.add_argument('-a',
@@ -118,9 +393,40 @@ def parse_cl_arguments():
                                type=str,
                                default=twilio_file,
                                help='Twilio account config file [%(default)s]')
+    notifications.add_argument('-sf',
+                               '--state_file',
+                               metavar='',
+                               default=None,
+                               help=('SQLite file to remember sent notifications across restarts\n'
+                                     '(defaults to <queue>.alerts with --queue)'))
+    notifications.add_argument('-mn',
+                               '--max_notifications',
+                               metavar='',
+                               type=int,
+                               default=10000,
+                               help='Maximum number of sent notifications to remember [%(default)s]')
     find_flight = parser.add_argument_group('Find a Destination')
     find_flight.add_argument('-ff',
                              '--flight_finder',
                              action='store_true',
                              help='List cheapest flights for all available destinations (supports Track a Flight args)')
+    find_flight.add_argument('-rf',
+                             '--routes_file',
+                             metavar='',
+                             default=None,
+                             help='Route graph file to use instead of the bundled airport_routes.json')
+    find_flight.add_argument('-rr',
+                             '--refresh_routes',
+                             action='store_true',
+                             help='Download current routes from SW (and save them to --routes_file)')
+    find_flight.add_argument('-tb',
+                             '--time_budget',
+                             metavar='',
+                             type=float,
+                             help='Stop searching destinations after this many seconds')
+    find_flight.add_argument('-mr',
+                             '--max_requests',
+                             metavar='',
+                             type=int,
+                             help='Stop searching destinations after this many requests')
     return parser.parse_args()
@@ -0,0 +1,186 @@
+""" Error classification, retries and circuit breaking for requests to the airline site """
+
+from email.utils import parsedate_to_datetime
+import threading
+import logging
+import random
+import math
+import time
+
+from .metrics import CIRCUIT_OPEN
+
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_AFTER = 3600.0  # Longer (or unparseable) waits are capped to an hour
+
+
+class SWApiError(Exception):
+    """ Request to the airline site failed. retryable errors are worth another attempt """
+    retryable = False
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        Exception.__init__(self, message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class NetworkError(SWApiError):
+    """ Connection failed or timed out """
+    retryable = True
+
+
+class ThrottledError(SWApiError):
+    """ 429 Too Many Requests (or 503 with Retry-After): slow down """
+    retryable = True
+
+
+class UpstreamError(SWApiError):
+    """ 5xx from the site """
+    retryable = True
+
+
+class ClientError(SWApiError):
+    """ 4xx other than 429: the request itself is wrong, retrying will not help """
+
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds to wait from a Retry-After header (delay seconds or an HTTP
+    date), at most MAX_RETRY_AFTER. None if absent or invalid
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - (now or time.time())
+        except (TypeError, ValueError, OverflowError):
+            return None
+    if math.isnan(seconds):
+        return None
+    return min(MAX_RETRY_AFTER, max(0.0, seconds))
+
+
+def classify_response(response, expected):
+    """ SWApiError for a response whose status code is not in expected """
+    status_code = response.status_code
+    message = 'Invalid status code received. Expected {}. Received {}.'.format(expected, status_code)
+    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+    if status_code == 429 or (status_code == 503 and retry_after is not None):
+        return ThrottledError(message, status_code, retry_after)
+    if status_code >= 500:
+        return UpstreamError(message, status_code, retry_after)
+    return ClientError(message, status_code)
+
+
+class RetryPolicy(object):
+    """
+    Retries retryable SWApiErrors up to max_retries times. Delays grow
+    exponentially from backoff seconds (capped at max_backoff) with jitter so
+    concurrent workers do not retry in lockstep, and are never shorter than
+    the site's Retry-After. Errors asking for a longer wait than max_backoff
+    are not retried; the circuit breaker holds traffic instead
+    """
+    def __init__(self, max_retries=3, backoff=1.0, max_backoff=60.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def should_retry(self, error, attempt):
+        return (error.retryable and attempt < self.max_retries
+                and (error.retry_after or 0) <= self.max_backoff)
+
+    def get_delay(self, error, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        return max(delay, error.retry_after or 0)
+
+
+class CircuitBreaker(object):
+    """
+    Pauses every request once failure_threshold retryable failures happen in
+    a row (or the site asks for a pause with Retry-After). After
+    reset_timeout seconds one probe request is let through: success closes
+    the circuit, failure reopens it for twice as long (up to
+    max_reset_timeout). wait() blocks callers while the circuit is open
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=600.0):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._condition = threading.Condition()
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self._open_until
+
+    def wait(self):
+        """ Blocks until a request may be sent """
+        with self._condition:
+            while True:
+                remaining = self._open_until - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                elif self._probing:
+                    self._condition.wait()
+                else:
+                    if self._open_until:  # Half open: this request is the probe
+                        self._probing = True
+                    return
+
+    def _open(self, seconds):
+        was_open = self.is_open
+        self._open_until = max(self._open_until, time.monotonic() + seconds)
+        CIRCUIT_OPEN.set(1)
+        if not was_open:
+            self.opened += 1
+            logger.warning('Pausing all requests for {:.0f} seconds'.format(seconds))
+
+    def record_success(self):
+        with self._condition:
+            self.failures = 0
+            # A request sent before the circuit opened does not close it
+            if self._probing or (self._open_until and time.monotonic() >= self._open_until):
+                self._open_until = 0.0
+                self._probing = False
+                self.reset_timeout = self.base_reset_timeout
+                CIRCUIT_OPEN.set(0)
+                logger.info('Requests are succeeding again, resuming')
+                self._condition.notify_all()
+
+    def abandon(self):
+        """ The request failed for a reason unrelated to the site; let another request probe """
+        with self._condition:
+            if self._probing:
+                self._probing = False
+                self._condition.notify_all()
+
+    def record_failure(self, error):
+        """ Counts a failed request; non retryable errors mean the site is up """
+        with self._condition:
+            if not error.retryable:
+                was_probe, self._probing = self._probing, False
+                if was_probe:
+                    self._open_until = 0.0
+                    self.reset_timeout = self.base_reset_timeout
+                    CIRCUIT_OPEN.set(0)
+                    self._condition.notify_all()
+                return
+            self.failures += 1
+            if self._probing:
+                self._probing = False
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+                self._open(self.reset_timeout)
+            elif error.retry_after:
+                self._open(min(error.retry_after, self.max_reset_timeout))
+            elif self.failure_threshold and self.failures >= self.failure_threshold:
+                self.failures = 0
+                self._open(self.reset_timeout)
+            self._condition.notify_all()
@@ -0,0 +1,175 @@
+""" Indexed in-memory graph of the routes served by SW """
+
+import threading
+import logging
+import json
+
+from .json_backend import loads as json_loads
+from .utils import resource_filename
+
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FORMAT_VERSION = 1
+ROUTE_KEYS = ('display_name', 'federal_unit', 'routes_served')  # Per airport in airport_routes.json
+
+
+def iter_bits(bits):
+    """ Yields the index of every set bit in bits """
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+class RouteGraph(object):
+    """
+    Directed graph of airports. Airport codes are interned to integer ids and
+    each airport's destinations (and, reversed, its origins) are stored as an
+    integer bitmask over those ids, so lookups and one/two stop connections
+    are a handful of bitwise operations
+    """
+    def __init__(self, codes, display_names, federal_units, routes):
+        """ routes: list (indexed by id) of lists of destination ids """
+        self.codes = list(codes)
+        self.ids = {code: idx for idx, code in enumerate(self.codes)}
+        self.display_names = list(display_names)
+        self.federal_units = list(federal_units)
+        self.out_bits = [0] * len(self.codes)
+        self.in_bits = [0] * len(self.codes)
+        for origin_id, destination_ids in enumerate(routes):
+            for destination_id in destination_ids:
+                self.out_bits[origin_id] |= 1 << destination_id
+                self.in_bits[destination_id] |= 1 << origin_id
+
+    @classmethod
+    def from_route_dict(cls, route_dict):
+        """ Builds graph from data in the bundled airport_routes.json layout """
+        codes = sorted(set(route_dict).union(*[x['routes_served'] for x in route_dict.values()]))
+        ids = {code: idx for idx, code in enumerate(codes)}
+        empty = {'display_name': '', 'federal_unit': '', 'routes_served': []}
+        airports = [route_dict.get(code, empty) for code in codes]
+        return cls(codes,
+                   [x['display_name'] for x in airports],
+                   [x['federal_unit'] for x in airports],
+                   [[ids[y] for y in x['routes_served']] for x in airports])
+
+    @classmethod
+    def from_route_info(cls, text):
+        """
+        Builds graph from the text of SWApi.retrieve_flight_routes, which uses
+        the same layout as airport_routes.json
+        """
+        route_dict = json_loads(text)
+        if not isinstance(route_dict, dict) or not all(
+                isinstance(x, dict) and all(key in x for key in ROUTE_KEYS) for x in route_dict.values()):
+            raise ValueError('SW route map is not in the airport_routes.json layout')
+        return cls.from_route_dict(route_dict)
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a graph saved with save() """
+        with open(path, 'r') as graph_file:
+            data = json.load(graph_file)
+        if data.get('version') != GRAPH_FORMAT_VERSION:
+            raise ValueError('Unsupported route graph file: {}'.format(path))
+        return cls(data['codes'], data['display_names'], data['federal_units'], data['routes'])
+
+    def save(self, path):
+        """ Saves graph in a compact, pre-indexed format """
+        data = {'version': GRAPH_FORMAT_VERSION,
+                'codes': self.codes,
+                'display_names': self.display_names,
+                'federal_units': self.federal_units,
+                'routes': [list(iter_bits(x)) for x in self.out_bits]}
+        with open(path, 'w') as graph_file:
+            json.dump(data, graph_file, separators=(',', ':'))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.ids
+
+    def _codes(self, bits):
+        return [self.codes[x] for x in iter_bits(bits)]
+
+    def long_name(self, code):
+        """ 'City, State' style name used in output tables """
+        idx = self.ids[code]
+        return '{}, {}'.format(self.display_names[idx], self.federal_units[idx])
+
+    def serves(self, origin, destination):
+        """ True if SW flies from origin to destination """
+        return bool(self.out_bits[self.ids[origin]] >> self.ids[destination] & 1)
+
+    def destinations(self, origin):
+        return self._codes(self.out_bits[self.ids[origin]])
+
+    def origins(self, destination):
+        """ Reverse lookup: every airport with a route into destination """
+        return self._codes(self.in_bits[self.ids[destination]])
+
+    def reachable(self, origin, max_stops=1):
+        """ Every airport reachable from origin with at most max_stops connections """
+        origin_id = self.ids[origin]
+        seen = frontier = self.out_bits[origin_id]
+        for _ in range(max_stops):
+            next_frontier = 0
+            for idx in iter_bits(frontier):
+                next_frontier |= self.out_bits[idx]
+            frontier = next_frontier & ~seen
+            seen |= frontier
+        return self._codes(seen & ~(1 << origin_id))
+
+    def one_stop(self, origin, destination):
+        """ Connecting airports X with routes origin -> X -> destination """
+        origin_id, destination_id = self.ids[origin], self.ids[destination]
+        bits = self.out_bits[origin_id] & self.in_bits[destination_id]
+        return self._codes(bits & ~(1 << origin_id | 1 << destination_id))
+
+    def two_stop(self, origin, destination):
+        """ Connecting airport pairs (X, Y) with routes origin -> X -> Y -> destination """
+        origin_id, destination_id = self.ids[origin], self.ids[destination]
+        exclude = ~(1 << origin_id | 1 << destination_id)
+        second_stops = self.in_bits[destination_id] & exclude
+        pairs = []
+        for first_id in iter_bits(self.out_bits[origin_id] & exclude):
+            for second_id in iter_bits(self.out_bits[first_id] & second_stops & ~(1 << first_id)):
+                pairs.append((self.codes[first_id], self.codes[second_id]))
+        return pairs
+
+
+_route_graph = None
+_route_graph_path = None  # File _route_graph was loaded from or saved to
+_route_graph_lock = threading.Lock()
+
+
+def get_route_graph(path=None):
+    """
+    Returns the process-wide RouteGraph, building it on first use from the
+    bundled airport_routes.json. If path (a file written by RouteGraph.save)
+    is given and is not where the current graph came from, it is loaded
+    from path instead
+    """
+    global _route_graph, _route_graph_path
+    with _route_graph_lock:
+        if path and path != _route_graph_path:
+            _route_graph, _route_graph_path = RouteGraph.load(path), path
+        elif _route_graph is None:
+            routes_file = resource_filename('airport_routes.json')
+            with open(routes_file, 'r') as route_file:
+                _route_graph = RouteGraph.from_route_dict(json.load(route_file))
+        return _route_graph
+
+
+def refresh_route_graph(sw_api, path=None):
+    """ Rebuilds the process-wide RouteGraph from SW's route map (saving it to path) """
+    global _route_graph, _route_graph_path
+    route_graph = RouteGraph.from_route_info(sw_api.retrieve_flight_routes())
+    logger.info('Loaded {} airports from SW route map'.format(len(route_graph)))
+    if path:
+        route_graph.save(path)
+    with _route_graph_lock:
+        _route_graph, _route_graph_path = route_graph, path
+    return route_graph
@@ -0,0 +1,184 @@
+""" Adaptive scheduling of flight searches under a global request budget """
+
+from collections import deque
+from datetime import datetime
+import statistics
+import logging
+import heapq
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchStats(object):
+    """ Recent cheapest prices observed for one search """
+    def __init__(self, max_prices=10):
+        self.prices = deque(maxlen=max_prices)
+
+    def add(self, trip_record):
+        if trip_record:
+            self.prices.append(trip_record.price)
+
+    @property
+    def last_price(self):
+        return self.prices[-1] if self.prices else None
+
+    @property
+    def volatility(self):
+        """ Coefficient of variation of recent prices (0 if unknown) """
+        if len(self.prices) < 2:
+            return 0.0
+        mean = statistics.mean(self.prices)
+        return statistics.pstdev(self.prices) / mean if mean else 0.0
+
+
+class SearchScheduler(object):
+    """
+    Priority queue of flight searches ordered by their next check time.
+    Each search's interval starts at base_interval (seconds) and is scaled by
+    days to departure (closer is sooner), recent price volatility (volatile is
+    sooner) and distance of the last price from price_point (near or below
+    is sooner), clamped to [min_interval, max_interval]. All intervals are
+    stretched if the watchlist would exceed budget_per_hour requests, where
+    searches sharing a request_key count as one request. Searches whose
+    departure date has passed are dropped from the schedule
+    """
+    def __init__(self, flight_searches, base_interval=3 * 3600, budget_per_hour=None,
+                 min_interval=10 * 60, max_interval=24 * 3600):
+        self.base_interval = base_interval
+        self.budget_per_hour = budget_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget_scale = 1.0
+        self._queue = []
+        self._counter = 0
+        self._stats = {}
+        self._intervals = {}
+        # Spread the first checks out at the budgeted request rate
+        spacing = 3600.0 / budget_per_hour if budget_per_hour else 0
+        first_checks = {}
+        now = time.time()
+        for flight_search in flight_searches:
+            key = flight_search.request_key
+            if key not in first_checks:
+                first_checks[key] = now + spacing * len(first_checks)
+            self.add(flight_search, first_checks[key])
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, flight_search, next_check=None):
+        """ Schedules flight_search (immediately by default) unless it has departed """
+        if self.has_departed(flight_search):
+            logger.info('Not scheduling {} (departed)'.format(flight_search))
+            return
+        self._stats.setdefault(flight_search, SearchStats())
+        self._intervals[flight_search] = self.get_interval(flight_search)
+        self._push(flight_search, time.time() if next_check is None else next_check)
+
+    def iter_scheduled(self):
+        """ Yields (next check time, FlightSearch) for every scheduled search, in no particular order """
+        for next_check, _, flight_search in self._queue:
+            yield next_check, flight_search
+
+    def remove(self, flight_search):
+        self._stats.pop(flight_search, None)
+        self._intervals.pop(flight_search, None)
+        self._queue = [x for x in self._queue if x[2] is not flight_search]
+        heapq.heapify(self._queue)
+
+    @staticmethod
+    def has_departed(flight_search, now=None):
+        """ True once the day of flight_search's departure has passed """
+        return flight_search.depart_date_dt.date() < datetime.fromtimestamp(now or time.time()).date()
+
+    def _push(self, flight_search, next_check):
+        self._counter += 1
+        heapq.heappush(self._queue, (next_check, self._counter, flight_search))
+
+    def get_interval(self, flight_search, now=None):
+        """ Seconds between checks of flight_search before budget scaling """
+        now = now or time.time()
+        stats = self._stats.get(flight_search) or SearchStats()
+        interval = float(self.base_interval)
+        # Days to departure: ~1x a month out, down to 0.25x the week of, up to 4x far out
+        days_out = (flight_search.depart_date_dt - datetime.fromtimestamp(now)).days
+        interval *= min(4.0, max(0.25, days_out / 30.0))
+        # Volatility: a 10% coefficient of variation halves the interval
+        interval /= 1 + 10 * stats.volatility
+        # Distance from price point: checks get slower as the price moves away from it
+        if stats.last_price and flight_search.price_point:
+            distance = (stats.last_price - flight_search.price_point) / float(flight_search.price_point)
+            interval *= min(3.0, max(0.5, 1 + 2 * distance))
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _group_intervals(self):
+        """ Shortest interval of each group of searches sharing a request """
+        group_intervals = {}
+        for flight_search, interval in self._intervals.items():
+            key = flight_search.request_key
+            group_intervals[key] = min(interval, group_intervals.get(key, interval))
+        return group_intervals.values()
+
+    def _update_budget_scale(self):
+        """ Stretches all intervals so the expected request rate fits budget_per_hour """
+        if not self.budget_per_hour:
+            self.budget_scale = 1.0
+            return
+        requests_per_hour = sum(3600.0 / x for x in self._group_intervals())
+        self.budget_scale = max(1.0, requests_per_hour / self.budget_per_hour)
+
+    def seconds_until_due(self, now=None):
+        if not self._queue:
+            return None
+        return max(0.0, self._queue[0][0] - (now or time.time()))
+
+    def pop_due(self, now=None):
+        """
+        Removes and returns every search whose next check time has passed,
+        plus any search sharing a request with them (it costs nothing extra)
+        """
+        now = now or time.time()
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[2])
+        if due and self._queue:
+            due_keys = set(x.request_key for x in due)
+            remaining = []
+            for entry in self._queue:
+                if entry[2].request_key in due_keys:
+                    due.append(entry[2])
+                else:
+                    remaining.append(entry)
+            if len(remaining) != len(self._queue):
+                self._queue = remaining
+                heapq.heapify(self._queue)
+        return due
+
+    def record_results(self, results, now=None):
+        """ Reschedules searches from check_all_flights TaskResults """
+        now = now or time.time()
+        for task in results:
+            flight_search = task.item
+            if flight_search not in self._stats:  # Removed while being checked
+                continue
+            if self.has_departed(flight_search, now):
+                logger.info('Unscheduling {} (departed)'.format(flight_search))
+                self._stats.pop(flight_search)
+                self._intervals.pop(flight_search)
+                continue
+            self._stats[flight_search].add(task.result)
+            self._intervals[flight_search] = self.get_interval(flight_search, now)
+        self._update_budget_scale()
+        for task in results:
+            flight_search = task.item
+            if flight_search in self._intervals:
+                self._push(flight_search, now + self._intervals[flight_search] * self.budget_scale)
+        logstr = 'Scheduled {} searches ({:.1f} requests/hour, budget scale {:.2f})'
+        logger.info(logstr.format(len(self._queue), self.requests_per_hour, self.budget_scale))
+
+    @property
+    def requests_per_hour(self):
+        """ Expected upstream requests per hour with the current schedule """
+        return sum(3600.0 / (x * self.budget_scale) for x in self._group_intervals())
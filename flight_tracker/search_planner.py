@@ -0,0 +1,67 @@
+""" Plans requests so that searches sharing an upstream query are fetched once """
+
+from collections import OrderedDict
+import logging
+
+from .concurrency import TaskResult, run_concurrently
+from .metrics import EVALUATE_SECONDS
+from .web_scraper import fetch_flight_data, find_cheapest_flights, parse_flight_data
+
+
+logger = logging.getLogger(__name__)
+
+
+def group_by_request(flight_searches):
+    """
+    Groups flight_searches by request_key. Searches that only differ in local
+    filters (price_point, nonstop, flight_numbers, logall, ...) share a group
+    key: request_key
+    value: list of (index, FlightSearch) tuples in watchlist order
+    """
+    groups = OrderedDict()
+    for idx, flight_search in enumerate(flight_searches):
+        groups.setdefault(flight_search.request_key, []).append((idx, flight_search))
+    return groups
+
+
+def _search_group(group, sw_api, history=None):
+    """
+    Fetches data for group once and applies each search's filters to it.
+    If history (FareHistory) is given, every fare in the response is recorded
+    """
+    if len(group) == 1 and history is None and sw_api.can_stream:  # Nothing to share; stream it
+        idx, flight_search = group[0]
+        return [TaskResult(idx, flight_search, find_cheapest_flights(flight_search, sw_api), None)]
+    data = fetch_flight_data(group[0][1], sw_api)
+    if history is not None:
+        history.record(group[0][1], parse_flight_data(data, group[0][1]))
+    results = []
+    for idx, flight_search in group:
+        try:
+            with EVALUATE_SECONDS.time():
+                trip_record = find_cheapest_flights(flight_search, data=data)
+            results.append(TaskResult(idx, flight_search, trip_record, None))
+        except Exception as err:
+            results.append(TaskResult(idx, flight_search, None, err))
+    return results
+
+
+def find_cheapest_flights_coalesced(flight_searches, sw_api, max_workers=4, history=None):
+    """
+    Finds the cheapest flights for every search, issuing a single request
+    per group of identical upstream queries. Returns a list of TaskResult
+    (index, flight_search, TripRecord, error) in the order of flight_searches.
+    Observed fares are buffered in history (FareHistory) if given
+    """
+    groups = group_by_request(flight_searches)
+    logstr = 'Coalesced {} flight searches into {} requests'
+    logger.info(logstr.format(len(flight_searches), len(groups)))
+    results = []
+    for task in run_concurrently(lambda x: _search_group(x, sw_api, history),
+                                 list(groups.values()), max_workers):
+        if task.error:
+            results.extend(TaskResult(idx, flight_search, None, task.error)
+                           for idx, flight_search in task.item)
+        else:
+            results.extend(task.result)
+    return sorted(results, key=lambda x: x.index)
@@ -1,12 +1,20 @@
 """ Utils for flight_tracker"""
 
-from twilio.rest import Client
 import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
+def resource_filename(name):
+    """
+    Path of a data file installed alongside the package (same result as
+    pkg_resources.resource_filename without the cost of importing it)
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+
 def create_table(header, data):
     output = [header] + data
     tab_length = 4
@@ -27,6 +35,7 @@ def notify(args, price_alert):
     if twilio_dict['account'] == 'twilio_account':
         logger.info('Please update twilio.json file for notifications.')
     else:
+        from twilio.rest import Client
         client = Client(twilio_dict['account'], twilio_dict['auth_token'])
         client.api.account.messages.create(
             to=twilio_dict['to'],
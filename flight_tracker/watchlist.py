@@ -0,0 +1,238 @@
+""" Streaming TSV/CSV/JSONL watchlist loader that can reload a file incrementally """
+
+from collections import OrderedDict, namedtuple
+import logging
+import json
+import csv
+import sys
+import os
+
+from .alert_state import get_search_key
+from .flight_records import SEARCH_FIELDS, FlightSearch, parse_time_of_day
+
+
+logger = logging.getLogger(__name__)
+
+TIMES_OF_DAY = ('ALL_DAY', 'BEFORE_NOON', 'NOON_TO_SIX', 'AFTER_SIX')
+
+BadRow = namedtuple('BadRow', ['line', 'error', 'text'])
+WatchlistDiff = namedtuple('WatchlistDiff', ['added', 'removed', 'bad_rows'])
+
+
+def get_search_defaults(args):
+    """ FlightSearch arguments taken from the command line for columns a file leaves out """
+    return {k: getattr(args, k) for k in SEARCH_FIELDS if hasattr(args, k)}
+
+
+def get_file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    return 'csv' if extension == '.csv' else 'tsv'
+
+
+def parse_flight_numbers(value):
+    """ '2506,2568 874' (or a list of those, lists or ints) to [[2506, 2568], [874]] """
+    if not value:
+        return None
+    if not isinstance(value, list):
+        value = str(value).split(' ')
+    return [list(map(int, x)) if isinstance(x, list) else list(map(int, str(x).split(',')))
+            for x in value if x not in ('', None)]
+
+
+def _clean(value):
+    """ Empty cells and the 'false' placeholder used by tab separated watchlists mean unset """
+    if isinstance(value, str):
+        value = value.strip()
+        if not value or 'false' in value.lower():
+            return None
+    return value
+
+
+def create_search_from_row(row, defaults):
+    """
+    FlightSearch from one row (dict of column -> value) on top of defaults.
+    Raises ValueError describing the first problem with the row
+    """
+    fields = dict(defaults)
+    for column, value in row.items():
+        if column in SEARCH_FIELDS:
+            fields[column] = _clean(value)
+    if not (fields.get('origin') and fields.get('destination') and fields.get('depart_date')):
+        raise ValueError('origin, destination and depart_date are required')
+    fields['origin'] = str(fields['origin']).upper()
+    fields['destination'] = str(fields['destination']).upper()
+    for column in ('depart_time', 'return_time'):
+        fields[column] = str(fields.get(column) or 'ALL_DAY').upper()
+        if fields[column] not in TIMES_OF_DAY:
+            raise ValueError('{} must be one of {}'.format(column, ', '.join(TIMES_OF_DAY)))
+    fields['faretype'] = str(fields.get('faretype') or 'POINTS').upper()
+    if fields['faretype'] not in ('POINTS', 'USD'):
+        raise ValueError('faretype must be POINTS or USD')
+    for column in ('depart_after', 'depart_before'):
+        if fields.get(column):
+            try:
+                fields[column] = parse_time_of_day(fields[column])
+            except ValueError:
+                raise ValueError('{} must be HH:MM'.format(column))
+    try:
+        fields['price_point'] = int(float(fields.get('price_point') or 0))
+        fields['passengers'] = int(fields.get('passengers') or 1)
+        fields['senior_passengers'] = int(fields.get('senior_passengers') or 0)
+        if fields.get('max_price') is not None:
+            fields['max_price'] = float(fields['max_price'])
+        fields['flight_numbers'] = parse_flight_numbers(fields.get('flight_numbers'))
+    except (TypeError, ValueError) as err:
+        raise ValueError('Invalid number ({})'.format(err))
+    flight_search = FlightSearch(**fields)
+    if not flight_search.depart_date_dt or (flight_search.return_date and not flight_search.return_date_dt):
+        raise ValueError('Date format does not match expected format mm/dd/yy')
+    return flight_search
+
+
+class _RowReader(object):
+    """ Turns lines of a TSV/CSV (after its header) or JSONL file into row dicts """
+    def __init__(self, file_format):
+        self.file_format = file_format
+        self.header = None
+
+    def read_header(self, line):
+        """ Returns False if line is not a header (JSONL has none) """
+        if self.file_format == 'jsonl':
+            return False
+        self.header = self._split(line)
+        unknown = [x for x in self.header if x not in SEARCH_FIELDS]
+        if unknown:
+            logger.warning('Ignoring unknown watchlist columns: {}'.format(', '.join(unknown)))
+        return True
+
+    def _split(self, line):
+        if self.file_format == 'tsv':
+            return [x.strip() for x in line.split('\t')]
+        return [x.strip() for x in next(csv.reader([line]))]
+
+    def read_row(self, line):
+        if self.file_format == 'jsonl':
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError('Expected a JSON object')
+            return row
+        values = self._split(line)
+        if len(values) != len(self.header):
+            raise ValueError('Expected {} fields but found {} (use true/false when applicable)'.format(
+                len(self.header), len(values)))
+        return dict(zip(self.header, values))
+
+
+class Watchlist(object):
+    """
+    Searches from a TSV (the original -m format), CSV or JSONL file, read a
+    line at a time. Rows that fail validation are reported in bad_rows and
+    skipped. reload() diffs the file against the previous load: unchanged
+    lines keep their FlightSearch objects (and are not parsed again), so
+    callers only apply the added and removed searches. A changed row is a
+    removal plus an addition
+    """
+    def __init__(self, path, defaults=None):
+        self.path = path
+        self.defaults = defaults or {}
+        self.file_format = get_file_format(path)
+        self.bad_rows = []
+        self._searches = OrderedDict()  # search key -> FlightSearch
+        self._by_line = {}  # line text -> (search key, FlightSearch)
+        self._stat = None
+        self._pending_stat = None
+        self._header = None
+
+    def __len__(self):
+        return len(self._searches)
+
+    @property
+    def searches(self):
+        return list(self._searches.values())
+
+    def _get_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def reload(self):
+        """
+        Reads the file and returns a WatchlistDiff against the previous load.
+        Raises OSError if the file cannot be read (the previous load is kept)
+        """
+        stat = self._get_stat()
+        reader = _RowReader(self.file_format)
+        searches = OrderedDict()
+        by_line = {}
+        bad_rows = []
+        with open(self.path, 'r') as watchlist_file:
+            for line_number, line in enumerate(watchlist_file, 1):
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                if reader.header is None and reader.read_header(line):
+                    if reader.header != self._header:  # Same line text may now mean something else
+                        self._by_line = {}
+                    continue
+                entry = self._by_line.get(line) or by_line.get(line)
+                if entry is None:
+                    try:
+                        flight_search = create_search_from_row(reader.read_row(line), self.defaults)
+                    except Exception as err:  # A bad row never stops the rest of the file loading
+                        bad_rows.append(BadRow(line_number, str(err), line))
+                        continue
+                    entry = (get_search_key(flight_search), flight_search)
+                by_line[line] = entry
+                searches.setdefault(*entry)
+        added = [v for k, v in searches.items() if k not in self._searches]
+        removed = [v for k, v in self._searches.items() if k not in searches]
+        self._searches, self._by_line, self.bad_rows = searches, by_line, bad_rows
+        self._header = reader.header
+        self._stat = stat
+        for bad_row in bad_rows:
+            logger.warning('Skipping {} line {}: {}'.format(self.path, bad_row.line, bad_row.error))
+        return WatchlistDiff(added, removed, bad_rows)
+
+    def poll(self):
+        """
+        Reloads the file if it changed since the last load and was not
+        changed again within the last poll (so half written saves are
+        skipped). Returns a WatchlistDiff or None
+        """
+        stat = self._get_stat()
+        if stat is None or stat == self._stat:
+            return None
+        if stat != self._pending_stat:
+            self._pending_stat = stat
+            return None
+        try:
+            diff = self.reload()
+        except OSError as err:  # Deleted or replaced between stat and open; try again next poll
+            logger.warning('Unable to reload {}: {}'.format(self.path, err))
+            return None
+        logstr = 'Reloaded {}: {} added, {} removed, {} bad rows ({} searches)'
+        logger.info(logstr.format(self.path, len(diff.added), len(diff.removed), len(diff.bad_rows), len(self)))
+        return diff
+
+
+def load_watchlist(path, defaults=None):
+    """ Loads path into a Watchlist, logging how many searches were collected """
+    watchlist = Watchlist(path, defaults)
+    watchlist.reload()
+    logstr = 'Collected {} flights to track from file ({} bad rows skipped)'
+    logger.info(logstr.format(len(watchlist), len(watchlist.bad_rows)))
+    return watchlist
+
+
+def create_watchlist(args):
+    """ Watchlist loaded from --multiple (None when tracking a single flight); exits if it has no valid rows """
+    if not args.multiple:
+        return None
+    watchlist = load_watchlist(args.multiple, get_search_defaults(args))
+    if not len(watchlist):
+        sys.exit('No valid flights to track in {}'.format(args.multiple))
+    return watchlist
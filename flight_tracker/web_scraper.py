@@ -2,55 +2,158 @@
 
 from collections import OrderedDict
 from datetime import datetime
-import pkg_resources
+from urllib.parse import urlparse
+import threading
 import logging
-import requests
+import heapq
 import json
-
+import time
 
 from .flight_records import (
-    FlightRecord,
-    TripRecord
+    TripRecord,
+    get_paying_passengers,
+    parse_time_of_day
 )
+from .flight_table import FlightTable
+from .cache import make_key
+from .concurrency import run_concurrently
+from .json_backend import HAS_STREAMING, iter_items
+from .route_graph import get_route_graph
+from .json_backend import loads as json_loads
+from .metrics import (HTTP_BYTES, HTTP_REQUESTS, HTTP_RETRIES, HTTP_SECONDS, JSON_DECODE_SECONDS,
+                      PARSE_SECONDS, PARSED_ROWS)
+from .resilience import NetworkError, SWApiError, ThrottledError, classify_response
 from .utils import create_table
 
-# Suppress insecure requests (issue with MacOS/Python3.6)
-try:
-    from requests.packages.urllib3.exceptions import InsecureRequestWarning
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-except ImportError:
-    pass
-
 logger = logging.getLogger(__name__)
 
+FLIGHT_DETAILS_PREFIX = 'data.searchResults.airProducts.item.details.item'
+
+
+def create_session(pool_size=10):
+    """
+    Creates a requests Session with a keep-alive connection pool of
+    pool_size connections per host that accepts compressed responses
+    """
+    # requests is imported here so commands that never scrape start quickly
+    import requests
+    # Suppress insecure requests (issue with MacOS/Python3.6)
+    try:
+        from requests.packages.urllib3.exceptions import InsecureRequestWarning
+        requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+    except ImportError:
+        pass
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate',
+                            'Connection': 'keep-alive'})
+    return session
+
 
 class SWApi(object):
-    """ API wrapper for querying flights """
-    def __init__(self):
-        self._session = requests.Session()
-        self.base_url = 'https://www.southwest.com/'
+    """
+    API wrapper for querying flights. An SWApi (and its pooled session) is
+    safe to share between threads and should be reused for all requests
+    timeout: (connect, read) timeout in seconds for every request
+    base_url: site to query (e.g. a local stand-in for offline benchmarks)
+    recorder: CaptureRecorder that every fetched response is written to
+    replay: CaptureReplay that answers every request instead of the network
+    retry_policy: RetryPolicy for throttled, 5xx and network failures (no retries if None)
+    circuit_breaker: CircuitBreaker pausing all requests while the site is failing
+    Failed requests raise SWApiError subclasses (see resilience)
+    """
+    def __init__(self, rate_limiter=None, cache=None, session=None, timeout=(5, 30),
+                 stream=False, base_url='https://www.southwest.com/', recorder=None, replay=None,
+                 retry_policy=None, circuit_breaker=None):
+        self._session = session or create_session()
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.cache = cache
+        self.timeout = timeout
+        self.stream = stream
+        self.base_url = base_url
+        self.recorder = recorder
+        self.replay = replay
         self.flights_api = 'api/air-booking/v1/air-booking/page/air/booking/shopping'
         self.flight_routes = 'fragments/generated/route_map/routeInfo_1_1.json'
         self.success_codes = [200]
 
-    def _check_status_code(self, response):
-        status_code = response.status_code
-        if status_code not in self.success_codes:
-            # print(response.text)
-            err = 'Invalid status code received. Expected {}. Received {}.'
-            raise Exception(err.format(self.success_codes, status_code))
-        else:
-            return response.text
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter:
+            with self.rate_limiter.limit(urlparse(url).netloc):
+                return self._session.request(method, url, verify=False, **kwargs)
+        return self._session.request(method, url, verify=False, **kwargs)
+
+    def _endpoint_name(self, url):
+        return 'flights' if self.flights_api in url else 'routes'
+
+    def _send_once(self, method, url, endpoint, **kwargs):
+        """ One attempt: returns a successful response or raises SWApiError """
+        start_time = time.perf_counter()
+        try:
+            response = self._send(method, url, **kwargs)
+        except IOError as err:  # requests.RequestException and socket errors
+            HTTP_REQUESTS.inc(endpoint=endpoint, status='error')
+            raise NetworkError('{} {} failed: {}'.format(method, endpoint, err))
+        HTTP_SECONDS.observe(time.perf_counter() - start_time, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        if response.status_code not in self.success_codes:
+            response.close()
+            raise classify_response(response, self.success_codes)
+        return response
+
+    def _send_with_retries(self, method, url, **kwargs):
+        """
+        Sends a request, waiting while the circuit breaker is open and
+        retrying retryable failures per retry_policy. Throttling lowers the
+        host's request rate; successes let it recover
+        """
+        endpoint = self._endpoint_name(url)
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.wait()
+            try:
+                response = self._send_once(method, url, endpoint, **kwargs)
+            except SWApiError as err:
+                error = err
+            except BaseException:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.abandon()
+                raise
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                if self.rate_limiter is not None:
+                    self.rate_limiter.succeeded(host)
+                return response
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure(error)
+            if isinstance(error, ThrottledError) and self.rate_limiter is not None:
+                self.rate_limiter.throttled(host)
+            if self.retry_policy is None or not self.retry_policy.should_retry(error, attempt):
+                raise error
+            delay = self.retry_policy.get_delay(error, attempt)
+            HTTP_RETRIES.inc(endpoint=endpoint, reason=type(error).__name__)
+            logger.warning('{} (attempt {}), retrying in {:.1f} seconds'.format(error, attempt + 1, delay))
+            time.sleep(delay)
+            attempt += 1
+
+    def _request(self, method, url, **kwargs):
+        response = self._send_with_retries(method, url, **kwargs)
+        HTTP_BYTES.inc(len(response.content), endpoint=self._endpoint_name(url))
+        return response.text
 
     def post(self, url, **kwargs):
-        response = self._session.post(url, verify=False, **kwargs)
-        result = self._check_status_code(response)
-        return result
+        return self._request('POST', url, **kwargs)
 
     def get(self, url):
-        response = self._session.get(url, verify=False)
-        result = self._check_status_code(response)
-        return result
+        return self._request('GET', url)
 
     def _get_url(self, api):
         return self.base_url + api
@@ -64,13 +167,75 @@ class SWApi(object):
                 'user-agent': 'Chrome',
                 }
 
+    def _cached(self, endpoint, request_text, fetch):
+        key = make_key(request_text)
+        if self.replay is not None:
+            return self.replay.get(endpoint, key)
+        if self.recorder is not None:
+            fetch = self._recorded(endpoint, key, request_text, fetch)
+        if self.cache is None:
+            return fetch()
+        return self.cache.get_or_fetch(endpoint, key, fetch)
+
+    def _recorded(self, endpoint, key, request_text, fetch):
+        def fetch_and_record():
+            response = fetch()
+            self.recorder.record(endpoint, key, request_text, response)
+            return response
+        return fetch_and_record
+
     def retrieve_raw_flight_data(self, search_data):
         flight_api_url = self._get_url(self.flights_api)
-        return self.post(flight_api_url, data=json.dumps(search_data), headers=self._get_headers())
+        request_text = json.dumps(search_data, sort_keys=True, separators=(',', ':'))
+        return self._cached('flights', request_text,
+                            lambda: self.post(flight_api_url, data=json.dumps(search_data),
+                                              headers=self._get_headers()))
+
+    @property
+    def can_stream(self):
+        """ Streaming is used when requested, ijson is installed and responses aren't cached or captured """
+        return (self.stream and HAS_STREAMING and self.cache is None and self.recorder is None
+                and self.replay is None)
+
+    def stream_flight_details(self, search_data):
+        """
+        Generator yielding each flight in searchResults.airProducts[*].details[*]
+        as it is decoded from the response body, so the full payload is never
+        held in memory
+        """
+        flight_api_url = self._get_url(self.flights_api)
+        response = self._send_with_retries('POST', flight_api_url, data=json.dumps(search_data),
+                                           headers=self._get_headers(), stream=True)
+        try:
+            response.raw.decode_content = True
+            for flight in iter_items(response.raw, FLIGHT_DETAILS_PREFIX):
+                yield flight
+        finally:
+            response.close()
 
     def retrieve_flight_routes(self):
         route_url = self._get_url(self.flight_routes)
-        return self.get(route_url)
+        return self._cached('routes', route_url, lambda: self.get(route_url))
+
+
+_default_sw_api = None
+_default_sw_api_lock = threading.Lock()
+
+
+def get_default_sw_api():
+    """ Returns the process-wide SWApi used when no client is passed in """
+    global _default_sw_api
+    with _default_sw_api_lock:
+        if _default_sw_api is None:
+            _default_sw_api = SWApi()
+        return _default_sw_api
+
+
+def set_default_sw_api(sw_api):
+    """ Replaces the process-wide SWApi (e.g. with one configured from args) """
+    global _default_sw_api
+    with _default_sw_api_lock:
+        _default_sw_api = sw_api
 
 
 def convert_to_datetime(date, fmt='%Y-%m-%dT%H:%M:%S',
@@ -86,45 +251,165 @@ def convert_to_datetime(date, fmt='%Y-%m-%dT%H:%M:%S',
         return date_datetime
 
 
-def parse_flight_data(data, args):
+def parse_timestamp(text):
     """
-    Accepts a data dict from SWApi retrieve_raw_flight_data
-    and args and returns a list of FlightRecord objects
+    Fast path for the fixed layout 'YYYY-MM-DDTHH:MM:SS' timestamps in
+    flight responses (fractional seconds/UTC offset are ignored)
+    """
+    return datetime.fromisoformat(text[:19])
+
+
+def iter_flight_details(data):
+    """ Yields each flight dict in a decoded retrieve_raw_flight_data response """
+    if not data['data']:
+        return
+    for flight_route in data['data']['searchResults']['airProducts']:
+        for flight in flight_route['details']:
+            yield flight
+
+
+class FlightFilter(object):
     """
-    flight_results = data['data']['searchResults']['airProducts']
-    flight_options = []
-    for flight_route in flight_results:
-        route_results = flight_route['details']
-        for flight in route_results:
+    Predicates from a FlightSearch that are checked against raw flight dicts
+    so rejected flights are skipped before any date parsing or fare scanning
+    flight_numbers: list of flight number lists to keep
+    nonstop: skip connecting flights
+    depart_after/depart_before: 'HH:MM' (24 hour) departure time window
+    origin: only flights from origin (the outbound leg) are checked against
+        the departure time window (every flight if None)
+    max_price: skip flights whose cheapest fare for all passengers is above
+        this price (no trip including them can cost less)
+    passengers: number of passengers paying the fare (see FlightRecord.price)
+    """
+    def __init__(self, flight_numbers=None, nonstop=False, depart_after=None,
+                 depart_before=None, max_price=None, passengers=1, origin=None):
+        self.flight_numbers = set(tuple(x) for x in flight_numbers) if flight_numbers else None
+        self.nonstop = bool(nonstop)
+        self.depart_after = parse_time_of_day(depart_after) if depart_after else None
+        self.depart_before = parse_time_of_day(depart_before) if depart_before else None
+        self.origin = origin
+        self.max_price = float(max_price) if max_price is not None else None
+        self.passengers = passengers
+
+    @classmethod
+    def from_search(cls, flight_search):
+        flight_numbers = flight_search.flight_numbers
+        return cls(flight_numbers=flight_numbers,
+                   nonstop=flight_search.nonstop and not flight_numbers,
+                   depart_after=getattr(flight_search, 'depart_after', None),
+                   depart_before=getattr(flight_search, 'depart_before', None),
+                   max_price=getattr(flight_search, 'max_price', None),
+                   passengers=get_paying_passengers(flight_search),
+                   origin=flight_search.origin)
+
+    def accepts_flight(self, flight):
+        """ Checks flight numbers, stops and departure time of a raw flight dict """
+        if self.flight_numbers is not None:
+            if tuple(map(int, flight['flightNumbers'])) not in self.flight_numbers:
+                return False
+        if self.nonstop and len(flight['flightNumbers']) > 1:
+            return False
+        if ((self.depart_after or self.depart_before)
+                and (self.origin is None or flight['originationAirportCode'] == self.origin)):
+            depart_time = flight['departureDateTime'][11:16]  # YYYY-MM-DDTHH:MM
+            if self.depart_after and depart_time < self.depart_after:
+                return False
+            if self.depart_before and depart_time > self.depart_before:
+                return False
+        return True
+
+    def accepts_price(self, price):
+        """ price is the per passenger fare """
+        return self.max_price is None or price * self.passengers <= self.max_price
+
+
+def iter_flight_rows(flights, flight_filter=None):
+    """
+    Accepts an iterable of flight dicts (from iter_flight_details or
+    SWApi.stream_flight_details) and yields (origin, destination,
+    depart_datetime, arrival_datetime, flight_numbers, price, fare_class)
+    tuples. Flights rejected by flight_filter (FlightFilter) are skipped
+    before parsing. Yielded rows are counted in PARSED_ROWS
+    """
+    num_rows = 0
+    try:
+        for flight in flights:
+            if flight_filter and not flight_filter.accepts_flight(flight):
+                continue
             fares_dict = flight['fareProducts']['ADULT']
             fare_info = get_minimum_fare(fares_dict)
             if fare_info:
                 fare_class, price, currency_type = fare_info
                 price = float(price)
+                if flight_filter and not flight_filter.accepts_price(price):
+                    continue
                 origin = flight['originationAirportCode']
                 destination = flight['destinationAirportCode']
                 flight_numbers = list(map(int, flight['flightNumbers']))
-                depart_datetime = flight['departureDateTime'].split('.')[0]
-                arrival_datetime = flight['arrivalDateTime'].split('.')[0]
-                depart_date, depart_time = convert_to_datetime(depart_datetime, return_date=True, return_time=True)
-                arrival_date, arrival_time = convert_to_datetime(arrival_datetime, return_date=True, return_time=True)
-                flight_option = FlightRecord(origin, destination, depart_date,
-                                             depart_time, arrival_time, flight_numbers,
-                                             price, fare_class, args)
-                flight_options.append(flight_option)
-    return flight_options
+                depart_datetime = parse_timestamp(flight['departureDateTime'])
+                arrival_datetime = parse_timestamp(flight['arrivalDateTime'])
+                num_rows += 1
+                yield (origin, destination, depart_datetime, arrival_datetime,
+                       flight_numbers, price, fare_class)
+    finally:
+        PARSED_ROWS.inc(num_rows)
+
+
+def cheapest_per_origin(rows, by_flight_numbers=False):
+    """
+    Consumes an iterable of rows from iter_flight_rows keeping only the
+    running minimum price per origin (per origin and flight numbers if
+    by_flight_numbers). Returns the cheapest rows in order of first appearance
+    """
+    rows_dict = OrderedDict()
+    for row in rows:
+        key = (row[0], tuple(row[4])) if by_flight_numbers else row[0]
+        if key not in rows_dict or rows_dict[key][5] > row[5]:
+            rows_dict[key] = row
+    return list(rows_dict.values())
+
+
+def parse_flight_data(data, args, flight_filter=None):
+    """
+    Accepts a data dict from SWApi retrieve_raw_flight_data
+    and args and returns a FlightTable
+    """
+    with PARSE_SECONDS.time():
+        return FlightTable.from_rows(iter_flight_rows(iter_flight_details(data), flight_filter), args)
 
 
-def retrieve_flight_data(args, sw_api):
-    """ Use SW_API to return list of FlightRecord objects """
+def fetch_flight_data(args, sw_api):
+    """ Use SW_API to return the decoded search results for args """
     logstr = 'Collecting all available flights from {} to {} on {}'
     logger.info(logstr.format(args.origin, args.destination, args.depart_date_str))
     search_data = args.flight_search_dict
     raw_data = sw_api.retrieve_raw_flight_data(search_data)
-    data = json.loads(raw_data)
-    if not data['data']:
+    with JSON_DECODE_SECONDS.time():
+        return json_loads(raw_data)
+
+
+def iter_flight_data(args, sw_api, data=None, flight_filter=None):
+    """
+    Use SW_API to yield rows (see iter_flight_rows). If data (from fetch_flight_data)
+    is given, it is parsed instead of making a request. If sw_api can stream,
+    flights are parsed as the response is received
+    """
+    if data is None and sw_api.can_stream:
+        logstr = 'Streaming all available flights from {} to {} on {}'
+        logger.info(logstr.format(args.origin, args.destination, args.depart_date_str))
+        flights = sw_api.stream_flight_details(args.flight_search_dict)
+    else:
+        if data is None:
+            data = fetch_flight_data(args, sw_api)
+        flights = iter_flight_details(data)
+    return iter_flight_rows(flights, flight_filter)
+
+
+def retrieve_flight_data(args, sw_api, data=None, flight_filter=None):
+    """ Use SW_API to return a FlightTable of flights (see iter_flight_data) """
+    flight_options = FlightTable.from_rows(iter_flight_data(args, sw_api, data, flight_filter), args)
+    if not flight_options:
         return None
-    flight_options = parse_flight_data(data, args)
     logger.info('Found {} flight routes'.format(len(flight_options)))
     if args.logall:
         header = ['Origin', 'Destination', 'Date', 'DepartTime', 'ArriveTime',
@@ -151,92 +436,49 @@ def get_minimum_fare(all_fares):
         return min((fare for fare in fares), key=lambda x: float(x[1]))
 
 
-def find_cheapest_flights(flight_search):
+def find_cheapest_flights(flight_search, sw_api=None, data=None):
     """ From one-way or round trip flight_search, return a TripRecord object
-    containing the cheapest flight(s)
+    containing the cheapest flight(s), or None if there are none or they cost
+    more than max_price in total. If data (from fetch_flight_data) is given,
+    no request is made
     """
-    sw_api = SWApi()
-    flight_results = []
-    flights = retrieve_flight_data(flight_search, sw_api)
-    if not flights:
-        return
-    if flight_search.flight_numbers:
-        for flight in flights:
-            if flight.flight_numbers in flight_search.flight_numbers:
-                flight_results.append(flight)
-    else:
-        # Get min for each origin
-        flights_dict = OrderedDict()
-        for flight in flights:
-            if flight_search.nonstop:
-                if len(flight.flight_numbers) > 1:  # skip connecting flights if nonstop
-                    continue
-            if flight.origin not in flights_dict:
-                flights_dict[flight.origin] = flight
-            else:
-                if flights_dict[flight.origin].price > flight.price:
-                    flights_dict[flight.origin] = flight
-        flight_results = list(flights_dict.values())
+    if data is None:
+        sw_api = sw_api or get_default_sw_api()
+    if flight_search.logall:
+        # Every flight is logged, so parse the full list once before filtering
+        if data is None:
+            data = fetch_flight_data(flight_search, sw_api)
+        retrieve_flight_data(flight_search, sw_api, data)
+    flight_filter = FlightFilter.from_search(flight_search)
+    rows = iter_flight_data(flight_search, sw_api, data, flight_filter)
+    with PARSE_SECONDS.time():  # Includes receiving the response when it is streamed
+        # Only the running cheapest rows are kept, so a streamed response is never held whole
+        rows = cheapest_per_origin(rows, by_flight_numbers=bool(flight_search.flight_numbers))
+        flight_results = list(FlightTable.from_rows(rows, flight_search))
     if flight_results:
         if flight_search.triptype == 'roundtrip':
             if len(flight_results) != 2:
                 return None
-        return TripRecord(flight_results)
+        trip_record = TripRecord(flight_results)
+        if flight_search.max_price is not None and trip_record.price > flight_search.max_price:
+            return None
+        return trip_record
 
 
-def get_flight_route_dict():
-    """
-    Reads json file containing SW flight route information
-    key: airport code
-    value: dict with keys display_name, federal_unit, routes_served
-    """
-    routes_file = pkg_resources.resource_filename(__name__, 'airport_routes.json')
-    routes_dict = json.load(open(routes_file, 'r'))
-    return routes_dict
-
-
-def change_to_long_names(flight_options, route_dict):
+def change_to_long_names(flight_options, route_graph):
     """
     Changes first flight information (used in TripRecords) to long
     format so that it's clearer when outputting table
     """
     for triprecord in flight_options:
         flight_info = triprecord.flights[0]
-        city_o = route_dict[flight_info.origin]['display_name']
-        fed_unit_o = route_dict[flight_info.origin]['federal_unit']
-        city_d = route_dict[flight_info.destination]['display_name']
-        fed_unit_d = route_dict[flight_info.destination]['federal_unit']
-        flight_info.origin = '{}, {}'.format(city_o, fed_unit_o)
-        flight_info.destination = '{}, {}'.format(city_d, fed_unit_d)
+        flight_info.origin = route_graph.long_name(flight_info.origin)
+        flight_info.destination = route_graph.long_name(flight_info.destination)
 
 
-def find_all_destinations(flight_searches):
-    """
-    Uses origin from flight_search to find all available flights to all
-    destinations offered by SW. Note: this is a lot of requests to SW
-    and should be used sparingly.
-    """
-    logger.info('Searching for the cheapest flights for all destinations')
-    logger.info('Note: this may take a while (a sorted table will be printed when finished)')
-    flight_search = flight_searches[0]
-    origin = flight_search.origin
-    route_dict = get_flight_route_dict()
-    destinations = route_dict[origin]['routes_served']
-    flight_options = []
-    for destination in destinations:
-        flight_search.destination = destination
-        try:
-            flights = find_cheapest_flights(flight_search)
-        except:
-            logger.info('Found 0 flight routes')
-            continue
-        if not flights:
-            continue
-        flight_options.append(flights)
-
-    flight_options = sorted(flight_options, key=lambda x: x.price)
-    change_to_long_names(flight_options, route_dict)
-    data = [x.output_list for x in flight_options]
+def log_trip_table(trip_records):
+    """ Logs a table of TripRecords (one way or round trip) """
+    data = [x.output_list for x in trip_records]
     if data:
         if len(data[0]) > 8:
             header = ['Origin', 'Destination', 'Depart_Date', 'DepartTime', 'ArriveTime',
@@ -249,3 +491,101 @@ def find_all_destinations(flight_searches):
         logger.info(logstr)
     else:
         logger.info('No flights found')
+
+
+class TopTrips(object):
+    """
+    Keeps the k cheapest TripRecords added (all of them if k is None) in a
+    bounded max-heap, so memory stays O(k) however many trips are added
+    """
+    def __init__(self, k=None):
+        self.k = k
+        self._heap = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, trip_record):
+        """ Adds trip_record; returns its rank (1 is cheapest) or None if it is not in the top k """
+        self._counter += 1
+        entry = (-trip_record.price, -self._counter, trip_record)
+        if self.k is None or len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+        else:
+            return None
+        return 1 + sum(1 for x in self._heap if x[0] > entry[0])
+
+    @property
+    def worst_price(self):
+        return -self._heap[0][0] if self._heap else None
+
+    def sorted(self):
+        """ TripRecords from cheapest to most expensive """
+        return [x[2] for x in sorted(self._heap, reverse=True)]
+
+
+def find_all_destinations(flight_searches, max_workers=4, sw_api=None, top=None,
+                          time_budget=None, max_requests=None):
+    """
+    Uses origin from flight_search to find all available flights to all
+    destinations offered by SW. Note: this is a lot of requests to SW
+    and should be used sparingly. Destinations are searched concurrently
+    (max_workers at a time), each with its own copy of the flight search.
+    Progress is logged as each destination finishes and only the top
+    cheapest trips (all if None) are kept. The search stops early after
+    time_budget seconds or max_requests destinations, printing the best
+    trips found so far
+    """
+    logger.info('Searching for the cheapest flights for all destinations')
+    logger.info('Note: this may take a while (a sorted table will be printed when finished)')
+    flight_search = flight_searches[0]
+    origin = flight_search.origin
+    route_graph = get_route_graph()
+    destinations = route_graph.destinations(origin)
+    if max_requests is not None and max_requests < len(destinations):
+        logger.info('Searching {} of {} destinations (--max_requests)'.format(max_requests, len(destinations)))
+        destinations = destinations[:max_requests]
+    destination_searches = (flight_search.copy(destination=x) for x in destinations)
+    sw_api = sw_api or get_default_sw_api()
+
+    def search_destination(destination_search):
+        return find_cheapest_flights(destination_search, sw_api)
+
+    top_trips = TopTrips(top)
+    num_done = 0
+    failed = []
+    deadline = time.time() + time_budget if time_budget else None
+    tasks = run_concurrently(search_destination, destination_searches, max_workers, deadline)
+    try:
+        for task in tasks:
+            num_done += 1
+            destination = task.item.destination
+            if task.error:
+                failed.append(destination)
+                logger.warning('[{}/{}] {} -> {}: {}'.format(num_done, len(destinations), origin,
+                                                             destination, task.error))
+            elif task.result:
+                rank = top_trips.add(task.result)
+                logstr = '[{}/{}] {} -> {}: {}{}'
+                logger.info(logstr.format(num_done, len(destinations), origin, destination,
+                                          task.result.price_str, ' (#{})'.format(rank) if rank else ''))
+            else:
+                logger.info('[{}/{}] {} -> {}: no flights'.format(num_done, len(destinations),
+                                                                  origin, destination))
+    finally:
+        tasks.close()
+    if num_done < len(destinations):
+        logstr = 'Time budget of {}s spent, stopping after {} of {} destinations'
+        logger.info(logstr.format(time_budget, num_done, len(destinations)))
+
+    if failed:
+        logstr = 'Unable to search {} of {} destinations: {}'
+        logger.warning(logstr.format(len(failed), len(destinations), ', '.join(failed)))
+
+    flight_options = top_trips.sorted()
+    change_to_long_names(flight_options, route_graph)
+    log_trip_table(flight_options)
+    return flight_options
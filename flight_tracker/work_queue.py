@@ -0,0 +1,228 @@
+""" SQLite work queue shared by a coordinator and worker processes (on one or more hosts) """
+
+import threading
+import logging
+import sqlite3
+import socket
+import json
+import time
+import os
+
+from .alert_state import get_search_key
+from .concurrency import RateLimiter
+from .flight_records import FlightSearch
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY,
+    search_key TEXT NOT NULL UNIQUE,
+    request_key TEXT NOT NULL,
+    search TEXT NOT NULL,
+    next_check REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    last_checked REAL,
+    last_price REAL,
+    last_error TEXT,
+    checks INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS searches_due ON searches (next_check);
+CREATE INDEX IF NOT EXISTS searches_request ON searches (request_key);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    host TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS adaptive_rates (
+    host TEXT PRIMARY KEY,
+    rate REAL NOT NULL
+);
+"""
+
+
+def connect(path):
+    """ Connection tuned for several processes sharing path """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_worker_id():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+class _Transaction(object):
+    """ BEGIN IMMEDIATE ... COMMIT/ROLLBACK, taking the write lock up front so leases never race """
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.lock.release()
+
+
+class WorkQueue(object):
+    """
+    Watchlist searches with their next check time. Workers lease due
+    searches for lease_seconds; a lease that expires (e.g. its worker
+    crashed) makes the search available again. Searches sharing a
+    request_key are leased together so each upstream query is made once
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def add(self, flight_search, next_check=None):
+        """ Adds flight_search (due immediately by default); existing searches keep their schedule """
+        with self._transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO searches (search_key, request_key, search, next_check) '
+                         'VALUES (?, ?, ?, ?)',
+                         (get_search_key(flight_search), flight_search.request_key,
+                          json.dumps(flight_search.to_dict()), next_check or time.time()))
+
+    def remove(self, flight_search):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM searches WHERE search_key = ?', (get_search_key(flight_search),))
+
+    def sync(self, flight_searches):
+        """ Makes the queue hold exactly flight_searches, keeping schedules of unchanged ones """
+        keep = set()
+        for flight_search in flight_searches:
+            self.add(flight_search)
+            keep.add(get_search_key(flight_search))
+        with self._transaction() as conn:
+            stale = [x for x, in conn.execute('SELECT search_key FROM searches') if x not in keep]
+            conn.executemany('DELETE FROM searches WHERE search_key = ?', [(x,) for x in stale])
+        return len(stale)
+
+    def lease(self, worker_id, max_searches=4, lease_seconds=300, now=None):
+        """
+        Leases up to max_searches due searches (plus searches sharing their
+        requests) to worker_id. Returns list of (id, FlightSearch)
+        """
+        now = now or time.time()
+        with self._transaction() as conn:
+            request_keys = [x for x, in conn.execute(
+                'SELECT request_key FROM searches WHERE next_check <= ? AND lease_expires < ? '
+                'GROUP BY request_key ORDER BY MIN(next_check) LIMIT ?', (now, now, max_searches))]
+            leased = []
+            for request_key in request_keys:
+                leased.extend(conn.execute('SELECT id, search FROM searches WHERE request_key = ? '
+                                           'AND lease_expires < ?', (request_key, now)).fetchall())
+            conn.executemany('UPDATE searches SET lease_owner = ?, lease_expires = ? WHERE id = ?',
+                             [(worker_id, now + lease_seconds, x[0]) for x in leased])
+        return [(x[0], FlightSearch.from_dict(json.loads(x[1]))) for x in leased]
+
+    def complete(self, worker_id, search_id, next_check, trip_record=None, error=None):
+        """
+        Releases a lease held by worker_id and schedules the next check. If
+        next_check is None the search is done and removed from the queue
+        """
+        with self._transaction() as conn:
+            if next_check is None:
+                conn.execute('DELETE FROM searches WHERE id = ? AND lease_owner = ?', (search_id, worker_id))
+                return
+            conn.execute('UPDATE searches SET lease_owner = NULL, lease_expires = 0, next_check = ?, '
+                         'last_checked = ?, last_price = ?, last_error = ?, checks = checks + 1 '
+                         'WHERE id = ? AND lease_owner = ?',
+                         (next_check, time.time(), trip_record.price if trip_record else None,
+                          str(error) if error else None, search_id, worker_id))
+
+    def seconds_until_due(self, now=None):
+        """ Seconds until the next unleased search is due (None if every search is leased) """
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT MIN(next_check) FROM searches WHERE lease_expires < ?',
+                                     (now,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - now)
+
+    def stats(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*), SUM(next_check <= ? AND lease_expires < ?), SUM(lease_expires >= ?), '
+                'SUM(checks) FROM searches', (now, now, now)).fetchone()
+        return {'searches': row[0], 'due': row[1] or 0, 'leased': row[2] or 0, 'checks': row[3] or 0}
+
+    def close(self):
+        self._conn.close()
+
+
+class SharedTokenBucket(object):
+    """
+    TokenBucket whose state lives in the work queue so every process shares
+    one rate. Adaptive rate changes (set_rate) are stored there too, so all
+    processes refill the bucket at the same rate
+    """
+    def __init__(self, conn, lock, host, rate, capacity=1):
+        self.conn = conn
+        self.lock = lock
+        self.host = host
+        self.max_rate = float(rate)
+        self.rate = float(rate)  # Latest shared rate seen by this process
+        self.capacity = float(capacity)
+
+    def set_rate(self, rate):
+        with _Transaction(self.conn, self.lock) as conn:
+            conn.execute('INSERT OR REPLACE INTO adaptive_rates VALUES (?, ?)', (self.host, float(rate)))
+        self.rate = float(rate)
+
+    def acquire(self):
+        """ Block until a token is available """
+        if self.max_rate <= 0:
+            return
+        while True:
+            with _Transaction(self.conn, self.lock) as conn:
+                now = time.time()
+                row = conn.execute('SELECT rate FROM adaptive_rates WHERE host = ?', (self.host,)).fetchone()
+                self.rate = min(self.max_rate, row[0]) if row else self.max_rate
+                row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE host = ?',
+                                   (self.host,)).fetchone()
+                tokens, updated = row if row else (self.capacity, now)
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+                acquired = tokens >= 1
+                if acquired:
+                    tokens -= 1
+                conn.execute('INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?)', (self.host, tokens, now))
+            if acquired:
+                return
+            time.sleep((1 - tokens) / self.rate)
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose per-host token buckets are stored in the work queue at
+    path, so `rate` is a global limit across every worker process and host.
+    max_in_flight still applies per process
+    """
+    def __init__(self, path, rate=0.5, max_in_flight=4, burst=1, min_rate=None):
+        RateLimiter.__init__(self, rate, max_in_flight, burst, min_rate)
+        self._conn = connect(path)
+        self._conn_lock = threading.Lock()
+
+    def _get_bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = SharedTokenBucket(self._conn, self._conn_lock, host, self.rate, self.burst)
+            return self._buckets[host]
@@ -19,17 +19,25 @@ setup(
     package_dir={'flight_tracker': 'flight_tracker'},
     data_files=[('flight_tracker', ['twilio.json', 'airport_routes.json'])],
     install_requires=requirements,
+    extras_require={
+        'fast': ['orjson', 'ijson'],
+        'analytics': ['numpy>=1.17'],
+    },
     license="MIT",
     zip_safe=False,
     keywords="flights tracker",
+    python_requires='>=3.7',
     classifiers=[
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     entry_points={
-        'console_scripts': ['flight_tracker=flight_tracker.flight_tracker:main'],
+        'console_scripts': ['flight_tracker=flight_tracker.flight_tracker:main',
+                            'flight_tracker_ctl=flight_tracker.client:main'],
     },
 )
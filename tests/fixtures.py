@@ -0,0 +1,26 @@
+""" Shopping responses in the SW layout built from a few fields per flight """
+
+
+def make_flight(origin, destination, depart, arrive, flight_numbers, fares):
+    """
+    Raw flight dict. depart/arrive: 'YYYY-MM-DDTHH:MM', flight_numbers: list
+    of ints, fares: {fare class: price} (None for a sold out fare class)
+    """
+    fare_products = {}
+    for fare_class, price in fares.items():
+        if price is None:
+            fare_products[fare_class] = {'fare': None}
+        else:
+            fare_products[fare_class] = {'fare': {'totalFare': {'value': '{:.2f}'.format(price),
+                                                                'currencyCode': 'USD'}}}
+    return {'originationAirportCode': origin,
+            'destinationAirportCode': destination,
+            'flightNumbers': [str(x) for x in flight_numbers],
+            'departureDateTime': depart + ':00.000-05:00',
+            'arrivalDateTime': arrive + ':00.000-05:00',
+            'fareProducts': {'ADULT': fare_products}}
+
+
+def make_response(*legs):
+    """ Decoded shopping response with one airProducts entry per list of flight dicts """
+    return {'data': {'searchResults': {'airProducts': [{'details': list(x)} for x in legs]}}}
@@ -0,0 +1,90 @@
+""" Tests for the vectorised fare statistics against a naive per series computation """
+
+import unittest
+import random
+import math
+
+from flight_tracker.analytics import HAS_NUMPY, FareSeries, compute_stats, find_drops
+
+if HAS_NUMPY:
+    import numpy as np
+
+NOW = 1800000000.0
+DAY = 86400
+
+
+def naive_stats(observations, window_days, alpha, percentiles, min_std):
+    """ Same statistics as compute_stats for one series of (observed_at, price), oldest first """
+    if not observations:
+        return None
+    latest = observations[-1][1]
+    prior = [price for observed_at, price in observations[:-1] if observed_at >= NOW - window_days * DAY]
+    if not prior:
+        return latest, 0, None
+    weights = [(1 - alpha) ** k for k in range(len(prior))][::-1]
+    ewma = sum(w * x for w, x in zip(weights, prior)) / sum(weights)
+    mean = sum(prior) / len(prior)
+    std = math.sqrt(sum((x - mean) ** 2 for x in prior) / len(prior))
+    scale = max(std, min_std * abs(ewma))
+    zscore = (latest - ewma) / scale if scale > 0 else None
+    return latest, len(prior), (min(prior), list(np.percentile(prior, percentiles)), ewma, std, zscore)
+
+
+@unittest.skipUnless(HAS_NUMPY, 'numpy is not installed')
+class ComputeStatsTest(unittest.TestCase):
+    def create_series(self, num_series=200, seed=0):
+        rng = random.Random(seed)
+        keys, rows, observations = [], [], []
+        for index in range(num_series):
+            length = rng.choice([0, 1, 2, 5, 20, 60])
+            start = NOW - length * DAY / 2
+            base = rng.uniform(50, 500)
+            if index % 7 == 0:  # Flat prices
+                series = [(start + x * DAY / 2, base) for x in range(length)]
+            else:
+                series = [(start + x * DAY / 2, round(base * rng.uniform(0.7, 1.3), 2)) for x in range(length)]
+            keys.append(('PHL', 'BNA', '2030-01-01', str(index)))
+            rows.extend((index, observed_at, price) for observed_at, price in series)
+            observations.append(series)
+        return FareSeries.from_rows(keys, rows), observations
+
+    def test_matches_naive(self):
+        series, observations = self.create_series()
+        stats = compute_stats(series, window_days=10, alpha=0.3, percentiles=(10, 50), now=NOW, min_std=0.02)
+        for index, series_observations in enumerate(observations):
+            expected = naive_stats(series_observations, 10, 0.3, (10, 50), 0.02)
+            if expected is None:
+                self.assertTrue(np.isnan(stats.latest[index]))
+                continue
+            latest, count, values = expected
+            self.assertEqual(stats.latest[index], latest)
+            self.assertEqual(stats.observations[index], count)
+            if values is None:
+                self.assertTrue(np.isnan(stats.window_min[index]))
+                self.assertTrue(np.isnan(stats.zscore[index]))
+                continue
+            window_min, percentile_values, ewma, std, zscore = values
+            self.assertEqual(stats.window_min[index], window_min)
+            np.testing.assert_allclose(stats.percentiles[index], percentile_values)
+            self.assertAlmostEqual(stats.ewma[index], ewma, places=6)
+            self.assertAlmostEqual(stats.std[index], std, places=6)
+            self.assertAlmostEqual(stats.zscore[index], zscore, places=6)
+
+    def test_flat_prices_then_drop(self):
+        rows = [(0, NOW - (10 - x) * DAY, 100.0) for x in range(9)] + [(0, NOW, 80.0)]
+        series = FareSeries.from_rows([('PHL', 'BNA', '2030-01-01', '1')], rows)
+        drops = find_drops(compute_stats(series, now=NOW), lowest=True, z_threshold=2.0)
+        self.assertEqual(len(drops), 1)
+        self.assertTrue(drops[0].new_low)
+        self.assertTrue(drops[0].below_typical)
+
+    def test_min_observations(self):
+        rows = [(0, NOW - DAY, 100.0), (0, NOW, 50.0)]
+        series = FareSeries.from_rows([('PHL', 'BNA', '2030-01-01', '1')], rows)
+        stats = compute_stats(series, now=NOW)
+        self.assertEqual(find_drops(stats, min_observations=2), [])
+        self.assertEqual(len(find_drops(stats, min_observations=1)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+""" Tests for ResponseCache expiry, LRU eviction and the SQLite disk tier """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from flight_tracker.cache import DiskCache, ResponseCache
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache(max_entries=3, ttls={'flights': 60, 'routes': 0}, clock=self.clock)
+
+    def test_ttl_expiry(self):
+        self.cache.set('flights', 'a', 'A')
+        self.clock.now += 59.9
+        self.assertEqual(self.cache.get('flights', 'a'), 'A')
+        self.clock.now += 0.1
+        self.assertIsNone(self.cache.get('flights', 'a'))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.stats['hits'], self.cache.stats['expirations'], self.cache.stats['misses']),
+                         (1, 1, 1))
+
+    def test_zero_ttl_is_not_cached(self):
+        self.cache.set('routes', 'a', 'A')
+        self.cache.set('unknown', 'a', 'A')
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNone(self.cache.get('routes', 'a'))
+
+    def test_lru_eviction(self):
+        for key in 'abc':
+            self.cache.set('flights', key, key.upper())
+        self.assertEqual(self.cache.get('flights', 'a'), 'A')  # b is now least recently used
+        self.cache.set('flights', 'd', 'D')
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get('flights', 'b'))
+        self.assertEqual([self.cache.get('flights', x) for x in 'acd'], ['A', 'C', 'D'])
+        self.assertEqual(self.cache.stats['evictions'], 1)
+        # Endpoints do not share keys
+        self.assertIsNone(self.cache.get('routes', 'a'))
+
+    def test_get_or_fetch(self):
+        calls = []
+
+        def fetch():
+            calls.append(self.clock.now)
+            return 'response {}'.format(len(calls))
+        self.assertEqual(self.cache.get_or_fetch('flights', 'a', fetch), 'response 1')
+        self.assertEqual(self.cache.get_or_fetch('flights', 'a', fetch), 'response 1')
+        self.clock.now += 60
+        self.assertEqual(self.cache.get_or_fetch('flights', 'a', fetch), 'response 2')
+        self.assertEqual(len(calls), 2)
+        self.assertAlmostEqual(self.cache.hit_rate, 1.0 / 3)
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache.db')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_cache(self, **kwargs):
+        cache = ResponseCache(ttls={'flights': 60}, path=self.path, clock=self.clock, **kwargs)
+        self.addCleanup(cache.disk.close)
+        return cache
+
+    def test_round_trip(self):
+        disk = DiskCache(self.path, self.clock)
+        self.addCleanup(disk.close)
+        value = '{"fare": "£123"}' * 100
+        disk.set('flights', 'a', value, 1060)
+        self.assertEqual(disk.get('flights', 'a'), (1060, value))
+        self.assertIsNone(disk.get('routes', 'a'))
+        self.clock.now = 1060
+        self.assertIsNone(disk.get('flights', 'a'))
+        disk.prune()
+        self.assertEqual(disk._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0], 0)
+
+    def test_survives_restart(self):
+        self.create_cache().set('flights', 'a', 'A')
+        self.clock.now += 30
+        cache = self.create_cache()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('flights', 'a'), 'A')
+        self.assertEqual(cache.stats['disk_hits'], 1)
+        # Promoted to memory with the original expiry, not a fresh TTL
+        self.assertEqual(cache.get('flights', 'a'), 'A')
+        self.assertEqual(cache.stats['hits'], 1)
+        self.clock.now += 30
+        self.assertIsNone(cache.get('flights', 'a'))
+        self.assertEqual(cache.stats['misses'], 1)
+
+    def test_evicted_entries_are_read_back_from_disk(self):
+        cache = self.create_cache(max_entries=1)
+        cache.set('flights', 'a', 'A')
+        cache.set('flights', 'b', 'B')
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertEqual(cache.get('flights', 'a'), 'A')
+        self.assertEqual(cache.stats['disk_hits'], 1)
+
+    def test_expired_responses_are_pruned_on_open(self):
+        self.create_cache().set('flights', 'a', 'A')
+        self.clock.now += 60
+        cache = self.create_cache()
+        self.assertEqual(cache.disk._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0], 0)
+
+    def test_clear(self):
+        cache = self.create_cache()
+        cache.set('flights', 'a', 'A')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('flights', 'a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
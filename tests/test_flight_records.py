@@ -0,0 +1,31 @@
+""" Tests for building FlightSearches from command line arguments """
+
+from unittest import mock
+import unittest
+
+from flight_tracker.flight_records import SEARCH_FIELDS, FlightSearch, create_flight_search_from_args
+from flight_tracker.parse_cl_arguments import parse_cl_arguments
+
+
+def parse(*argv):
+    with mock.patch('sys.argv', ['flight_tracker'] + list(argv)):
+        return parse_cl_arguments()
+
+
+class FlightSearchFromArgsTest(unittest.TestCase):
+    def test_search_fields_match_to_dict(self):
+        self.assertEqual(sorted(FlightSearch('PHL', 'BNA', '7/12/27').to_dict()), sorted(SEARCH_FIELDS))
+
+    def test_only_search_fields_are_used(self):
+        args = parse('-o', 'PHL', '-d', 'BNA', '-l', '7/12/27', '-x', '2', '-da', '7:05', '-n', '2506,2568', '874',
+                     '-w', '8', '--queue', 'q.db')
+        args.some_new_flag = True  # Flags added later never reach FlightSearch
+        flight_search = create_flight_search_from_args(args)
+        self.assertEqual(flight_search.num_passengers, 2)
+        self.assertEqual(flight_search.depart_after, '07:05')
+        self.assertEqual(flight_search.flight_numbers, [[2506, 2568], [874]])
+        self.assertEqual(FlightSearch.from_dict(flight_search.to_dict()).request_key, flight_search.request_key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+""" Tests for the columnar FlightTable against FlightRecords built from the same flights """
+
+import unittest
+
+from flight_tracker.flight_records import FlightRecord, FlightSearch, TripRecord
+from flight_tracker.flight_table import FlightTable
+from flight_tracker.web_scraper import iter_flight_details, iter_flight_rows
+
+from .fixtures import make_flight, make_response
+
+
+DATA = make_response(
+    [make_flight('PHL', 'BNA', '2030-07-12T06:05', '2030-07-12T08:15', [2506, 2568], {'WGA': 99.5, 'ANY': 250}),
+     make_flight('PHL', 'BNA', '2030-07-12T13:40', '2030-07-12T15:55', [874], {'WGA': None, 'ANY': 180.25})],
+    [make_flight('BNA', 'PHL', '2030-07-15T18:00', '2030-07-15T21:30', [1001], {'WGA': 87})])
+
+SEARCHES = [FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD', price_point=400),
+            FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD', passengers=3,
+                         price_point=600),
+            FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD', companion=True,
+                         price_point=400)]
+
+
+def create_records(flight_search):
+    """ The FlightRecord path: one object per flight with preformatted dates """
+    return [FlightRecord(origin, destination, depart.strftime('%m/%d/%y'), depart.strftime('%I:%M %p'),
+                         arrive.strftime('%I:%M %p'), flight_numbers, price, fare_class, flight_search)
+            for origin, destination, depart, arrive, flight_numbers, price, fare_class
+            in iter_flight_rows(iter_flight_details(DATA))]
+
+
+class FlightTableTest(unittest.TestCase):
+    def test_rows_match_flight_records(self):
+        for flight_search in SEARCHES:
+            table = FlightTable.from_rows(iter_flight_rows(iter_flight_details(DATA)), flight_search)
+            records = create_records(flight_search)
+            self.assertEqual(len(table), len(records))
+            for row, record in zip(table, records):
+                for attr in ('origin', 'destination', 'depart_date', 'depart_time', 'arrival_time',
+                             'flight_numbers', 'fare_class', 'price_str', 'output_list'):
+                    self.assertEqual(getattr(row, attr), getattr(record, attr), attr)
+                self.assertAlmostEqual(row.price, record.price)
+                self.assertEqual(row.depart_date_dt.date(), record.depart_date_dt.date())
+
+    def test_trips_match_flight_records(self):
+        for flight_search in SEARCHES:
+            table = FlightTable.from_rows(iter_flight_rows(iter_flight_details(DATA)), flight_search)
+            records = create_records(flight_search)
+            for outbound, inbound in ((0, 2), (1, 2)):
+                from_table = TripRecord([table[outbound], table[inbound]])
+                from_records = TripRecord([records[outbound], records[inbound]])
+                self.assertAlmostEqual(from_table.price, from_records.price)
+                self.assertEqual(from_table.price_difference, from_records.price_difference)
+                self.assertEqual(from_table.output_list, from_records.output_list)
+                if from_table.price_difference:
+                    self.assertEqual(from_table.output_string, from_records.output_string)
+
+    def test_columns(self):
+        flight_search = SEARCHES[0]
+        table = FlightTable.from_rows(iter_flight_rows(iter_flight_details(DATA)), flight_search)
+        self.assertEqual(list(table.prices), [9950, 18025, 8700])  # Cents
+        points_search = FlightSearch('PHL', 'BNA', '2030-07-12', faretype='POINTS', passengers=2)
+        points_table = FlightTable.from_rows(iter_flight_rows(iter_flight_details(DATA)), points_search)
+        self.assertEqual([x.price_str for x in points_table], ['200 points', '360 points', '174 points'])
+        self.assertEqual([table.num_stops(x) for x in range(len(table))], [1, 0, 0])
+        self.assertEqual(next(table.iter_columns())[4], '2506,2568')
+        self.assertEqual(table[-1].origin, 'BNA')
+        with self.assertRaises(IndexError):
+            table[len(table)]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+""" Tests for FareHistory retention, compaction and batched series queries """
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from flight_tracker.flight_records import FlightSearch
+from flight_tracker.flight_table import FlightTable
+from flight_tracker.history import FareHistory
+from flight_tracker.web_scraper import iter_flight_details, iter_flight_rows
+
+from .fixtures import make_flight, make_response
+
+
+DAY = 86400
+NOW = time.time()
+SEARCH = FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD')
+OUTBOUND = ('PHL', 'BNA', '2030-07-12', '2506,2568')
+INBOUND = ('BNA', 'PHL', '2030-07-15', '1001')
+DEPARTED = ('PHL', 'BNA', '2020-07-12', '874')
+
+
+def create_table(outbound_price, inbound_price):
+    data = make_response(
+        [make_flight('PHL', 'BNA', '2030-07-12T06:05', '2030-07-12T08:15', [2506, 2568], {'WGA': outbound_price}),
+         make_flight('PHL', 'BNA', '2020-07-12T13:40', '2020-07-12T15:55', [874], {'WGA': 50})],
+        [make_flight('BNA', 'PHL', '2030-07-15T18:00', '2030-07-15T21:30', [1001], {'WGA': inbound_price})])
+    return FlightTable.from_rows(iter_flight_rows(iter_flight_details(data)), SEARCH)
+
+
+class FareHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.history = FareHistory(os.path.join(self.tmp_dir, 'history.db'))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def record(self, days_ago, outbound_price, inbound_price=80):
+        self.history.record(SEARCH, create_table(outbound_price, inbound_price), NOW - days_ago * DAY)
+
+    def count(self):
+        return self.history._conn.execute('SELECT COUNT(*) FROM fares').fetchone()[0]
+
+    def test_record_is_buffered_until_flush(self):
+        self.record(0, 100)
+        self.assertEqual(self.count(), 0)
+        self.assertEqual(self.history.flush(), 3)
+        self.assertEqual(self.history.flush(), 0)
+        self.assertEqual(self.count(), 3)
+
+    def test_batch_series(self):
+        self.record(2, 120)
+        self.record(1, 100, 90)
+        self.record(0, 110)
+        self.history.flush()
+        missing = ('PHL', 'BNA', '2030-07-12', '9999')
+        rows = self.history.batch_series([INBOUND, missing, OUTBOUND])
+        self.assertEqual(rows, [(0, int(NOW - 2 * DAY), 8000), (0, int(NOW - DAY), 9000), (0, int(NOW), 8000),
+                                (2, int(NOW - 2 * DAY), 12000), (2, int(NOW - DAY), 10000), (2, int(NOW), 11000)])
+        since = int(NOW - DAY)
+        self.assertEqual(self.history.batch_series([OUTBOUND], since), [(0, since, 10000), (0, int(NOW), 11000)])
+        # The keys of an earlier call are replaced
+        self.assertEqual(self.history.batch_series([missing]), [])
+
+    def test_prune(self):
+        self.record(40, 130)
+        self.record(0, 100)
+        self.history.flush()
+        self.assertEqual(self.history.prune(), 2)  # Departed flight, both observations
+        self.assertEqual(self.history.batch_series([DEPARTED]), [])
+        self.assertEqual(self.count(), 4)
+        self.assertEqual(self.history.prune(30), 2)
+        self.assertEqual(self.history.batch_series([OUTBOUND]), [(0, int(NOW), 10000)])
+
+    def test_compact(self):
+        old_day = (int(NOW) // DAY - 10) * DAY  # Compaction groups by UTC day
+        for hours, price in ((1, 130), (2, 120), (3, 140)):
+            self.history.record(SEARCH, create_table(price, 80), old_day + hours * 3600)
+        self.history.record(SEARCH, create_table(120, 70), old_day + DAY)
+        self.record(3, 100)
+        self.record(3.01, 90)
+        self.history.flush()
+        self.history.compact(7)
+        # Older observations collapse to one per flight per day at the day's lowest price; newer ones are kept
+        series = self.history.batch_series([OUTBOUND, INBOUND])
+        self.assertEqual(series, [(0, old_day + 3600, 12000), (0, old_day + DAY, 12000),
+                                  (0, int(NOW - 3.01 * DAY), 9000), (0, int(NOW - 3 * DAY), 10000),
+                                  (1, old_day + 3600, 8000), (1, old_day + DAY, 7000),
+                                  (1, int(NOW - 3.01 * DAY), 8000), (1, int(NOW - 3 * DAY), 8000)])
+        self.assertEqual(self.count(), 12)  # 2 old days + 2 recent observations, 3 flights each
+        self.history.vacuum()
+        self.assertEqual(self.history.batch_series([OUTBOUND, INBOUND]), series)
+
+    def test_maintain_is_throttled(self):
+        self.record(0, 100)
+        self.history.flush()
+        statements = []
+        self.history._conn.set_trace_callback(statements.append)
+        self.assertTrue(self.history.maintain())
+        self.assertEqual(self.count(), 2)
+        self.assertFalse([x for x in statements if 'VACUUM' in x.upper()])  # Only done by vacuum()
+        self.record(0, 100)
+        self.history.flush()
+        self.assertFalse(self.history.maintain())
+        self.assertEqual(self.count(), 5)
+        self.assertTrue(self.history.maintain(interval=0))
+        self.assertEqual(self.count(), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+""" Tests for top-k round trip pairing against a brute force search of every pair """
+
+from datetime import datetime
+import itertools
+import unittest
+import random
+
+from flight_tracker.flight_records import FlightSearch
+from flight_tracker.pairing import PairingConstraints, find_top_trips, top_k_pairs
+
+from .fixtures import make_flight, make_response
+
+
+def brute_force_pairs(outbound, inbound, k, pair_ok):
+    totals = sorted(x[0] + y[0] for x, y in itertools.product(outbound, inbound) if pair_ok(x[1], y[1]))
+    return totals[:k]
+
+
+def create_leg(rng, origin, destination, dates, num_flights):
+    flights = []
+    for index in range(num_flights):
+        date = rng.choice(dates)
+        hour, minute = rng.randrange(5, 23), rng.choice([0, 15, 30, 45])
+        flight_numbers = [100 + index] if rng.random() < 0.6 else [100 + index, 1000 + index]
+        fares = {'WGA': rng.choice([None, rng.randint(50, 400)]), 'ANY': rng.randint(100, 600)}
+        flights.append(make_flight(origin, destination, '{}T{:02d}:{:02d}'.format(date, hour, minute),
+                                   '{}T{:02d}:{:02d}'.format(date, hour + 1, minute), flight_numbers, fares))
+    return flights
+
+
+def time_of_day(flight):
+    return flight['departureDateTime'][11:16]
+
+
+def get_fare(flight):
+    return min(float(x['fare']['totalFare']['value']) for x in flight['fareProducts']['ADULT'].values()
+               if x['fare'])
+
+
+class TopKPairsTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            outbound = sorted((rng.randint(1, 50), x) for x in range(rng.randint(0, 12)))
+            inbound = sorted((rng.randint(1, 50), x) for x in range(rng.randint(0, 12)))
+            rejected = set((rng.randrange(12), rng.randrange(12)) for _ in range(40))
+
+            def pair_ok(i, j):
+                return (i, j) not in rejected
+            k = rng.randint(0, 20)
+            pairs = top_k_pairs(outbound, inbound, k, pair_ok)
+            self.assertEqual([x[0] for x in pairs], brute_force_pairs(outbound, inbound, k, pair_ok))
+            self.assertTrue(all(pair_ok(i, j) for total, i, j in pairs))
+
+
+class FindTopTripsTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.outbound = create_leg(rng, 'PHL', 'BNA', ['2030-07-{}'.format(x) for x in range(10, 15)], 40)
+        self.inbound = create_leg(rng, 'BNA', 'PHL', ['2030-07-{}'.format(x) for x in range(12, 19)], 40)
+        self.data = make_response(self.outbound, self.inbound)
+
+    def brute_force(self, constraints, k, passengers=1, max_stops=None):
+        def leg_ok(flight, after, before):
+            if max_stops is not None and len(flight['flightNumbers']) - 1 > max_stops:
+                return False
+            return (after is None or time_of_day(flight) >= after) and (before is None or time_of_day(flight) <= before)
+
+        totals = []
+        for outbound, inbound in itertools.product(self.outbound, self.inbound):
+            if not leg_ok(outbound, constraints['depart_after'], constraints['depart_before']):
+                continue
+            if not leg_ok(inbound, constraints['return_after'], constraints['return_before']):
+                continue
+            depart = datetime.strptime(outbound['departureDateTime'][:16], '%Y-%m-%dT%H:%M')
+            ret = datetime.strptime(inbound['departureDateTime'][:16], '%Y-%m-%dT%H:%M')
+            nights = (ret.date() - depart.date()).days
+            if ret <= depart or not constraints['min_nights'] <= nights <= constraints['max_nights']:
+                continue
+            totals.append((get_fare(outbound) + get_fare(inbound)) * passengers)
+        return sorted(totals)[:k]
+
+    def test_round_trip_constraints(self):
+        constraints = {'min_nights': 2, 'max_nights': 4, 'depart_after': '07:00', 'depart_before': '18:00',
+                       'return_after': '12:00', 'return_before': '20:30'}
+        flight_search = FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD',
+                                     passengers=2)
+        for k in (1, 5, 50):
+            for max_stops in (None, 0):
+                trips = find_top_trips(flight_search, k, PairingConstraints(max_stops=max_stops, **constraints),
+                                       data=self.data)
+                expected = self.brute_force(constraints, k, passengers=2, max_stops=max_stops)
+                self.assertEqual([x.price for x in trips], expected)
+                for trip in trips:
+                    outbound, inbound = trip.flights
+                    nights = (inbound.depart_date_dt.date() - outbound.depart_date_dt.date()).days
+                    self.assertTrue(2 <= nights <= 4)
+                    self.assertTrue('07:00' <= outbound.depart_date_dt.strftime('%H:%M') <= '18:00')
+                    self.assertTrue('12:00' <= inbound.depart_date_dt.strftime('%H:%M') <= '20:30')
+
+    def test_max_price_is_the_trip_total(self):
+        constraints = {'min_nights': 0, 'max_nights': 10, 'depart_after': None, 'depart_before': None,
+                       'return_after': None, 'return_before': None}
+        expected = self.brute_force(constraints, 1000)
+        max_price = expected[10]
+        flight_search = FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD',
+                                     max_price=max_price)
+        trips = find_top_trips(flight_search, 1000, PairingConstraints(**constraints), data=self.data)
+        self.assertEqual([x.price for x in trips], [x for x in expected if x <= max_price])
+
+    def test_one_way(self):
+        flight_search = FlightSearch('PHL', 'BNA', '2030-07-12', faretype='USD')
+        trips = find_top_trips(flight_search, 3, PairingConstraints(depart_after='09:00'), data=self.data)
+        expected = sorted(get_fare(x) for x in self.outbound if time_of_day(x) >= '09:00')[:3]
+        self.assertEqual([x.price for x in trips], expected)
+        self.assertTrue(all(len(x.flights) == 1 for x in trips))
+
+
+if __name__ == '__main__':
+    unittest.main()
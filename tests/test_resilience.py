@@ -0,0 +1,142 @@
+""" Tests for retry classification, RetryPolicy and the CircuitBreaker state machine """
+
+import threading
+import unittest
+import time
+
+from flight_tracker.resilience import (MAX_RETRY_AFTER, CircuitBreaker, ClientError, NetworkError, RetryPolicy,
+                                       ThrottledError, UpstreamError, classify_response, parse_retry_after)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_classify_response(self):
+        self.assertIsInstance(classify_response(FakeResponse(429), [200]), ThrottledError)
+        self.assertIsInstance(classify_response(FakeResponse(503, {'Retry-After': '5'}), [200]), ThrottledError)
+        self.assertIsInstance(classify_response(FakeResponse(503), [200]), UpstreamError)
+        self.assertIsInstance(classify_response(FakeResponse(404), [200]), ClientError)
+        self.assertFalse(classify_response(FakeResponse(404), [200]).retryable)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('3'), 3.0)
+        self.assertEqual(parse_retry_after('-5'), 0.0)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertEqual(parse_retry_after('inf'), MAX_RETRY_AFTER)
+        self.assertEqual(parse_retry_after('86400'), MAX_RETRY_AFTER)
+        self.assertIsNone(parse_retry_after('nan'))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_should_retry(self):
+        policy = RetryPolicy(max_retries=2, backoff=1.0, max_backoff=10.0)
+        self.assertTrue(policy.should_retry(NetworkError('down'), 0))
+        self.assertFalse(policy.should_retry(NetworkError('down'), 2))
+        self.assertFalse(policy.should_retry(ClientError('bad', 400), 0))
+        self.assertFalse(policy.should_retry(ThrottledError('slow down', 429, retry_after=60), 0))
+
+    def test_get_delay(self):
+        policy = RetryPolicy(max_retries=5, backoff=1.0, max_backoff=8.0)
+        for attempt in range(5):
+            delay = policy.get_delay(UpstreamError('oops', 500), attempt)
+            cap = min(8.0, 2 ** attempt)
+            self.assertTrue(cap / 2 <= delay <= cap)
+        self.assertEqual(policy.get_delay(ThrottledError('slow down', 429, retry_after=7), 0), 7)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05, max_reset_timeout=0.2)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breaker.record_failure(UpstreamError('oops', 500))
+
+    def wait_in_thread(self):
+        passed = threading.Event()
+        thread = threading.Thread(target=lambda: (self.breaker.wait(), passed.set()), daemon=True)
+        thread.start()
+        return passed
+
+    def test_opens_after_threshold(self):
+        self.fail(2)
+        self.assertFalse(self.breaker.is_open)
+        self.fail()
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(self.breaker.opened, 1)
+
+    def test_success_resets_failures(self):
+        self.fail(2)
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertFalse(self.breaker.is_open)
+
+    def test_client_errors_do_not_count(self):
+        for _ in range(5):
+            self.breaker.record_failure(ClientError('bad', 400))
+        self.assertFalse(self.breaker.is_open)
+
+    def test_wait_blocks_while_open(self):
+        self.fail(3)
+        start = time.monotonic()
+        self.breaker.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.fail(3)
+        self.breaker.wait()  # The probe
+        other = self.wait_in_thread()
+        self.assertFalse(other.wait(0.1))
+        self.breaker.record_success()
+        self.assertTrue(other.wait(1))
+        self.assertFalse(self.breaker.is_open)
+        self.assertEqual(self.breaker.reset_timeout, 0.05)
+
+    def test_probe_failure_doubles_timeout(self):
+        self.fail(3)
+        self.breaker.wait()
+        self.fail()
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(self.breaker.reset_timeout, 0.1)
+        self.breaker.wait()
+        self.fail()
+        self.breaker.wait()
+        self.fail()
+        self.assertEqual(self.breaker.reset_timeout, 0.2)  # Capped at max_reset_timeout
+
+    def test_probe_client_error_closes(self):
+        self.fail(3)
+        self.breaker.wait()
+        self.breaker.record_failure(ClientError('bad', 400))
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.wait_in_thread().wait(1))
+
+    def test_abandoned_probe_lets_another_through(self):
+        self.fail(3)
+        self.breaker.wait()
+        other = self.wait_in_thread()
+        self.assertFalse(other.wait(0.1))
+        self.breaker.abandon()
+        self.assertTrue(other.wait(1))
+
+    def test_success_sent_before_opening_does_not_close(self):
+        self.fail(3)
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.is_open)
+
+    def test_retry_after_opens_capped(self):
+        self.breaker.record_failure(ThrottledError('slow down', 429, retry_after=3600))
+        self.assertTrue(self.breaker.is_open)
+        start = time.monotonic()
+        self.breaker.wait()
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
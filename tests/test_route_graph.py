@@ -0,0 +1,141 @@
+""" Tests for the bitmask route queries against plain set operations on a small graph """
+
+from unittest import mock
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from flight_tracker import route_graph
+from flight_tracker.route_graph import RouteGraph, get_route_graph, refresh_route_graph
+
+
+def airport(display_name, federal_unit, *routes_served):
+    return {'display_name': display_name, 'federal_unit': federal_unit, 'routes_served': list(routes_served)}
+
+
+# AUS appears only as a destination
+ROUTES = {'PHL': airport('Philadelphia', 'PA', 'BNA', 'MDW', 'BWI'),
+          'BNA': airport('Nashville', 'TN', 'MDW', 'DEN', 'PHL'),
+          'MDW': airport('Chicago (Midway)', 'IL', 'DEN', 'BNA', 'AUS'),
+          'BWI': airport('Baltimore', 'MD', 'PHL', 'MDW'),
+          'DEN': airport('Denver', 'CO', 'MDW', 'BNA', 'PHL')}
+
+
+def routes_from(code):
+    return set(ROUTES[code]['routes_served']) if code in ROUTES else set()
+
+
+def brute_force_reachable(origin, max_stops):
+    seen = frontier = routes_from(origin)
+    for _ in range(max_stops):
+        frontier = set().union(*[routes_from(x) for x in frontier]) - seen
+        seen = seen | frontier
+    return seen - {origin}
+
+
+class FakeSWApi(object):
+    def __init__(self, route_info):
+        self.route_info = route_info
+
+    def retrieve_flight_routes(self):
+        return json.dumps(self.route_info)
+
+
+class RouteGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = RouteGraph.from_route_dict(ROUTES)
+        self.codes = sorted(set(ROUTES) | {'AUS'})
+
+    def test_lookups(self):
+        self.assertEqual(len(self.graph), 6)
+        self.assertIn('AUS', self.graph)
+        self.assertNotIn('LAX', self.graph)
+        self.assertEqual(self.graph.long_name('MDW'), 'Chicago (Midway), IL')
+        for origin, destination in itertools.product(self.codes, repeat=2):
+            self.assertEqual(self.graph.serves(origin, destination), destination in routes_from(origin))
+        for code in self.codes:
+            self.assertEqual(self.graph.destinations(code), sorted(routes_from(code)))
+            self.assertEqual(self.graph.origins(code), sorted(x for x in ROUTES if code in routes_from(x)))
+
+    def test_reachable(self):
+        for origin in self.codes:
+            for max_stops in range(4):
+                self.assertEqual(self.graph.reachable(origin, max_stops),
+                                 sorted(brute_force_reachable(origin, max_stops)))
+        self.assertEqual(self.graph.reachable('AUS'), [])
+
+    def test_connections(self):
+        for origin, destination in itertools.product(self.codes, repeat=2):
+            one_stop = [x for x in self.codes if x not in (origin, destination)
+                        and x in routes_from(origin) and destination in routes_from(x)]
+            two_stop = [(x, y) for x, y in itertools.permutations(self.codes, 2)
+                        if not {x, y} & {origin, destination}
+                        and x in routes_from(origin) and y in routes_from(x) and destination in routes_from(y)]
+            self.assertEqual(self.graph.one_stop(origin, destination), one_stop)
+            self.assertEqual(sorted(self.graph.two_stop(origin, destination)), two_stop)
+        self.assertEqual(self.graph.one_stop('PHL', 'DEN'), ['BNA', 'MDW'])
+        self.assertIn(('BWI', 'MDW'), self.graph.two_stop('PHL', 'AUS'))
+
+    def test_from_route_info(self):
+        graph = RouteGraph.from_route_info(json.dumps(ROUTES))
+        self.assertEqual(graph.codes, self.graph.codes)
+        self.assertEqual(graph.out_bits, self.graph.out_bits)
+        for bad_route_info in ([], {'PHL': ['BNA']}, {'PHL': {'routes_served': ['BNA']}}):
+            with self.assertRaises(ValueError):
+                RouteGraph.from_route_info(json.dumps(bad_route_info))
+
+
+class RouteGraphFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patcher = mock.patch.multiple(route_graph, _route_graph=None, _route_graph_path=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def save(self, name, routes):
+        path = os.path.join(self.tmp_dir, name)
+        RouteGraph.from_route_dict(routes).save(path)
+        return path
+
+    def test_save_and_load(self):
+        graph = RouteGraph.from_route_dict(ROUTES)
+        loaded = RouteGraph.load(self.save('routes.json', ROUTES))
+        self.assertEqual((loaded.codes, loaded.display_names, loaded.federal_units, loaded.out_bits, loaded.in_bits),
+                         (graph.codes, graph.display_names, graph.federal_units, graph.out_bits, graph.in_bits))
+        bad_path = os.path.join(self.tmp_dir, 'old.json')
+        with open(bad_path, 'w') as bad_file:
+            json.dump({'version': 0}, bad_file)
+        with self.assertRaises(ValueError):
+            RouteGraph.load(bad_path)
+
+    def test_reloads_when_a_different_file_is_requested(self):
+        first_path = self.save('first.json', ROUTES)
+        second_path = self.save('second.json', {'PHL': airport('Philadelphia', 'PA', 'LAX')})
+        first = get_route_graph(first_path)
+        self.assertTrue(first.serves('PHL', 'BNA'))
+        self.assertIs(get_route_graph(first_path), first)
+        self.assertIs(get_route_graph(), first)  # No path keeps the current graph
+        second = get_route_graph(second_path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.destinations('PHL'), ['LAX'])
+        self.assertEqual(get_route_graph(first_path).destinations('PHL'), ['BNA', 'BWI', 'MDW'])
+
+    def test_refresh_saves_and_replaces_graph(self):
+        path = os.path.join(self.tmp_dir, 'refreshed.json')
+        graph = refresh_route_graph(FakeSWApi(ROUTES), path)
+        self.assertIs(get_route_graph(), graph)
+        self.assertIs(get_route_graph(path), graph)  # Already loaded from path
+        self.assertEqual(RouteGraph.load(path).out_bits, graph.out_bits)
+        with self.assertRaises(ValueError):
+            refresh_route_graph(FakeSWApi({'airports': []}), path)
+        self.assertIs(get_route_graph(), graph)
+
+
+if __name__ == '__main__':
+    unittest.main()
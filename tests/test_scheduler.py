@@ -0,0 +1,109 @@
+""" Tests for the adaptive search intervals and the request budget """
+
+from datetime import datetime, timedelta
+import unittest
+import time
+
+from flight_tracker.concurrency import TaskResult
+from flight_tracker.scheduler import SearchScheduler
+from flight_tracker.flight_records import FlightSearch
+
+HOUR = 3600
+NOW = time.mktime(datetime(2030, 1, 1).timetuple())
+
+
+class FakeTrip(object):
+    def __init__(self, price):
+        self.price = price
+
+
+def days_after(start, days, destination='BNA', price_point=0):
+    depart_date = (start + timedelta(days=days)).strftime('%Y-%m-%d')
+    return FlightSearch('PHL', destination, depart_date, price_point=price_point)
+
+
+def days_out(days, destination='BNA', price_point=0):
+    """ Search departing days after NOW """
+    return days_after(datetime(2030, 1, 1), days, destination, price_point)
+
+
+def days_from_now(days):
+    return days_after(datetime.now(), days)
+
+
+class IntervalTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = SearchScheduler([], base_interval=3 * HOUR, min_interval=600, max_interval=24 * HOUR)
+
+    def interval(self, flight_search):
+        return self.scheduler.get_interval(flight_search, NOW) / HOUR
+
+    def test_days_to_departure(self):
+        self.assertAlmostEqual(self.interval(days_out(30)), 3.0)
+        self.assertAlmostEqual(self.interval(days_out(60)), 6.0)
+        self.assertAlmostEqual(self.interval(days_out(15)), 1.5)
+        self.assertAlmostEqual(self.interval(days_out(3)), 0.75)  # 0.25x the week of
+        self.assertAlmostEqual(self.interval(days_out(365)), 12.0)  # 4x far out
+
+    def test_volatility_and_price_point(self):
+        flight_search = days_out(30, price_point=100)
+        self.scheduler.add(flight_search)
+        self.scheduler.record_results([TaskResult(0, flight_search, FakeTrip(100), None)], NOW)
+        self.assertAlmostEqual(self.interval(flight_search), 3.0)
+        self.scheduler.record_results([TaskResult(0, flight_search, FakeTrip(200), None)], NOW)
+        # Volatile prices are checked sooner, prices far above the price point later
+        volatile = 3.0 / (1 + 10 * (50 / 150.0)) * 3.0
+        self.assertAlmostEqual(self.interval(flight_search), volatile)
+
+    def test_clamped(self):
+        scheduler = SearchScheduler([], base_interval=600, min_interval=600, max_interval=HOUR)
+        self.assertEqual(scheduler.get_interval(days_out(1), NOW), 600)
+        scheduler = SearchScheduler([], base_interval=24 * HOUR, min_interval=600, max_interval=HOUR)
+        self.assertEqual(scheduler.get_interval(days_out(365), NOW), HOUR)
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_departed_searches_are_dropped(self):
+        departed = days_from_now(-2)
+        upcoming = days_from_now(30)
+        scheduler = SearchScheduler([departed, upcoming])
+        self.assertEqual([x for _, x in scheduler.iter_scheduled()], [upcoming])
+        self.assertTrue(scheduler.has_departed(departed))
+        self.assertFalse(scheduler.has_departed(days_from_now(0)))
+
+        # A search departing while it is scheduled is not rescheduled
+        tomorrow = days_from_now(1)
+        scheduler.add(tomorrow)
+        due = scheduler.pop_due()
+        scheduler.record_results([TaskResult(idx, x, None, None) for idx, x in enumerate(due)],
+                                 now=time.time() + 3 * 86400)
+        self.assertEqual([x for _, x in scheduler.iter_scheduled()], [upcoming])
+
+    def test_budget_caps_requests_per_hour(self):
+        searches = [days_out(30, destination='D{:02d}'.format(x)) for x in range(40)]
+        searches.append(days_out(30, destination='D00', price_point=50))  # Shares a request
+        scheduler = SearchScheduler(searches, base_interval=HOUR, budget_per_hour=10)
+        due = scheduler.pop_due(time.time() + 10 * HOUR)
+        scheduler.record_results([TaskResult(idx, x, None, None) for idx, x in enumerate(due)], NOW)
+        self.assertEqual(len(scheduler), 41)
+        self.assertAlmostEqual(scheduler.budget_scale, 4.0)
+        self.assertAlmostEqual(scheduler.requests_per_hour, 10.0)
+
+    def test_first_checks_are_spread_over_the_budget(self):
+        searches = [days_out(30, destination='D{:02d}'.format(x)) for x in range(4)]
+        scheduler = SearchScheduler(searches, budget_per_hour=60)
+        next_checks = sorted(x for x, _ in scheduler.iter_scheduled())
+        gaps = [b - a for a, b in zip(next_checks, next_checks[1:])]
+        for gap in gaps:
+            self.assertAlmostEqual(gap, 60, places=3)
+
+    def test_no_budget(self):
+        searches = [days_out(30, destination='D{:02d}'.format(x)) for x in range(10)]
+        scheduler = SearchScheduler(searches, base_interval=HOUR)
+        scheduler.record_results([TaskResult(idx, x, None, None) for idx, x in enumerate(scheduler.pop_due())], NOW)
+        self.assertEqual(scheduler.budget_scale, 1.0)
+        self.assertAlmostEqual(scheduler.requests_per_hour, 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+""" Tests for loading and incrementally reloading watchlists """
+
+import tempfile
+import unittest
+import json
+import os
+
+from flight_tracker.watchlist import Watchlist, create_search_from_row, parse_flight_numbers
+
+HEADER = 'origin\tdestination\tdepart_date\tprice_point\n'
+
+
+class WatchlistTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'watchlist.txt')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, text, path=None):
+        with open(path or self.path, 'w') as watchlist_file:
+            watchlist_file.write(text)
+
+    def test_load_skips_bad_rows(self):
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t150\n'
+                            '# comment\n'
+                            'PHL\tBNA\tnot a date\t150\n'
+                            'PHL\tBNA\n'
+                            'PHL\tMDW\t7/13/27\t90\n')
+        watchlist = Watchlist(self.path)
+        diff = watchlist.reload()
+        self.assertEqual(len(watchlist), 2)
+        self.assertEqual(len(diff.added), 2)
+        self.assertEqual([x.line for x in diff.bad_rows], [4, 5])
+
+    def test_reload_diff(self):
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t150\nPHL\tMDW\t7/13/27\t90\nPHL\tLAS\t7/14/27\t200\n')
+        watchlist = Watchlist(self.path)
+        watchlist.reload()
+        kept = watchlist.searches[1]
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t120\nPHL\tMDW\t7/13/27\t90\nPHL\tDEN\t7/15/27\t80\n')
+        diff = watchlist.reload()
+        self.assertEqual(sorted((x.destination, x.price_point) for x in diff.added), [('BNA', 120), ('DEN', 80)])
+        self.assertEqual(sorted((x.destination, x.price_point) for x in diff.removed), [('BNA', 150), ('LAS', 200)])
+        self.assertIs(watchlist.searches[1], kept)  # Unchanged rows keep their FlightSearch
+        self.assertEqual(watchlist.reload(), ([], [], []))
+
+    def test_header_change_reparses_rows(self):
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t150\n')
+        watchlist = Watchlist(self.path)
+        watchlist.reload()
+        self.write('destination\torigin\tdepart_date\tprice_point\nPHL\tBNA\t7/12/27\t150\n')
+        diff = watchlist.reload()
+        self.assertEqual([(x.origin, x.destination) for x in diff.added], [('BNA', 'PHL')])
+        self.assertEqual(len(diff.removed), 1)
+
+    def test_jsonl_bad_rows_do_not_abort(self):
+        path = os.path.join(self.tmp_dir.name, 'watchlist.jsonl')
+        rows = [{'origin': 'PHL', 'destination': 'BNA', 'depart_date': '7/12/27', 'flight_numbers': [1, 2]},
+                {'origin': 'PHL', 'destination': 'BNA', 'depart_date': '7/12/27', 'depart_after': '99:99'},
+                {'origin': 'PHL', 'destination': 'BNA', 'depart_date': '7/12/27', 'passengers': {'a': 1}},
+                [1, 2]]
+        self.write('\n'.join(json.dumps(x) for x in rows) + '\nnot json\n', path)
+        watchlist = Watchlist(path)
+        diff = watchlist.reload()
+        self.assertEqual([x.flight_numbers for x in diff.added], [[[1], [2]]])
+        self.assertEqual([x.line for x in diff.bad_rows], [2, 3, 4, 5])
+
+    def test_poll_waits_for_stable_file(self):
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t150\n')
+        watchlist = Watchlist(self.path)
+        watchlist.reload()
+        self.assertIsNone(watchlist.poll())
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t150\nPHL\tMDW\t7/13/27\t90\n')
+        self.assertIsNone(watchlist.poll())  # Changed since the last poll; may still be being written
+        self.assertEqual(len(watchlist.poll().added), 1)
+        self.assertIsNone(watchlist.poll())
+
+    def test_poll_survives_deleted_file(self):
+        self.write(HEADER + 'PHL\tBNA\t7/12/27\t150\n')
+        watchlist = Watchlist(self.path)
+        watchlist.reload()
+        os.remove(self.path)
+        self.assertIsNone(watchlist.poll())
+        self.assertIsNone(watchlist.poll())
+        self.assertEqual(len(watchlist), 1)
+
+
+class RowTest(unittest.TestCase):
+    def test_parse_flight_numbers(self):
+        self.assertEqual(parse_flight_numbers('2506,2568 874'), [[2506, 2568], [874]])
+        self.assertEqual(parse_flight_numbers([[2506, 2568], '874']), [[2506, 2568], [874]])
+        self.assertEqual(parse_flight_numbers([1, 2]), [[1], [2]])
+        self.assertIsNone(parse_flight_numbers(''))
+
+    def test_times_are_validated(self):
+        row = {'origin': 'phl', 'destination': 'bna', 'depart_date': '7/12/27', 'depart_after': '7:05'}
+        self.assertEqual(create_search_from_row(row, {}).depart_after, '07:05')
+        for value in ('99:99', '24:00', '7pm'):
+            with self.assertRaises(ValueError):
+                create_search_from_row(dict(row, depart_after=value), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+""" Tests for the local flight filters applied by find_cheapest_flights """
+
+import unittest
+
+from flight_tracker.flight_records import FlightSearch
+from flight_tracker.web_scraper import FlightFilter, find_cheapest_flights
+
+from .fixtures import make_flight, make_response
+
+
+OUTBOUND = [make_flight('PHL', 'BNA', '2030-07-12T06:00', '2030-07-12T08:00', [101], {'WGA': 100}),
+            make_flight('PHL', 'BNA', '2030-07-12T10:00', '2030-07-12T12:00', [102], {'WGA': 150, 'ANY': 300}),
+            make_flight('PHL', 'BNA', '2030-07-12T19:00', '2030-07-12T23:00', [103, 104], {'WGA': 120})]
+INBOUND = [make_flight('BNA', 'PHL', '2030-07-15T07:00', '2030-07-15T09:00', [201], {'WGA': 80}),
+           make_flight('BNA', 'PHL', '2030-07-15T18:00', '2030-07-15T20:00', [202], {'WGA': None, 'ANY': 90})]
+DATA = make_response(OUTBOUND, INBOUND)
+
+
+def round_trip(**kwargs):
+    return FlightSearch('PHL', 'BNA', '2030-07-12', return_date='2030-07-15', faretype='USD', **kwargs)
+
+
+def describe(trip_record):
+    return [(x.origin, x.flight_numbers, x.price) for x in trip_record] if trip_record else None
+
+
+class FindCheapestFlightsTest(unittest.TestCase):
+    def test_cheapest_round_trip(self):
+        trip_record = find_cheapest_flights(round_trip(), data=DATA)
+        self.assertEqual(describe(trip_record), [('PHL', [101], 100), ('BNA', [201], 80)])
+        self.assertEqual(trip_record.price, 180)
+
+    def test_depart_window_only_applies_to_outbound(self):
+        trip_record = find_cheapest_flights(round_trip(depart_after='09:00', depart_before='18:00'), data=DATA)
+        self.assertEqual(describe(trip_record), [('PHL', [102], 150), ('BNA', [201], 80)])
+
+    def test_max_price_is_the_trip_total(self):
+        self.assertEqual(find_cheapest_flights(round_trip(passengers=2, max_price=360), data=DATA).price, 360)
+        # Each leg is under the limit but the trip is not
+        self.assertIsNone(find_cheapest_flights(round_trip(passengers=2, max_price=359), data=DATA))
+        # A companion flies free
+        self.assertEqual(find_cheapest_flights(round_trip(companion=True, max_price=180), data=DATA).price, 180)
+
+    def test_max_price_zero(self):
+        one_way = FlightSearch('PHL', 'BNA', '2030-07-12', faretype='USD', max_price=0)
+        self.assertIsNone(find_cheapest_flights(one_way, data=make_response(OUTBOUND)))
+
+    def test_nonstop_and_flight_numbers(self):
+        one_way = FlightSearch('PHL', 'BNA', '2030-07-12', faretype='USD', nonstop=True, depart_after='18:00')
+        self.assertIsNone(find_cheapest_flights(one_way, data=make_response(OUTBOUND)))
+        one_way = FlightSearch('PHL', 'BNA', '2030-07-12', faretype='USD', flight_numbers=[[103, 104]])
+        self.assertEqual(describe(find_cheapest_flights(one_way, data=make_response(OUTBOUND))),
+                         [('PHL', [103, 104], 120)])
+
+
+class FlightFilterTest(unittest.TestCase):
+    def test_accepts_price(self):
+        flight_filter = FlightFilter(max_price=300, passengers=2)
+        self.assertTrue(flight_filter.accepts_price(150))
+        self.assertFalse(flight_filter.accepts_price(150.01))
+        self.assertTrue(FlightFilter().accepts_price(10 ** 6))
+
+    def test_time_window_without_origin_checks_every_flight(self):
+        flight_filter = FlightFilter(depart_after='09:00')
+        self.assertFalse(flight_filter.accepts_flight(INBOUND[0]))
+        self.assertTrue(FlightFilter(depart_after='09:00', origin='PHL').accepts_flight(INBOUND[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()